@@ -1,35 +1,43 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from methods import (
-    get_db_connection,
     authenticate_user, register_user, verify_user, resend_verification, reset_password_request, send_verification_otp, verify_otp,
     reset_password_complete, get_user_profile, update_user_profile,
     get_appointments, create_appointment, get_appointment_details, update_appointment,
-    cancel_appointment, get_available_slots,
+    cancel_appointment, get_available_slots, get_available_slots_range,
     get_services, get_service_details, get_service_categories,
     get_payments, create_payment, get_payment_details, handle_payment_webhook,
     get_invoices, get_invoice_details, pay_invoice,
     get_notifications, mark_notification_read, update_notification_preferences,
-    get_calendar_events, create_calendar_event, update_calendar_event,
+    get_calendar_events, get_teams_calendar_events, create_calendar_event, update_calendar_event,
     delete_calendar_event, sync_external_calendar,
-    get_knowledge_base, get_knowledge_article, 
+    get_knowledge_base, get_knowledge_article, search_knowledge_base,
     google_auth, complete_google_registration,
-    submit_tax_form, save_tax_form_progress, load_tax_form_progress, get_tax_form_templates
+    submit_tax_form, save_tax_form_progress, load_tax_form_progress, get_tax_form_templates,
+    create_tax_form_upload, upload_tax_form_chunk, get_tax_form_upload, complete_tax_form_upload
 
 )
 import uuid
 
-from firebase_setup  import verify_firebase_token
-from microsoft_teams import MicrosoftTeamsIntegration
-from config import app_config
+from firebase_setup  import verify_firebase_token, initialize_firebase, token_verifier as firebase_verifier
+from db import pool as db_pool, db_session, DatabaseConnectionError
+from passwords import password_hasher, PasswordHasherBusy
+from captcha import captcha_verifier, captcha_error_message, CaptchaUnavailable, CaptchaConfigurationError
+from email_outbox import outbox_worker
+from availability import availability_index
+from catalog import service_catalog
+from knowledge_search import knowledge_index
+from meetings import meeting_provisioner
+from resumable_uploads import upload_sweeper
+from progress_patches import progress_log
+from microsoft_teams import teams_client
+from config import app_config, email_config, upload_config
 import utils
 import logging 
-import datetime
 import json
-from utils import validate_token
+from auth import load_request_user, current_user_id, current_user_email, current_user_role
 import os 
-import requests
-from utils import send_email, generate_token, validate_token, get_user_id_from_token
+from utils import send_email, generate_token
 
 logging.basicConfig(
     level=logging.INFO,
@@ -45,15 +53,61 @@ app = Flask(__name__)
 app.config.from_object(app_config)
 CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
 
+# Decode the bearer token once per request; handlers read the claims from flask.g
+app.before_request(load_request_user)
+
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 TAX_FORM_UPLOADS = os.path.join(UPLOAD_FOLDER, 'tax_forms')
 os.makedirs(TAX_FORM_UPLOADS, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['TAX_FORM_UPLOADS'] = TAX_FORM_UPLOADS
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
-
-# Initialize Microsoft Teams integration
-teams_integration = MicrosoftTeamsIntegration()
+app.config['MAX_CONTENT_LENGTH'] = upload_config.MAX_CONTENT_LENGTH  # tax form uploads raise this per request
+
+# Initialize Firebase once per worker instead of on the first Google sign-in
+initialize_firebase()
+
+# Deliver queued emails in the background
+if email_config.EMAIL_ENABLED:
+    outbox_worker.start()
+
+# Provision Teams meetings for new appointments in the background
+meeting_provisioner.start()
+
+# Clean up abandoned resumable uploads
+upload_sweeper.start()
+
+@app.errorhandler(DatabaseConnectionError)
+def handle_database_connection_error(e):
+    return jsonify({"error": "Database connection error"}), 500
+
+@app.errorhandler(PasswordHasherBusy)
+def handle_password_hasher_busy(e):
+    response = jsonify({"error": "Server is busy, please try again shortly"})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+@app.errorhandler(CaptchaUnavailable)
+def handle_captcha_unavailable(e):
+    response = jsonify({"error": "CAPTCHA verification is temporarily unavailable. Please try again."})
+    response.headers['Retry-After'] = str(captcha_verifier.breaker_cooldown)
+    return response, 503
+
+@app.errorhandler(CaptchaConfigurationError)
+def handle_captcha_configuration_error(e):
+    logger.error(str(e))
+    return jsonify({"error": "Server configuration error"}), 500
+
+def check_captcha(captcha_token):
+    """Verify a CAPTCHA token, returning an error response or None if it passed"""
+    captcha_result = captcha_verifier.verify(
+        captcha_token,
+        remote_ip=request.headers.get('X-Forwarded-For')
+    )
+    if not captcha_result['success']:
+        error_codes = captcha_result['error-codes']
+        logger.error(f"CAPTCHA validation failed: {error_codes}")
+        return jsonify({"error": captcha_error_message(error_codes)}), 400
+    return None
 
 # New CAPTCHA validation endpoint
 @app.route('/api/validate-captcha', methods=['POST'])
@@ -64,44 +118,24 @@ def validate_captcha():
         if not data or not data.get('token'):
             return jsonify({"error": "Missing CAPTCHA token"}), 400
         
-        # Get the Google reCAPTCHA secret key
-        secret_key = app_config.RECAPTCHA_SECRET_KEY
-
-        if not secret_key:
-            logger.error("Google reCAPTCHA secret key not configured")
-            return jsonify({"error": "Server configuration error"}), 500
-        
-        # Prepare request data for Google
-        form_data = {
-            'secret': secret_key,
-            'response': data.get('token')
-        }
-        
-        # Get client IP if available
-        if request.headers.get('X-Forwarded-For'):
-            form_data['remoteip'] = request.headers.get('X-Forwarded-For')
-        
-        logger.info(f"CAPTCHA validation request: {form_data}")
-        
-        # Validate with Google
-        response = requests.post(
-            'https://www.google.com/recaptcha/api/siteverify',
-            data=form_data,
-            timeout=10
+        # Peek only: the result is remembered so login/register can redeem the same token
+        captcha_result = captcha_verifier.verify(
+            data.get('token'),
+            remote_ip=request.headers.get('X-Forwarded-For'),
+            consume=False
         )
         
-        captcha_response = response.json()
-        logger.info(f"CAPTCHA validation response: {captcha_response}")
-        
-        if captcha_response.get('success') == True:
+        if captcha_result['success']:
             return jsonify({"success": True}), 200
         else:
             return jsonify({
                 "success": False,
                 "error": "CAPTCHA validation failed",
-                "error_codes": captcha_response.get('error-codes', [])
+                "error_codes": captcha_result['error-codes']
             }), 400
             
+    except (CaptchaUnavailable, CaptchaConfigurationError):
+        raise
     except Exception as e:
         logger.error(f"CAPTCHA validation error: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -113,52 +147,9 @@ def login():
     # Validate CAPTCHA if token is provided
     captcha_token = data.pop('captchaToken', None)
     if captcha_token and app_config.REQUIRE_CAPTCHA:
-        # Get the Google reCAPTCHA secret key
-        secret_key = app_config.RECAPTCHA_SECRET_KEY
-
-        if not secret_key:
-            logger.error("Google reCAPTCHA secret key not configured")
-            return jsonify({"error": "Server configuration error"}), 500
-            
-        # Prepare request data for Google
-        captcha_data = {
-            'secret': secret_key,
-            'response': captcha_token
-        }
-        
-        # Get client IP if available
-        if request.headers.get('X-Forwarded-For'):
-            captcha_data['remoteip'] = request.headers.get('X-Forwarded-For')
-        
-        logger.info(f"Login CAPTCHA validation request: {captcha_data}")
-        
-        # Validate with Google
-        captcha_response = requests.post(
-            'https://www.google.com/recaptcha/api/siteverify',
-            data=captcha_data,
-            timeout=10
-        )
-        
-        captcha_result = captcha_response.json()
-        logger.info(f"CAPTCHA validation response for login: {captcha_result}")
-        
-        if not captcha_result.get('success'):
-            # return jsonify({
-            #     "error": "CAPTCHA validation failed. Please try again."
-            # }), 400
-            error_codes = captcha_result.get('error-codes', [])
-            error_message = "CAPTCHA validation failed. Please try again."
-            
-            # Provide more specific error messages based on error codes
-            if 'timeout-or-duplicate' in error_codes:
-                error_message = "CAPTCHA token has expired. Please refresh the page and try again."
-            elif 'invalid-input-response' in error_codes:
-                error_message = "Invalid CAPTCHA response. Please try again."
-            elif 'missing-input-response' in error_codes:
-                error_message = "CAPTCHA response is missing. Please complete the CAPTCHA."
-            
-            logger.error(f"CAPTCHA validation failed: {error_codes}")
-            return jsonify({"error": error_message}), 400
+        captcha_error = check_captcha(captcha_token)
+        if captcha_error:
+            return captcha_error
 
     return authenticate_user(data)
 
@@ -174,53 +165,10 @@ def register():
     # Validate CAPTCHA if token is provided
     captcha_token = data.pop('captchaToken', None)
     if captcha_token and app_config.REQUIRE_CAPTCHA:
-        # Get the Google reCAPTCHA secret key
-        secret_key = app_config.RECAPTCHA_SECRET_KEY
+        captcha_error = check_captcha(captcha_token)
+        if captcha_error:
+            return captcha_error
 
-        if not secret_key:
-            logger.error("Google reCAPTCHA secret key not configured")
-            return jsonify({"error": "Server configuration error"}), 500
-            
-        # Prepare request data for Google
-        captcha_data = {
-            'secret': secret_key,
-            'response': captcha_token
-        }
-        
-        # Get client IP if available
-        if request.headers.get('X-Forwarded-For'):
-            captcha_data['remoteip'] = request.headers.get('X-Forwarded-For')
-        
-        logger.info(f"Registration CAPTCHA validation request: {captcha_data}")
-        
-        # Validate with Google
-        captcha_response = requests.post(
-            'https://www.google.com/recaptcha/api/siteverify',
-            data=captcha_data,
-            timeout=10
-        )
-        
-        captcha_result = captcha_response.json()
-        logger.info(f"CAPTCHA validation response for registration: {captcha_result}")
-        
-        if not captcha_result.get('success'):
-            # return jsonify({
-            #     "error": "CAPTCHA validation failed. Please try again."
-            # }), 400
-            error_codes = captcha_result.get('error-codes', [])
-            error_message = "CAPTCHA validation failed. Please try again."
-            
-            # Provide more specific error messages based on error codes
-            if 'timeout-or-duplicate' in error_codes:
-                error_message = "CAPTCHA token has expired. Please refresh the page and try again."
-            elif 'invalid-input-response' in error_codes:
-                error_message = "Invalid CAPTCHA response. Please try again."
-            elif 'missing-input-response' in error_codes:
-                error_message = "CAPTCHA response is missing. Please complete the CAPTCHA."
-            
-            logger.error(f"CAPTCHA validation failed: {error_codes}")
-            return jsonify({"error": error_message}), 400
-    
     return register_user(data)
 
 @app.route('/api/auth/refresh-token', methods=['POST'])
@@ -231,21 +179,15 @@ def refresh_token():
             return jsonify({"error": "Missing or invalid token"}), 401
         
         token = token.replace('Bearer ', '')
-        user_id = validate_token(token)
+        user_id = current_user_id(token)
         
         if not user_id:
             return jsonify({"error": "Invalid or expired token"}), 401
         
         # Get user info for the new token
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
-        
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id, email, role FROM users WHERE id = %s", (user_id,))
-        user = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        with db_session() as cursor:
+            cursor.execute("SELECT id, email, role FROM users WHERE id = %s", (user_id,))
+            user = cursor.fetchone()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
@@ -284,44 +226,16 @@ def complete_google_reg_route():
         if not data or not data.get('firebase_uid') or not data.get('firebase_token'):
             return jsonify({"error": "Missing required fields"}), 400
         
-         # Validate CAPTCHA if token is provided
+        # Validate CAPTCHA if token is provided
         captcha_token = data.pop('captchaToken', None)
         if captcha_token and app_config.REQUIRE_CAPTCHA:
-                        # Get the Google reCAPTCHA secret key
-            secret_key = app_config.RECAPTCHA_SECRET_KEY
-            
-            if not secret_key:
-                logger.error("Google reCAPTCHA secret key not configured")
-                return jsonify({"error": "Server configuration error"}), 500
-                
-            # Prepare request data for Google
-            captcha_data = {
-                'secret': secret_key,
-                'response': captcha_token
-            }
-            
-            # Get client IP if available
-            if request.headers.get('X-Forwarded-For'):
-                captcha_data['remoteip'] = request.headers.get('X-Forwarded-For')
-            
-            logger.info(f"CAPTCHA validation request for Google registration: {captcha_data}")
-            
-            # Validate with Google
-            captcha_response = requests.post(
-                'https://www.google.com/recaptcha/api/siteverify',
-                data=captcha_data,
-                timeout=10
-            )
-            
-            captcha_result = captcha_response.json()
-            logger.info(f"CAPTCHA validation response for Google registration: {captcha_result}")
-            
-            if not captcha_result.get('success'):
-                return jsonify({
-                    "error": "CAPTCHA validation failed. Please try again."
-                }), 400
+            captcha_error = check_captcha(captcha_token)
+            if captcha_error:
+                return captcha_error
         
         return complete_google_registration(data)
+    except (CaptchaUnavailable, CaptchaConfigurationError, PasswordHasherBusy):
+        raise
     except Exception as e:
         logger.error(f"Google complete registration error: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -454,6 +368,13 @@ def available_slots():
     service_id = request.args.get('service_id')
     return get_available_slots(date, service_id)
 
+@app.route('/api/appointments/available/range', methods=['GET'])
+def available_slots_range():
+    start_date = request.args.get('start')
+    end_date = request.args.get('end')
+    service_id = request.args.get('service_id')
+    return get_available_slots_range(start_date, end_date, service_id)
+
 # @app.route('/api/appointments/<int:id>/confirm', methods=['POST'])
 # def confirm_booking(id):
 #     token = request.headers.get('Authorization')
@@ -551,7 +472,7 @@ def create_teams_meeting():
     token = request.headers.get('Authorization')
     data = request.get_json()
     
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
@@ -564,26 +485,18 @@ def create_teams_meeting():
     if not subject or not start_time or not end_time:
         return jsonify({"error": "Subject, start time, and end time are required"}), 400
     
-    # Get user email
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
+    # Get user email from the token claims
+    user_email = current_user_email(token)
     
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT email FROM users WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    
-    if not user:
+    if not user_email:
         return jsonify({"error": "User not found"}), 404
     
     # Add user's email to attendees if not already included
-    if user['email'] not in attendees:
-        attendees.append(user['email'])
+    if user_email not in attendees:
+        attendees.append(user_email)
     
     # Create Teams meeting
-    meeting = teams_integration.create_meeting(
+    meeting = teams_client.create_meeting(
         subject=subject,
         start_time=start_time,
         end_time=end_time,
@@ -599,56 +512,7 @@ def create_teams_meeting():
 @app.route('/api/calendar/events/teams', methods=['GET'])
 def calendar_events_with_teams():
     token = request.headers.get('Authorization')
-    user_id = validate_token(token)
-    if not user_id:
-        return jsonify({"error": "Unauthorized"}), 401
-    
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Get appointments with Teams meeting links
-    cursor.execute(
-        """
-        SELECT a.*, s.name as service_name, s.duration 
-        FROM appointments a
-        JOIN services s ON a.service_id = s.id
-        WHERE a.user_id = %s AND a.notes LIKE '%Microsoft Teams Meeting%'
-        ORDER BY a.appointment_date, a.appointment_time
-        """,
-        (user_id,)
-    )
-    
-    appointments = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    
-    # Extract Teams meeting links from notes
-    events = []
-    for appointment in appointments:
-        notes = appointment.get('notes', '')
-        teams_url = None
-        
-        # Extract Teams URL from notes
-        if 'Microsoft Teams Meeting:' in notes:
-            teams_url = notes.split('Microsoft Teams Meeting:')[1].strip().split('\n')[0].strip()
-        
-        events.append({
-            'id': appointment['id'],
-            'title': f"{appointment['service_name']} Appointment",
-            'date': appointment['appointment_date'].strftime('%Y-%m-%d'),
-            'start_time': appointment['appointment_time'].strftime('%H:%M'),
-            'end_time': (datetime.datetime.combine(
-                appointment['appointment_date'],
-                datetime.datetime.strptime(appointment['appointment_time'].strftime('%H:%M'), '%H:%M').time()
-            ) + datetime.timedelta(minutes=appointment['duration'])).strftime('%H:%M'),
-            'teams_url': teams_url
-        })
-    
-    return jsonify({"events": events}), 200
-
+    return get_teams_calendar_events(token)
 
 @app.route('/api/calendar/events', methods=['GET'])
 def calendar_events_list():
@@ -680,7 +544,16 @@ def calendar_sync():
 # Content Management Endpoints
 @app.route('/api/content/knowledge-base', methods=['GET'])
 def knowledge_base_list():
-    return get_knowledge_base()
+    return get_knowledge_base(request.args.get('view'), request.args.get('cursor'), request.args.get('limit'))
+
+@app.route('/api/content/knowledge-base/search', methods=['GET'])
+def knowledge_base_search():
+    return search_knowledge_base(
+        request.args.get('q'),
+        request.args.get('page'),
+        request.args.get('per_page'),
+        request.args.get('category')
+    )
 
 @app.route('/api/content/knowledge-base/<int:id>', methods=['GET'])
 def knowledge_article_details(id):
@@ -701,55 +574,11 @@ def tax_form_submit():
     try:
         # Get token from authorization header (if available)
         token = request.headers.get('Authorization')
-        logger.info(f"Tax form submission received with files: {request.files}")
-
-        # Use request.form.to_dict() to get all form data as a dictionary
-        data = request.form.to_dict()
-
-        # Parse engagement letters if present
-        if "itrEngagementLetter" in data:
-            try:
-                data["itrEngagementLetter"] = json.loads(data["itrEngagementLetter"]) if data["itrEngagementLetter"] else {}
-            except Exception:
-                data["itrEngagementLetter"] = {}
-        if "engagementLetter" in data:
-            try:
-                data["engagementLetter"] = json.loads(data["engagementLetter"]) if data["engagementLetter"] else {}
-            except Exception:
-                data["engagementLetter"] = {}
-        if not data.get("itrEngagementLetter"):
-            data["itrEngagementLetter"] = {}
-        # Now save `data` as-is, including empty fields
-        # (You may want to pass `data` to your DB or further processing here)
-        # For now, just log it for debugging
-        logger.info(f"Parsed form data: {data}")
-
-        # Log all files received
-        for file_key in request.files:
-            file = request.files[file_key]
-            logger.info(f"File received: {file_key}, filename: {file.filename}")
-            # Get form type for this file
-            file_form_type = data.get(f"{file_key}_formType", data.get('formType', 'individual'))
-            logger.info(f"File form type: {file_form_type}")
-
-        if 'formType' not in data:
-            return jsonify({"error": "Missing form type"}), 400
-
-        logger.info(f"Received form type: {data.get('formType')}")
+        logger.info(f"Tax form submission received: {request.content_type}, {request.content_length} bytes")
 
-        # Payment logic (optional, as in original)
-        selected_plan = data.get('selectedPlan')
-        selected_addons = data.get('selectedAddOns', [])
-        total_amount = data.get('totalAmount')
-
-        if selected_plan:
-            logger.info(f"Processing payment - Plan: {selected_plan}, Add-ons: {selected_addons}, Total: {total_amount}")
-            data['paymentStatus'] = 'pending'
-            data['paymentDetails'] = {
-                'plan': selected_plan,
-                'addons': selected_addons,
-                'amount': total_amount
-            }
+        # The body is streamed to disk, so this route can take more than the app-wide limit.
+        # Don't touch request.form/files here: that would buffer and parse the whole body.
+        request.max_content_length = upload_config.MAX_UPLOAD_SIZE
 
         # Submit tax form data and files
         return submit_tax_form(token, request)
@@ -757,6 +586,29 @@ def tax_form_submit():
         logger.error(f"Tax form submission error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Resumable uploads: open a session, PUT chunks, check progress, then complete
+@app.route('/api/tax-solutions/uploads', methods=['POST'])
+def tax_form_upload_create():
+    token = request.headers.get('Authorization')
+    return create_tax_form_upload(token, request.get_json(silent=True))
+
+@app.route('/api/tax-solutions/uploads/<upload_id>', methods=['PUT'])
+def tax_form_upload_chunk(upload_id):
+    token = request.headers.get('Authorization')
+    # A chunk request only ever carries one chunk
+    request.max_content_length = upload_config.RESUMABLE_CHUNK_SIZE
+    return upload_tax_form_chunk(token, upload_id, request.args.get('offset'), request)
+
+@app.route('/api/tax-solutions/uploads/<upload_id>', methods=['GET'])
+def tax_form_upload_status(upload_id):
+    token = request.headers.get('Authorization')
+    return get_tax_form_upload(token, upload_id)
+
+@app.route('/api/tax-solutions/uploads/<upload_id>/complete', methods=['POST'])
+def tax_form_upload_complete(upload_id):
+    token = request.headers.get('Authorization')
+    return complete_tax_form_upload(token, upload_id)
+
 @app.route('/api/tax-solutions/complete-payment', methods=['POST'])
 def complete_payment():
     try:
@@ -768,23 +620,16 @@ def complete_payment():
             return jsonify({"error": "Missing required fields"}), 400
             
         # Update form submission with payment status
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
-            
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            UPDATE form_submissions 
-            SET payment_status = %s, 
-                updated_at = NOW() 
-            WHERE id = %s
-            """,
-            (payment_status, form_id)
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_session(dictionary=False) as cursor:
+            cursor.execute(
+                """
+                UPDATE form_submissions 
+                SET payment_status = %s, 
+                    updated_at = NOW() 
+                WHERE id = %s
+                """,
+                (payment_status, form_id)
+            )
         
         return jsonify({
             "success": True,
@@ -801,7 +646,8 @@ def tax_form_save_progress():
         token = request.headers.get('Authorization')
         # Save form progress
         data = request.get_json()
-        if 'formType' not in data:
+        # Autosave patches only carry the changes; full saves must name the form type
+        if 'formType' not in data and 'patch' not in data and 'mergePatch' not in data:
             return jsonify({"error": "Missing form type"}), 400
             
         # Log the form type to verify it's correct
@@ -856,14 +702,7 @@ def save_engagement_letter():
         # Get user ID if authenticated
         user_id = None
         if token:
-            user_id = get_user_id_from_token(token)
-        
-        # Store engagement letter data
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
-            
-        cursor = conn.cursor(dictionary=True)
+            user_id = current_user_id(token)
         
         # Generate a unique ID for the engagement letter
         engagement_id = str(uuid.uuid4())
@@ -871,21 +710,19 @@ def save_engagement_letter():
         # Convert data to JSON string
         engagement_json = json.dumps(data)
         
-        # Insert record into engagement_letters table
-        insert_query = """
-        INSERT INTO engagement_letters 
-        (id, user_id, engagement_data, created_at, updated_at)
-        VALUES (%s, %s, %s, NOW(), NOW())
-        """
-        
-        cursor.execute(
-            insert_query,
-            (engagement_id, user_id, engagement_json)
-        )
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        # Store engagement letter data
+        with db_session() as cursor:
+            # Insert record into engagement_letters table
+            insert_query = """
+            INSERT INTO engagement_letters 
+            (id, user_id, engagement_data, created_at, updated_at)
+            VALUES (%s, %s, %s, NOW(), NOW())
+            """
+            
+            cursor.execute(
+                insert_query,
+                (engagement_id, user_id, engagement_json)
+            )
         
         return jsonify({
             "success": True,
@@ -896,5 +733,31 @@ def save_engagement_letter():
         logger.error(f"Error saving engagement letter: {str(e)}")
         return jsonify({"error": str(e)}), 500
         
+# Operational Endpoints
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    # Internal pool, cache and worker state: admins only
+    token = request.headers.get('Authorization')
+    if not current_user_id(token):
+        return jsonify({"error": "Unauthorized"}), 401
+    if current_user_role(token) != 'admin':
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    return jsonify({
+        "db_pool": db_pool.stats(),
+        "token_cache": utils.token_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "firebase": firebase_verifier.stats() if firebase_verifier else None,
+        "captcha": captcha_verifier.stats(),
+        "email_outbox": outbox_worker.stats(),
+        "availability": availability_index.stats(),
+        "service_catalog": service_catalog.stats(),
+        "knowledge_index": knowledge_index.stats(),
+        "teams_meetings": meeting_provisioner.stats(),
+        "upload_sweeper": upload_sweeper.stats(),
+        "tax_form_progress": progress_log.stats(),
+        "teams_client": teams_client.stats()
+    }), 200
+
 if __name__ == '__main__':
     app.run(debug=app_config.DEBUG, host='0.0.0.0', port=5000)
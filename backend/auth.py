@@ -0,0 +1,107 @@
+from flask import g, request, has_request_context
+import logging
+from utils import get_verified_claims, validate_token
+from db import db_session
+
+logger = logging.getLogger(__name__)
+
+
+def _strip_bearer(token):
+    if token and token.startswith('Bearer '):
+        return token.replace('Bearer ', '')
+    return token
+
+
+def load_request_user():
+    """
+    before_request hook: verify the bearer token once per request
+
+    Attaches the decoded claims to flask.g (auth_claims, user_id, user_email,
+    user_role) so handlers don't have to re-validate the token or look the
+    user up again.
+    """
+    token = request.headers.get('Authorization')
+    g.auth_token = _strip_bearer(token)
+    g.auth_claims = get_verified_claims(token) if token else None
+
+    claims = g.auth_claims or {}
+    g.user_id = claims.get('user_id')
+    g.user_email = claims.get('email')
+    g.user_role = claims.get('role')
+
+
+def _request_claims_for(token):
+    """Claims decoded by load_request_user if they belong to this token"""
+    if not has_request_context() or 'auth_token' not in g:
+        return None, False
+    if not token or _strip_bearer(token) != g.auth_token:
+        return None, False
+    return g.auth_claims, True
+
+
+def current_user_id(token):
+    """
+    Get the user_id for a token, reusing the per-request decode when possible
+
+    Parameters:
+    - token: JWT token string (with or without 'Bearer ' prefix)
+
+    Returns:
+    - user_id if token is valid, None otherwise
+    """
+    claims, resolved = _request_claims_for(token)
+    if resolved:
+        return claims.get('user_id') if claims else None
+    return validate_token(token)
+
+
+def current_user_email(token, cursor=None):
+    """
+    Get the email for a token from its claims, querying users only if absent
+
+    Parameters:
+    - token: JWT token string
+    - cursor: Optional open dictionary cursor used for the fallback lookup
+
+    Returns:
+    - Email address, or None if unknown
+    """
+    return _claim_or_lookup(token, 'email', cursor)
+
+
+def current_user_role(token, cursor=None):
+    """
+    Get the role for a token from its claims, querying users only if absent
+
+    Parameters:
+    - token: JWT token string
+    - cursor: Optional open dictionary cursor used for the fallback lookup
+
+    Returns:
+    - Role string ('admin' or 'client'), or None if unknown
+    """
+    return _claim_or_lookup(token, 'role', cursor)
+
+
+def _claim_or_lookup(token, claim, cursor):
+    claims, resolved = _request_claims_for(token)
+    if not resolved:
+        claims = get_verified_claims(token)
+    if not claims:
+        return None
+    if claims.get(claim):
+        return claims[claim]
+
+    # Older tokens (e.g. issued before role was added at login) lack the claim
+    if cursor is None:
+        with db_session() as session_cursor:
+            return _lookup_user_column(session_cursor, claims['user_id'], claim)
+    return _lookup_user_column(cursor, claims['user_id'], claim)
+
+
+def _lookup_user_column(cursor, user_id, column):
+    if column not in ('email', 'role'):
+        raise ValueError(f"Unsupported user column: {column}")
+    cursor.execute(f"SELECT {column} FROM users WHERE id = %s", (user_id,))
+    row = cursor.fetchone()
+    return row[column] if row else None
@@ -0,0 +1,269 @@
+import datetime
+import threading
+import time
+import logging
+from collections import OrderedDict
+from config import booking_config
+from db import db_session
+
+logger = logging.getLogger(__name__)
+
+
+def to_minutes(value):
+    """Minutes since midnight for a 'HH:MM[:SS]' string, time or MySQL TIME (timedelta)"""
+    if isinstance(value, datetime.timedelta):
+        return int(value.total_seconds()) // 60
+    if isinstance(value, datetime.time):
+        return value.hour * 60 + value.minute
+    parts = str(value).split(':')
+    return int(parts[0]) * 60 + (int(parts[1]) if len(parts) > 1 else 0)
+
+
+def appointments_overlap(start_a, duration_a, start_b, duration_b):
+    """True if two appointments on the same day share any minute"""
+    a = to_minutes(start_a)
+    b = to_minutes(start_b)
+    return a < b + int(duration_b) and b < a + int(duration_a)
+
+
+class AvailabilityIndex:
+    """
+    Per-day slot bitmaps for appointment availability
+
+    Bit i of a day's bitmap is set when slot i (day_start + i * slot_minutes)
+    is taken by a non-cancelled appointment. An appointment covers every
+    slot its service duration overlaps, so a 120 minute service blocks two
+    hourly slots. A service needing k slots can start at slot i when bits
+    i..i+k-1 are all clear.
+
+    Bitmaps are loaded from appointments once per day and kept up to date
+    by the booking handlers in this process. Other app processes only see
+    those changes once ttl runs out and the day is reloaded. The booking
+    path still checks the database itself, so a stale bitmap can only
+    over-report availability briefly, never double-book.
+    """
+
+    def __init__(self, day_start, day_end, slot_minutes, ttl, max_days):
+        self.day_start = to_minutes(day_start)
+        self.slot_minutes = slot_minutes
+        self.slot_count = (to_minutes(day_end) - self.day_start) // slot_minutes
+        self.ttl = ttl
+        self.max_days = max_days
+        self._lock = threading.Lock()
+        self._days = OrderedDict()  # date -> (bitmap, loaded_at)
+        self._durations = {}  # int service_id of an existing service -> (duration, loaded_at)
+        self._ranges = OrderedDict()  # (start, end, duration) -> (days, version, built_at)
+        self._version = 0  # bumped whenever a cached day changes
+        self.hits = 0
+        self.loads = 0
+        self.range_hits = 0
+        self.range_loads = 0
+
+    def slot_label(self, index):
+        minutes = self.day_start + index * self.slot_minutes
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+    def slots_needed(self, duration):
+        """Number of consecutive slots a service of this many minutes occupies"""
+        return max(1, -(-int(duration or self.slot_minutes) // self.slot_minutes))
+
+    def span_mask(self, start_time, duration):
+        """Bitmap of the slots covered by an appointment"""
+        start = to_minutes(start_time) - self.day_start
+        end = start + int(duration or self.slot_minutes)
+        mask = 0
+        for index in range(self.slot_count):
+            slot_start = index * self.slot_minutes
+            if slot_start < end and slot_start + self.slot_minutes > start:
+                mask |= 1 << index
+        return mask
+
+    def _fresh(self, loaded_at):
+        return time.time() - loaded_at < self.ttl
+
+    def _load_day(self, date):
+        with db_session() as cursor:
+            cursor.execute(
+                """
+                SELECT a.appointment_time, s.duration
+                FROM appointments a
+                JOIN services s ON a.service_id = s.id
+                WHERE a.appointment_date = %s AND a.status != 'cancelled'
+                """,
+                (date,)
+            )
+            rows = cursor.fetchall()
+        bitmap = 0
+        for row in rows:
+            bitmap |= self.span_mask(row['appointment_time'], row['duration'])
+        self.loads += 1
+        return bitmap
+
+    def day_bitmap(self, date):
+        key = str(date)
+        with self._lock:
+            entry = self._days.get(key)
+            if entry is not None and self._fresh(entry[1]):
+                self._days.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        bitmap = self._load_day(key)
+        self._store(key, bitmap)
+        return bitmap
+
+    def _store(self, key, bitmap):
+        with self._lock:
+            self._days[key] = (bitmap, time.time())
+            self._days.move_to_end(key)
+            while len(self._days) > self.max_days:
+                self._days.popitem(last=False)
+
+    def service_duration(self, service_id):
+        """
+        Duration of a service in minutes, or None if it doesn't exist
+
+        service_id must be an integer (ValueError otherwise): MySQL would
+        match strings like '1abc' to service 1. Only existing services are
+        cached, so the cache stays as small as the services table.
+        """
+        service_id = int(service_id)
+        with self._lock:
+            entry = self._durations.get(service_id)
+            if entry is not None and self._fresh(entry[1]):
+                return entry[0]
+
+        with db_session() as cursor:
+            cursor.execute("SELECT duration FROM services WHERE id = %s", (service_id,))
+            service = cursor.fetchone()
+        if not service:
+            return None
+        with self._lock:
+            self._durations[service_id] = (service['duration'], time.time())
+        return service['duration']
+
+    def free_starts(self, bitmap, duration):
+        """Slot labels where a service of this duration fits within the day"""
+        needed = self.slots_needed(duration)
+        mask = (1 << needed) - 1
+        return [
+            self.slot_label(index)
+            for index in range(self.slot_count - needed + 1)
+            if (bitmap >> index) & mask == 0
+        ]
+
+    def available_slots(self, date, duration=None):
+        return self.free_starts(self.day_bitmap(date), duration)
+
+    def _load_range(self, start, end):
+        """Load bitmaps for every day in [start, end] with one grouped query"""
+        with db_session() as cursor:
+            cursor.execute(
+                """
+                SELECT a.appointment_date, a.appointment_time, MAX(s.duration) AS duration
+                FROM appointments a
+                JOIN services s ON a.service_id = s.id
+                WHERE a.appointment_date BETWEEN %s AND %s AND a.status != 'cancelled'
+                GROUP BY a.appointment_date, a.appointment_time
+                """,
+                (start, end)
+            )
+            rows = cursor.fetchall()
+
+        bitmaps = {}
+        day = start
+        while day <= end:
+            bitmaps[str(day)] = 0
+            day += datetime.timedelta(days=1)
+        for row in rows:
+            key = str(row['appointment_date'])
+            bitmaps[key] |= self.span_mask(row['appointment_time'], row['duration'])
+
+        for key, bitmap in bitmaps.items():
+            self._store(key, bitmap)
+        self.range_loads += 1
+        return bitmaps
+
+    def available_range(self, start, end, duration=None):
+        """
+        Available start slots for each day from start to end inclusive
+
+        Parameters:
+        - start, end: datetime.date bounds of the range
+        - duration: Service duration in minutes (None for a single slot)
+
+        Returns:
+        - Dict of 'YYYY-MM-DD' -> list of 'HH:MM' slot labels
+        """
+        range_key = (str(start), str(end), duration)
+        with self._lock:
+            entry = self._ranges.get(range_key)
+            if entry is not None and entry[1] == self._version and self._fresh(entry[2]):
+                self.range_hits += 1
+                return entry[0]
+            version = self._version
+
+            # Reuse cached days when the whole range is already fresh
+            bitmaps = {}
+            day = start
+            while day <= end:
+                cached = self._days.get(str(day))
+                if cached is None or not self._fresh(cached[1]):
+                    bitmaps = None
+                    break
+                bitmaps[str(day)] = cached[0]
+                day += datetime.timedelta(days=1)
+
+        if bitmaps is None:
+            bitmaps = self._load_range(start, end)
+
+        days = {key: self.free_starts(bitmap, duration) for key, bitmap in bitmaps.items()}
+        with self._lock:
+            # A booking that landed while we were loading makes this result stale
+            if version == self._version:
+                self._ranges[range_key] = (days, version, time.time())
+                self._ranges.move_to_end(range_key)
+                while len(self._ranges) > self.max_days:
+                    self._ranges.popitem(last=False)
+        return days
+
+    def mark_booked(self, date, start_time, duration):
+        """Record a new booking in the cached bitmap for its day"""
+        key = str(date)
+        with self._lock:
+            self._version += 1
+            entry = self._days.get(key)
+            if entry is not None:
+                self._days[key] = (entry[0] | self.span_mask(start_time, duration), entry[1])
+
+    def invalidate(self, date):
+        """
+        Drop a day's bitmap, e.g. after a cancellation
+
+        Bits are not cleared in place because overlapping legacy bookings
+        can share a slot; the next read reloads the day instead.
+        """
+        with self._lock:
+            self._version += 1
+            self._days.pop(str(date), None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "days_cached": len(self._days),
+                "slot_count": self.slot_count,
+                "hits": self.hits,
+                "loads": self.loads,
+                "ranges_cached": len(self._ranges),
+                "range_hits": self.range_hits,
+                "range_loads": self.range_loads
+            }
+
+
+availability_index = AvailabilityIndex(
+    day_start=booking_config.BOOKING_DAY_START,
+    day_end=booking_config.BOOKING_DAY_END,
+    slot_minutes=booking_config.BOOKING_SLOT_MINUTES,
+    ttl=booking_config.AVAILABILITY_CACHE_TTL,
+    max_days=booking_config.AVAILABILITY_CACHE_DAYS
+)
@@ -0,0 +1,76 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWorker:
+    """
+    Base class for in-process worker threads
+
+    Subclasses implement run_once(), which does one unit of work and returns
+    True if there may be more to do right away. When it returns False the
+    thread sleeps for poll_interval or until wake() is called, whichever
+    comes first.
+    """
+
+    name = 'worker'
+
+    def __init__(self, poll_interval, threads=1):
+        self.poll_interval = poll_interval
+        self.threads = threads
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def run_once(self):
+        raise NotImplementedError
+
+    def on_idle(self):
+        """Called after an idle wait; override for housekeeping"""
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                more = self.run_once()
+            except Exception as e:
+                logger.error(f"{self.name} iteration failed: {str(e)}")
+                more = False
+
+            if more:
+                continue
+            woken = self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if not woken:
+                try:
+                    self.on_idle()
+                except Exception as e:
+                    logger.error(f"{self.name} idle housekeeping failed: {str(e)}")
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for i in range(self.threads):
+                thread = threading.Thread(target=self._loop, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started {self.threads} {self.name} thread(s)")
+
+    def wake(self):
+        """Skip the rest of the current poll wait"""
+        self._wake.set()
+
+    def stop(self, timeout=5):
+        with self._start_lock:
+            self._stop.set()
+            self._wake.set()
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
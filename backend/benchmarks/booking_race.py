@@ -0,0 +1,129 @@
+"""
+Stress test double-booking protection in create_appointment
+
+Creates a throwaway client, then fires N create_appointment() calls at the
+same slot at once (released together by a barrier) and checks that exactly
+one gets 201 and the other N-1 get 409. With --overlap the calls use
+different start times that all overlap the first one, which exercises the
+row-lock check rather than the unique (date, time, active_slot) key.
+Repeats for several rounds on different days and removes everything it
+created afterwards.
+
+Needs the MySQL database from config (DB_* environment variables) with at
+least one active service, and JWT_SECRET_KEY set. N should not exceed
+DB_POOL_MAX_SIZE, or calls time out waiting for a connection instead of
+racing for the slot.
+
+Usage: python backend/benchmarks/booking_race.py [concurrency] [rounds] [--overlap]
+"""
+import datetime
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from db import db_session, pool  # noqa: E402
+from methods import create_appointment  # noqa: E402
+from utils import generate_token  # noqa: E402
+
+app = Flask(__name__)
+
+
+def create_client():
+    email = f"booking-race-{uuid.uuid4().hex[:12]}@example.com"
+    with db_session() as cursor:
+        cursor.execute(
+            "INSERT INTO users (name, email, password, role, is_verified) VALUES (%s, %s, %s, 'client', 1)",
+            ("Booking Race", email, '!')
+        )
+        return cursor.lastrowid, email
+
+
+def pick_service():
+    with db_session() as cursor:
+        cursor.execute("SELECT id, duration FROM services WHERE is_active = 1 ORDER BY duration DESC LIMIT 1")
+        return cursor.fetchone()
+
+
+def start_times(concurrency, duration, overlap):
+    if not overlap:
+        return ['10:00'] * concurrency
+    # Every start lies inside the first booking (10:00 + duration), so all of them collide with it
+    step = max(1, min(duration - 1, 59) // max(1, concurrency - 1))
+    return [f"10:{min(59, index * step):02d}" for index in range(concurrency)]
+
+
+def race(token, service, date, times):
+    barrier = threading.Barrier(len(times))
+    results = [None] * len(times)
+
+    def book(index):
+        with app.app_context():
+            barrier.wait()
+            response, status = create_appointment(token, {
+                'service_id': service['id'],
+                'date': date,
+                'time': times[index],
+                'notes': 'booking race'
+            })
+            results[index] = (status, response.get_json().get('error'))
+
+    threads = [threading.Thread(target=book, args=(index,)) for index in range(len(times))]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    concurrency = int(args[0]) if args else pool.max_size
+    rounds = int(args[1]) if len(args) > 1 else 5
+    overlap = '--overlap' in sys.argv
+    if concurrency > pool.max_size:
+        print(f"Warning: {concurrency} calls but DB_POOL_MAX_SIZE is {pool.max_size}; "
+              "some will wait for a connection")
+
+    service = pick_service()
+    if not service:
+        sys.exit("No active service to book")
+    user_id, email = create_client()
+    token = generate_token(user_id, email, 'client')
+    rng = random.Random()
+    failures = 0
+
+    try:
+        for round_number in range(1, rounds + 1):
+            # A far-future day nobody else books
+            date = (datetime.date(2099, 1, 1) + datetime.timedelta(days=rng.randrange(0, 3650))).isoformat()
+            times = start_times(concurrency, service['duration'], overlap)
+            results, elapsed = race(token, service, date, times)
+            statuses = Counter(status for status, _ in results)
+            ok = statuses[201] == 1 and statuses[409] == concurrency - 1
+            failures += not ok
+            print(f"round {round_number}: {date} {concurrency} calls in {elapsed * 1000:.0f}ms -> "
+                  f"{dict(statuses)} {'OK' if ok else 'FAILED'}")
+            if not ok:
+                for status, error in results:
+                    if status not in (201, 409):
+                        print(f"  {status}: {error}")
+    finally:
+        with db_session() as cursor:
+            cursor.execute("DELETE FROM appointments WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+
+    if failures:
+        sys.exit(f"{failures} of {rounds} rounds did not end with exactly one booking")
+    print(f"All {rounds} rounds: exactly one 201 and {concurrency - 1} x 409")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+"""
+Local stand-in for the Microsoft Graph endpoints the Teams client uses
+
+Serves, over plain HTTP on localhost:
+
+- POST /<tenant>/oauth2/v2.0/token: client-credentials tokens valid for --token-ttl
+- POST /v1.0/users/<organizer>/onlineMeetings: creates a meeting
+- GET /v1.0/users/<organizer>/onlineMeetings/<id>: returns one
+- POST /v1.0/$batch: up to 20 of the above, answered per item
+
+Graph calls without a token it issued get 401. Every request waits
+--latency seconds. A --throttle-rate share of meeting requests get 429
+with Retry-After: --retry-after, on their own or inside a $batch.
+Subjects can also ask for a failure:
+
+- [429]: throttled on the first attempt only
+- [403]: always 403
+- [drop]: left out of the $batch response
+- [drop-retry]: with [429], left out of the $batch response that retries it
+
+"serve" runs the stand-in until interrupted. Point the app at it with
+
+    TEAMS_ENABLED=True MS_CLIENT_ID=stand-in MS_CLIENT_SECRET=stand-in
+    MS_TENANT_ID=stand-in MS_LOGIN_URL=http://127.0.0.1:8765
+    MS_GRAPH_URL=http://127.0.0.1:8765/v1.0
+
+and the meeting provisioner will create real (stand-in) meetings with
+Graph round trips and throttling, without a tenant.
+
+"load" starts the stand-in in-process and creates meetings through a
+MicrosoftTeamsIntegration pointed at it from several threads, in batches
+the size the provisioner claims, and reports throughput and client stats.
+
+"check" runs the client against fresh in-process stand-ins and exits
+non-zero unless concurrent callers share a single token fetch, a rejected
+token is refreshed once, throttled calls recover through Retry-After, and
+$batch creates are chunked, retried and reported per item.
+
+Usage:
+    python backend/benchmarks/graph_standin.py serve [--port 8765] [--latency 0.2] [--throttle-rate 0.05]
+    python backend/benchmarks/graph_standin.py load [meetings] [threads] [--latency 0.2] [--throttle-rate 0.05]
+    python backend/benchmarks/graph_standin.py check
+"""
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import teams_config  # noqa: E402
+from microsoft_teams import BATCH_LIMIT, MicrosoftTeamsIntegration  # noqa: E402
+
+MEETINGS_PATH = re.compile(r'^/users/([^/]+)/onlineMeetings(?:/([^/?]+))?$')
+
+
+class GraphStandIn:
+    """State and counters shared by the stand-in's request handlers"""
+
+    def __init__(self, latency=0.0, throttle_rate=0.0, retry_after=1, token_ttl=3600, seed=None):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.token_ttl = token_ttl
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = set()
+        self._meetings = {}
+        self._throttled_subjects = set()
+        self.counters = {'token_requests': 0, 'graph_requests': 0, 'batch_requests': 0,
+                         'batch_items': 0, 'meetings_created': 0, 'throttled': 0, 'unauthorized': 0}
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def issue_token(self):
+        token = f"stand-in-{uuid.uuid4().hex}"
+        with self._lock:
+            self._tokens.add(token)
+            self.counters['token_requests'] += 1
+        return {'token_type': 'Bearer', 'expires_in': self.token_ttl, 'access_token': token}
+
+    def revoke_tokens(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def authorized(self, header):
+        with self._lock:
+            return (header or '').startswith('Bearer ') and header[7:] in self._tokens
+
+    def _throttle(self, subject):
+        with self._lock:
+            if '[429]' in subject and subject not in self._throttled_subjects:
+                self._throttled_subjects.add(subject)
+                throttled = True
+            else:
+                throttled = self.throttle_rate and self._random.random() < self.throttle_rate
+            if throttled:
+                self.counters['throttled'] += 1
+        return throttled
+
+    def meetings(self, method, path, body):
+        """Answer one onlineMeetings request as (status, headers, body)"""
+        match = MEETINGS_PATH.match(path)
+        if not match:
+            return 404, {}, {'error': {'code': 'NotFound', 'message': f"No route for {path}"}}
+        meeting_id = match.group(2)
+
+        if method == 'GET' and meeting_id:
+            with self._lock:
+                meeting = self._meetings.get(meeting_id)
+            if meeting is None:
+                return 404, {}, {'error': {'code': 'NotFound', 'message': 'Meeting not found'}}
+            return 200, {}, meeting
+        if method != 'POST' or meeting_id:
+            return 405, {}, {'error': {'code': 'MethodNotAllowed', 'message': method}}
+
+        subject = (body or {}).get('subject') or ''
+        if '[403]' in subject:
+            return 403, {}, {'error': {'code': 'Forbidden', 'message': 'Application access policy denied'}}
+        if self._throttle(subject):
+            return 429, {'Retry-After': str(self.retry_after)}, {
+                'error': {'code': 'TooManyRequests', 'message': 'Too many requests'}}
+
+        meeting_id = f"stand-in-{uuid.uuid4().hex}"
+        meeting = {
+            'id': meeting_id,
+            'subject': subject,
+            'startDateTime': body.get('startDateTime'),
+            'endDateTime': body.get('endDateTime'),
+            'joinUrl': f"https://teams.microsoft.com/l/meetup-join/{meeting_id}",
+            'joinWebUrl': f"https://teams.microsoft.com/l/meetup-join/{meeting_id}/web"
+        }
+        with self._lock:
+            self._meetings[meeting_id] = meeting
+            self.counters['meetings_created'] += 1
+        return 201, {}, meeting
+
+    def batch(self, body):
+        items = (body or {}).get('requests') or []
+        if len(items) > BATCH_LIMIT:
+            return 400, {}, {'error': {'code': 'BadRequest', 'message': f"At most {BATCH_LIMIT} requests per batch"}}
+        self.count('batch_items', len(items))
+        responses = []
+        for item in items:
+            subject = (item.get('body') or {}).get('subject') or ''
+            with self._lock:
+                retried = subject in self._throttled_subjects
+            if '[drop]' in subject or ('[drop-retry]' in subject and retried):
+                continue
+            status, headers, response_body = self.meetings(item.get('method', 'GET'), item.get('url', ''),
+                                                           item.get('body'))
+            responses.append({'id': item.get('id'), 'status': status, 'headers': headers, 'body': response_body})
+        return 200, {}, {'responses': responses}
+
+
+class GraphHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so the client's connection pool is exercised
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, headers, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _handle(self, method):
+        standin = self.server.standin
+        raw = self._body()
+        if standin.latency:
+            time.sleep(standin.latency)
+
+        if method == 'POST' and self.path.endswith('/oauth2/v2.0/token'):
+            return self._reply(200, {}, standin.issue_token())
+        if not self.path.startswith('/v1.0/'):
+            return self._reply(404, {}, {'error': {'code': 'NotFound', 'message': self.path}})
+
+        standin.count('graph_requests')
+        if not standin.authorized(self.headers.get('Authorization')):
+            standin.count('unauthorized')
+            return self._reply(401, {}, {'error': {'code': 'InvalidAuthenticationToken', 'message': 'Unknown token'}})
+        try:
+            body = json.loads(raw) if raw else None
+        except ValueError:
+            return self._reply(400, {}, {'error': {'code': 'BadRequest', 'message': 'Invalid JSON'}})
+
+        path = self.path[len('/v1.0'):]
+        if path == '/$batch' and method == 'POST':
+            standin.count('batch_requests')
+            return self._reply(*standin.batch(body))
+        return self._reply(*standin.meetings(method, path, body))
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+def start_standin(port=0, **options):
+    """Run a stand-in on a background thread; returns the server (server.standin holds the state)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), GraphHandler)
+    server.daemon_threads = True
+    server.standin = GraphStandIn(**options)
+    threading.Thread(target=server.serve_forever, name='graph-standin', daemon=True).start()
+    return server
+
+
+def client_for(server, **overrides):
+    """A MicrosoftTeamsIntegration pointed at the stand-in"""
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    options = {'backoff': 0.05, 'backoff_max': 5}
+    options.update(overrides)
+    return MicrosoftTeamsIntegration('stand-in', 'stand-in', 'stand-in', 'organizer@example.com', enabled=True,
+                                     login_url=base, graph_url=f"{base}/v1.0", **options)
+
+
+def meeting_args(index, subject=None):
+    start = f"2099-01-01T{9 + index % 8:02d}:00:00"
+    return {'subject': subject or f"Stand-in meeting {index}",
+            'start_time': start, 'end_time': start.replace(':00:00', ':45:00')}
+
+
+def load(count, threads, batch_size, **options):
+    server = start_standin(**options)
+    client = client_for(server, pool_size=threads, max_retries=teams_config.TEAMS_HTTP_MAX_RETRIES)
+    batches = [[meeting_args(index) for index in range(offset, min(count, offset + batch_size))]
+               for offset in range(0, count, batch_size)]
+    errors = [0] * threads
+
+    def worker(index):
+        for batch in batches[index::threads]:
+            errors[index] += sum(1 for result in client.create_meetings(batch) if result['error'])
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    print(f"{count} meetings in {len(batches)} batches of {batch_size} from {threads} threads: "
+          f"{elapsed:.2f}s, {count / elapsed:.0f} meetings/s, {sum(errors)} failed")
+    print(f"stand-in: {server.standin.counters}")
+    print(f"client: {json.dumps(client.stats())}")
+
+
+class Checks:
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, name, ok, detail=''):
+        self.failures += not ok
+        print(f"{'OK    ' if ok else 'FAILED'} {name}{f' ({detail})' if detail else ''}")
+
+
+def concurrently(count, fn):
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def call(index):
+        barrier.wait()
+        results[index] = fn(index)
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def check_client(checks):
+    # The token endpoint is slow, so all eight callers arrive while it is being fetched
+    server = start_standin(latency=0.2)
+    client = client_for(server)
+    meetings = concurrently(8, lambda index: client.create_meeting(**meeting_args(index)))
+    counters = server.standin.counters
+    checks.check("8 concurrent create_meeting calls succeed", all(meetings))
+    checks.check("one token request for all of them", counters['token_requests'] == 1, str(counters))
+    fetched = client.get_meeting(meetings[0]['meeting_id'])
+    checks.check("get_meeting returns the created meeting", fetched and fetched['join_url'] == meetings[0]['join_url'])
+
+    # A token the server no longer accepts is replaced once, not per caller
+    server.standin.revoke_tokens()
+    meetings = concurrently(4, lambda index: client.create_meeting(**meeting_args(index)))
+    checks.check("rejected token refreshed", all(meetings) and server.standin.counters['token_requests'] == 2,
+                 str(server.standin.counters))
+    server.shutdown()
+
+    server = start_standin(retry_after=1)
+    client = client_for(server)
+    start = time.perf_counter()
+    meetings = concurrently(8, lambda index: client.create_meeting(**meeting_args(index, f"Throttled {index} [429]")))
+    elapsed = time.perf_counter() - start
+    stats = client.stats()
+    checks.check("throttled calls recover", all(meetings) and server.standin.counters['throttled'] == 8,
+                 str(server.standin.counters))
+    checks.check("Retry-After honored", elapsed >= 1 and stats['retries'] == 8 and stats['throttled'] == 8,
+                 f"{elapsed:.2f}s, {stats['retries']} retries")
+    server.shutdown()
+
+
+def check_batch(checks):
+    server = start_standin(retry_after=1)
+    client = client_for(server)
+    subjects = {3: "[429]", 7: "[429]", 42: "[429]", 99: "[403]", 150: "[drop]", 180: "[429] [drop-retry]"}
+    meetings = [meeting_args(index, f"Batch {index} {subjects[index]}" if index in subjects else None)
+                for index in range(200)]
+    try:
+        results = client.create_meetings(meetings)
+    except Exception as e:
+        checks.check("create_meetings returns", False, repr(e))
+        server.shutdown()
+        return
+    counters = server.standin.counters
+    failed = {index: result['error'] for index, result in enumerate(results) if result['error']}
+    checks.check("200 creates in 10 batches plus one retry batch", counters['batch_requests'] == 11, str(counters))
+    checks.check("throttled items created on retry",
+                 all(results[index]['meeting'] for index in (3, 7, 42)), str(failed))
+    checks.check("403 reported for its own item", 99 in failed and failed[99].startswith('HTTP 403'), str(failed))
+    checks.check("dropped items reported as missing",
+                 'missing' in failed.get(150, '') and 'missing' in failed.get(180, ''), str(failed))
+    checks.check("no other failures", set(failed) == {99, 150, 180}, str(failed))
+    checks.check("meetings match their inputs",
+                 all(result['meeting']['subject'] == meetings[index]['subject']
+                     for index, result in enumerate(results) if result['meeting']))
+    server.shutdown()
+
+
+def option(name, default, cast=float):
+    if name in sys.argv:
+        return cast(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+
+def main():
+    options = {'latency': option('--latency', 0.0), 'throttle_rate': option('--throttle-rate', 0.0),
+               'retry_after': option('--retry-after', 1, int), 'token_ttl': option('--token-ttl', 3600, int)}
+    args = [a for i, a in enumerate(sys.argv[1:], 1)
+            if not a.startswith('--') and not sys.argv[i - 1].startswith('--')]
+    mode = args[0] if args else 'serve'
+
+    if mode == 'serve':
+        server = start_standin(port=option('--port', 8765, int), **options)
+        print(f"Graph stand-in listening on http://127.0.0.1:{server.server_address[1]} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(60)
+                print(server.standin.counters)
+        except KeyboardInterrupt:
+            server.shutdown()
+    elif mode == 'load':
+        count = int(args[1]) if len(args) > 1 else 1000
+        threads = int(args[2]) if len(args) > 2 else teams_config.TEAMS_WORKER_THREADS
+        load(count, threads, teams_config.TEAMS_WORKER_BATCH_SIZE, seed=42, **options)
+    elif mode == 'check':
+        checks = Checks()
+        check_client(checks)
+        check_batch(checks)
+        if checks.failures:
+            sys.exit(f"{checks.failures} checks failed")
+        print("All checks passed")
+    else:
+        sys.exit(f"Unknown mode {mode}; expected serve, load or check")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark knowledge base search on a synthetic corpus
+
+Builds a KnowledgeIndex in memory (no database) and compares BM25 queries
+against the linear substring scan the frontend used to do client-side.
+
+Usage: python backend/benchmarks/knowledge_search.py [article_count]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge_search import KnowledgeIndex, make_snippet, tokenize  # noqa: E402
+
+VOCABULARY = (
+    "tax return deduction income super fund smsf gst bas payroll invoice bookkeeping audit "
+    "depreciation capital gains rental property trust company director lodgement deadline ato "
+    "refund offset medicare levy contribution pension employer employee contractor expense "
+    "vehicle home office travel receipt record quarterly annual statement balance cash flow "
+    "budget forecast strategy planning workshop compliance penalty interest dividend franking"
+).split()
+FILLER = "the a of to and for in with on by is are your our this that".split()
+GENERATED_WORDS = 30000  # long tail of made-up terms so term frequencies follow a Zipf curve
+CATEGORIES = ['General', 'Tax', 'SMSF', 'Bookkeeping', 'Business']
+QUERIES = ['tax return', 'smsf contribution', 'capital gains rental property', 'home office deduction',
+           'gst bas quarterly lodgement', 'payroll', 'franking dividend trust', 'penalty interest ato']
+
+
+def zipf_vocabulary(rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    generated = {''.join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(GENERATED_WORDS)}
+    words = list(generated)
+    rng.shuffle(words)
+    # Domain words sit at ranks 50-150, common enough to search for but far from universal
+    words[50:50] = VOCABULARY
+    cumulative, total = [], 0.0
+    for rank in range(1, len(words) + 1):
+        total += 1.0 / rank
+        cumulative.append(total)
+    return words, cumulative
+
+
+def synthetic_article(article_id, rng, vocabulary):
+    words, cumulative = vocabulary
+    body = rng.choices(words, cum_weights=cumulative, k=rng.randint(150, 600))
+    words = [w if rng.random() < 0.6 else rng.choice(FILLER) for w in body]
+    return {
+        'id': article_id,
+        'title': ' '.join(rng.choice(VOCABULARY) for _ in range(rng.randint(3, 8))).title(),
+        'content': ' '.join(words),
+        'category': rng.choice(CATEGORIES),
+        'tags': ','.join(rng.sample(VOCABULARY, 3)),
+        'created_at': None
+    }
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.95)] * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rng = random.Random(42)
+    vocabulary = zipf_vocabulary(rng)
+    articles = [synthetic_article(i, rng, vocabulary) for i in range(1, count + 1)]
+    by_id = {a['id']: a for a in articles}
+
+    index = KnowledgeIndex(check_interval=0)
+    start = time.perf_counter()
+    for article in articles:
+        index.add(article)
+    print(f"Indexed {count} articles in {time.perf_counter() - start:.2f}s "
+          f"({index.stats()['terms']} terms)")
+
+    start = time.perf_counter()
+    for article in rng.sample(articles, 100):
+        index.add(dict(article, title=article['title'] + ' Updated'))
+    print(f"Re-indexed 100 changed articles in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    print(f"{'query':32} {'matches':>8} {'bm25 p50/p95 ms':>18} {'+snippets ms':>13} {'scan p50 ms':>12}")
+    for query in QUERIES:
+        total, _ = index.search(query, limit=10)
+        bm25 = timed(lambda: index.search(query, limit=10), 20)
+        terms = set(tokenize(query))
+
+        def with_snippets():
+            _, hits = index.search(query, limit=10)
+            return [make_snippet(by_id[doc['id']]['content'], terms) for doc, _ in hits]
+
+        snippets = timed(with_snippets, 20)
+        words = query.lower().split()
+        scan = timed(lambda: [a for a in articles if any(w in a['content'] or w in a['title'].lower() for w in words)], 3)
+        print(f"{query:32} {total:>8} {bm25[0]:>8.2f}/{bm25[1]:<8.2f} {snippets[0]:>13.2f} {scan[0]:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Check that stream_multipart stages every file part separately
+
+Builds multipart bodies in memory and feeds them through stream_multipart()
+via a Flask test request, then checks that:
+
+- two parts with the same client filename but different content are staged
+  at different paths, each holding its own bytes under its own SHA-256
+- the client filename is kept in file_name only
+- nothing is left behind in the staging directory when a part is too large
+
+Needs no database. Exits non-zero if any check fails.
+
+Usage: python backend/benchmarks/multipart_uploads.py
+"""
+import hashlib
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from uploads import UploadError, stream_multipart  # noqa: E402
+
+app = Flask(__name__)
+BOUNDARY = 'multipart-check-boundary'
+
+
+def multipart_body(fields, files):
+    parts = []
+    for name, value in fields:
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode()
+                     + value.encode() + b'\r\n')
+    for name, filename, content in files:
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/pdf\r\n\r\n'.encode() + content + b'\r\n')
+    return b''.join(parts) + f'--{BOUNDARY}--\r\n'.encode()
+
+
+def upload(directory, body, **limits):
+    with app.test_request_context('/', method='POST', data=body,
+                                  content_type=f'multipart/form-data; boundary={BOUNDARY}'):
+        from flask import request
+        return stream_multipart(request, directory, chunk_size=1024, **limits)
+
+
+class Checks:
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, name, ok, detail=''):
+        self.failures += not ok
+        print(f"{'OK    ' if ok else 'FAILED'} {name}{f' ({detail})' if detail else ''}")
+
+
+def check_same_filename(checks, directory):
+    first, second = b'first statement ' * 500, b'second statement ' * 700
+    form, files = upload(directory, multipart_body(
+        [('formType', 'individual')],
+        [('documents', 'statement.pdf', first), ('documents', 'statement.pdf', second)]
+    ))
+    checks.check("form field parsed", form == {'formType': 'individual'}, str(form))
+    checks.check("both parts returned", len(files) == 2, f"{len(files)} files")
+    if len(files) != 2:
+        return
+    checks.check("parts staged at different paths", files[0]['file_path'] != files[1]['file_path'],
+                 f"{files[0]['file_path']} {files[1]['file_path']}")
+    for stored, content in zip(files, (first, second)):
+        with open(stored['file_path'], 'rb') as staged:
+            on_disk = staged.read()
+        checks.check(f"{len(content)}-byte part kept its own bytes", on_disk == content)
+        checks.check(f"{len(content)}-byte part digest matches its bytes",
+                     stored['sha256'] == hashlib.sha256(on_disk).hexdigest() and stored['file_size'] == len(content))
+        checks.check(f"{len(content)}-byte part keeps the client filename as metadata",
+                     stored['file_name'] == 'statement.pdf'
+                     and os.path.basename(stored['file_path']) != 'statement.pdf')
+
+
+def check_oversized(checks, directory):
+    try:
+        upload(directory, multipart_body([], [('documents', 'ok.pdf', b'x' * 100),
+                                              ('documents', 'big.pdf', b'y' * 5000)]), max_file_size=4096)
+        checks.check("oversized part rejected", False)
+    except UploadError as e:
+        checks.check("oversized part rejected", e.status_code == 413, str(e))
+    checks.check("nothing left in staging", not os.listdir(directory), str(os.listdir(directory)))
+
+
+def main():
+    checks = Checks()
+    with tempfile.TemporaryDirectory() as root:
+        check_same_filename(checks, os.path.join(root, 'same-name'))
+        check_oversized(checks, os.path.join(root, 'oversized'))
+
+    if checks.failures:
+        sys.exit(f"{checks.failures} checks failed")
+    print("All checks passed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark prepared vs text-protocol SELECTs through db_session
+
+Runs the hot parameterised lookups from methods.py with the statement cache
+(db_session(prepared=True)) and without it (prepared=False), from one thread
+and from several, and reports latency percentiles, throughput and the pool's
+statement cache counters. A last pass cycles through more distinct
+statements than DB_STATEMENT_CACHE_SIZE to show the cost of evictions.
+
+Needs the MySQL database from config (DB_* environment variables) with the
+schema from database.sql; rows don't have to exist for the timings to mean
+something, but a populated database is closer to production.
+
+Usage: python backend/benchmarks/prepared_statements.py [iterations] [threads]
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import db_session, pool  # noqa: E402
+
+QUERIES = [
+    ("user by id", "SELECT id, name, email, role, is_verified FROM users WHERE id = %s", lambda i: (i % 1000 + 1,)),
+    ("role by id", "SELECT role FROM users WHERE id = %s", lambda i: (i % 1000 + 1,)),
+    ("appointments by user",
+     """
+     SELECT a.*, s.name AS service_name, s.duration
+     FROM appointments a
+     JOIN services s ON a.service_id = s.id
+     WHERE a.user_id = %s
+     ORDER BY a.appointment_date DESC, a.appointment_time DESC
+     """,
+     lambda i: (i % 1000 + 1,)),
+]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.95)] * 1000,
+            samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000)
+
+
+def run(sql, params, iterations, prepared):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        with db_session(prepared=prepared) as cursor:
+            cursor.execute(sql, params(i))
+            cursor.fetchall()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_threads(sql, params, iterations, prepared, threads):
+    results = [None] * threads
+
+    def worker(index):
+        results[index] = run(sql, params, iterations, prepared)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    samples = [sample for result in results for sample in result]
+    return samples, len(samples) / elapsed
+
+
+def cache_counters():
+    return dict(pool.stats()['prepared_statements'])
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    if not pool.statement_cache_size:
+        print("Statement cache is disabled (DB_PREPARED_STATEMENTS / DB_STATEMENT_CACHE_SIZE); "
+              "prepared runs will fall back to text queries")
+
+    # Warm up the pool and the cache so connection setup isn't timed
+    for _, sql, params in QUERIES:
+        run(sql, params, 50, True)
+        run(sql, params, 50, False)
+
+    print(f"{'query':22} {'mode':9} {'p50/p95/p99 ms (1 thread)':>28} "
+          f"{f'p50/p95 ms ({threads} threads)':>24} {'queries/s':>10}")
+    for name, sql, params in QUERIES:
+        for prepared in (False, True):
+            single = percentiles(run(sql, params, iterations, prepared))
+            samples, throughput = run_threads(sql, params, iterations // threads or 1, prepared, threads)
+            many = percentiles(samples)
+            mode = 'prepared' if prepared else 'text'
+            print(f"{name:22} {mode:9} {single[0]:>10.3f}/{single[1]:.3f}/{single[2]:<8.3f} "
+                  f"{many[0]:>12.3f}/{many[1]:<10.3f} {throughput:>10.0f}")
+
+    # More distinct statements than the cache holds: every prepared call misses and evicts
+    distinct = max(pool.statement_cache_size * 2, 8)
+    variants = [f"SELECT id FROM users WHERE id = %s AND {n} = {n}" for n in range(distinct)]
+    before = cache_counters()
+    samples = []
+    for i in range(iterations):
+        samples.extend(run(variants[i % distinct], lambda _: (1,), 1, True))
+    after = cache_counters()
+    churn = percentiles(samples)
+    print(f"\n{distinct} distinct statements, cache size {pool.statement_cache_size}: "
+          f"p50/p95 {churn[0]:.3f}/{churn[1]:.3f} ms, "
+          f"{after['misses'] - before['misses']} misses, {after['evictions'] - before['evictions']} evictions")
+    print(f"Statement cache totals: {after}")
+
+
+if __name__ == '__main__':
+    main()
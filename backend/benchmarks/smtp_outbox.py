@@ -0,0 +1,241 @@
+"""
+Check the email outbox and SMTP pool against a local capture server
+
+Starts an aiosmtpd server on localhost that records what it receives and
+answers according to the recipient:
+
+- ok-*: accepted
+- tempfail-*: 451 on DATA the first time, accepted after that
+- always451-*: 451 on DATA every time
+- reject-*: 550 on RCPT
+
+then drives a private SMTPConnectionPool and OutboxWorker (run_once() by
+hand, no background threads) through:
+
+- delivery and connection reuse: a batch of ok messages over one connection
+- keepalive: an idle connection is NOOPed and reused, a dead one replaced
+- delivery classification: deliver() results for each kind of recipient
+- retry: a 451 puts the row back to pending with a backoff, the next
+  attempt sends it
+- dead letter: a 550 fails the row at once, repeated 451s fail it after
+  max_attempts
+- lease: a row claimed by a sender that never finishes is left alone until
+  its lease runs out, then sent exactly once
+
+The last three need the MySQL database from config (DB_* environment
+variables) and use rows in email_outbox addressed to @outbox-check.invalid,
+which are deleted afterwards. The script refuses to run them while other
+mail is due, since the worker would deliver it to the capture server. Pass
+--smtp-only to run just the first three. Exits non-zero if any check fails.
+
+Needs aiosmtpd (pip install aiosmtpd).
+
+Usage: python backend/benchmarks/smtp_outbox.py [--smtp-only]
+"""
+import email
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiosmtpd.controller import Controller  # noqa: E402
+from email_outbox import OutboxWorker, SMTPConnectionPool  # noqa: E402
+
+DOMAIN = 'outbox-check.invalid'
+LEASE_SECONDS = 2
+MAX_ATTEMPTS = 3
+
+
+class CaptureHandler:
+    """aiosmtpd handler that records accepted messages and fails on cue"""
+
+    def __init__(self):
+        self.received = []  # (recipient, subject)
+        self.tempfailed = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith('reject-'):
+            return '550 5.1.1 No such user'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        for address in envelope.rcpt_tos:
+            if address.startswith('always451-'):
+                return '451 4.3.0 Try again later'
+            if address.startswith('tempfail-') and address not in self.tempfailed:
+                self.tempfailed.add(address)
+                return '451 4.3.0 Try again later'
+        subject = email.message_from_bytes(envelope.content)['Subject']
+        self.received.extend((address, subject) for address in envelope.rcpt_tos)
+        return '250 Message accepted for delivery'
+
+    def count(self, address):
+        return sum(1 for recipient, _ in self.received if recipient == address)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def address(kind, tag):
+    return f"{kind}-{tag}@{DOMAIN}"
+
+
+class Checks:
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, name, ok, detail=''):
+        self.failures += not ok
+        print(f"{'OK    ' if ok else 'FAILED'} {name}{f' ({detail})' if detail else ''}")
+
+
+def check_pool(checks, handler, port):
+    pool = SMTPConnectionPool('127.0.0.1', port, None, None, use_tls=False, size=2,
+                              timeout=5, keepalive_interval=1)
+    worker = OutboxWorker(pool, poll_interval=1, threads=1, batch_size=10, max_attempts=MAX_ATTEMPTS,
+                          backoff=1, backoff_max=1, lease_seconds=LEASE_SECONDS)
+    try:
+        tag = f"pool{int(time.time())}"
+        results = [worker.deliver({'id': n, 'to_email': address('ok', f"{tag}-{n}"),
+                                   'subject': f"pool {n}", 'body': 'hello'}) for n in range(5)]
+        checks.check("5 messages delivered", all(ok for ok, _, _ in results), str(results))
+        checks.check("one connection reused", pool.connects == 1, str(pool.stats()))
+
+        time.sleep(pool.keepalive_interval + 0.5)
+        pool.keepalive()
+        checks.check("idle connection NOOPed and kept", pool.noops >= 1 and pool.stats()['idle'] == 1,
+                     str(pool.stats()))
+
+        # A dead idle connection fails its NOOP on acquire and is replaced
+        server = pool.acquire()
+        server.sock.shutdown(socket.SHUT_RDWR)
+        pool.release(server)
+        time.sleep(pool.keepalive_interval + 0.5)
+        ok, error, _ = worker.deliver({'id': 0, 'to_email': address('ok', f"{tag}-after-drop"),
+                                       'subject': 'after drop', 'body': 'hello'})
+        checks.check("dead connection replaced", ok and pool.connects == 2, f"{error} {pool.stats()}")
+
+        for kind, expected in (('tempfail', (False, False)), ('always451', (False, False)),
+                               ('reject', (False, True))):
+            ok, error, permanent = worker.deliver({'id': 0, 'to_email': address(kind, tag),
+                                                   'subject': kind, 'body': 'hello'})
+            checks.check(f"{kind} -> ok={ok} permanent={permanent}", (ok, permanent) == expected, error)
+        ok, _, _ = worker.deliver({'id': 0, 'to_email': address('tempfail', tag), 'subject': 'again', 'body': 'x'})
+        checks.check("tempfail delivered on second try", ok and handler.count(address('tempfail', tag)) == 1)
+    finally:
+        pool.close_all()
+
+
+def check_outbox(checks, handler, port):
+    from db import db_session  # noqa: E402
+    from email_outbox import enqueue_email  # noqa: E402
+
+    with db_session() as cursor:
+        cursor.execute(
+            """
+            SELECT COUNT(*) AS due FROM email_outbox
+            WHERE ((status = 'pending' AND next_attempt_at <= NOW())
+                   OR (status = 'sending' AND locked_until < NOW()))
+              AND to_email NOT LIKE %s
+            """,
+            (f"%@{DOMAIN}",)
+        )
+        due = cursor.fetchone()['due']
+    if due:
+        sys.exit(f"{due} other emails are due in email_outbox; run with --smtp-only or drain them first")
+
+    pool = SMTPConnectionPool('127.0.0.1', port, None, None, use_tls=False, size=2,
+                              timeout=5, keepalive_interval=60)
+    # A backoff long enough that nothing comes due again unless make_due() says so
+    worker = OutboxWorker(pool, poll_interval=1, threads=1, batch_size=10, max_attempts=MAX_ATTEMPTS,
+                          backoff=60, backoff_max=60, lease_seconds=LEASE_SECONDS)
+
+    def row(outbox_id):
+        with db_session() as cursor:
+            cursor.execute("SELECT status, attempts, last_error, next_attempt_at > NOW() AS backing_off "
+                           "FROM email_outbox WHERE id = %s", (outbox_id,))
+            return cursor.fetchone()
+
+    def make_due(outbox_id):
+        # Skip the retry backoff instead of sleeping through it
+        with db_session() as cursor:
+            cursor.execute("UPDATE email_outbox SET next_attempt_at = NOW() WHERE id = %s", (outbox_id,))
+
+    def drain():
+        while worker.run_once():
+            pass
+
+    tag = f"outbox{int(time.time())}"
+    try:
+        ok_id = enqueue_email(address('ok', tag), 'outbox ok', 'hello')
+        temp_id = enqueue_email(address('tempfail', tag), 'outbox tempfail', 'hello')
+        reject_id = enqueue_email(address('reject', tag), 'outbox reject', 'hello')
+        dead_id = enqueue_email(address('always451', tag), 'outbox always451', 'hello')
+        drain()
+
+        state = row(ok_id)
+        checks.check("ok row sent", state['status'] == 'sent' and handler.count(address('ok', tag)) == 1, str(state))
+        state = row(temp_id)
+        checks.check("451 row back to pending with backoff",
+                     state['status'] == 'pending' and state['attempts'] == 1 and state['backing_off'], str(state))
+        state = row(reject_id)
+        checks.check("550 row failed at once", state['status'] == 'failed' and state['attempts'] == 1, str(state))
+
+        make_due(temp_id)
+        drain()
+        state = row(temp_id)
+        checks.check("451 row sent on retry",
+                     state['status'] == 'sent' and handler.count(address('tempfail', tag)) == 1, str(state))
+
+        for _ in range(MAX_ATTEMPTS - 1):
+            make_due(dead_id)
+            drain()
+        state = row(dead_id)
+        checks.check(f"repeated 451 row failed after {MAX_ATTEMPTS} attempts",
+                     state['status'] == 'failed' and state['attempts'] == MAX_ATTEMPTS, str(state))
+
+        # A sender that claims a row and dies before sending it
+        lease_id = enqueue_email(address('ok', f"{tag}-lease"), 'outbox lease', 'hello')
+        claimed = worker.claim_batch()
+        checks.check("row claimed and leased", [r['id'] for r in claimed] == [lease_id]
+                     and row(lease_id)['status'] == 'sending')
+        drain()
+        checks.check("leased row left alone", handler.count(address('ok', f"{tag}-lease")) == 0)
+        time.sleep(LEASE_SECONDS + 1.5)
+        drain()
+        checks.check("expired lease sent exactly once",
+                     row(lease_id)['status'] == 'sent' and handler.count(address('ok', f"{tag}-lease")) == 1)
+        checks.check("worker counters", worker.sent == 3 and worker.retried == 1 + (MAX_ATTEMPTS - 1) and worker.failed == 2,
+                     str(worker.stats()))
+    finally:
+        pool.close_all()
+        with db_session() as cursor:
+            cursor.execute("DELETE FROM email_outbox WHERE to_email LIKE %s", (f"%@{DOMAIN}",))
+
+
+def main():
+    handler = CaptureHandler()
+    port = free_port()
+    controller = Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    checks = Checks()
+    try:
+        check_pool(checks, handler, port)
+        if '--smtp-only' not in sys.argv:
+            check_outbox(checks, handler, port)
+    finally:
+        controller.stop()
+
+    if checks.failures:
+        sys.exit(f"{checks.failures} checks failed")
+    print("All checks passed")
+
+
+if __name__ == '__main__':
+    main()
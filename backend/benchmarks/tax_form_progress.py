@@ -0,0 +1,144 @@
+"""
+Benchmark anonymous save-progress lookups on a large tax_forms table
+
+Copies the tax_forms definition (owner_email column and index included, see
+migrations/010_tax_form_owner_email.sql) into a scratch table, fills it with
+synthetic forms and times the statements save_tax_form_progress() runs for
+an anonymous user, with the old LIKE pattern and with owner_email:
+
+- by id: the save-progress check (id = ... AND email matches), then the UPDATE
+- by email: finding a form from the email alone, without its id
+
+MySQL prints JSON columns with a space after each colon, so the old
+'"email":"x"' pattern finds nothing; the "found" column shows this.
+
+Needs the MySQL database from config (DB_* environment variables). The
+scratch table is dropped afterwards unless --keep is given.
+
+Usage: python backend/benchmarks/tax_form_progress.py [row_count] [--keep]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import db_session  # noqa: E402
+from utils import owner_email_key  # noqa: E402
+
+TABLE = 'tax_forms_benchmark'
+BATCH = 50000
+DISTINCT_EMAILS = 200000
+
+
+def seed(count):
+    with db_session() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        # LIKE copies columns and indexes, not foreign keys
+        cursor.execute(f"CREATE TABLE {TABLE} LIKE tax_forms")
+
+    start = time.perf_counter()
+    for offset in range(0, count, BATCH):
+        size = min(BATCH, count - offset)
+        with db_session() as cursor:
+            cursor.execute(f"SET SESSION cte_max_recursion_depth = {BATCH}")
+            cursor.execute(
+                f"""
+                INSERT INTO {TABLE} (id, form_type, form_data, status)
+                WITH RECURSIVE seq (n) AS (
+                    SELECT %s UNION ALL SELECT n + 1 FROM seq WHERE n < %s
+                )
+                SELECT CONCAT('form-', n), 'individual',
+                       JSON_OBJECT('email', CONCAT('Owner', MOD(n, %s), '@Example.com'),
+                                   'firstName', 'Test', 'lastName', CONCAT('Owner', n),
+                                   'fiscalYear', '2025-06-30', 'notes', REPEAT('x', 400)),
+                       IF(MOD(n, 10) = 0, 'completed', 'submitted')
+                FROM seq
+                """,
+                (offset, offset + size - 1, DISTINCT_EMAILS)
+            )
+        print(f"\rSeeded {offset + size}/{count} rows", end='', flush=True)
+    print(f" in {time.perf_counter() - start:.1f}s")
+    with db_session() as cursor:
+        cursor.execute(f"ANALYZE TABLE {TABLE}")
+        cursor.fetchall()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.95)] * 1000
+
+
+def explain(sql, params):
+    with db_session() as cursor:
+        cursor.execute("EXPLAIN " + sql, params)
+        plan = cursor.fetchone()
+    return f"{plan['type']}/{plan['key'] or '-'}/rows={plan['rows']}"
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    count = int(args[0]) if args else 1000000
+    rng = random.Random(42)
+    seed(count)
+
+    samples = [rng.randrange(1, count) for _ in range(200)]
+    # Emails as the form would post them; owner_email_key() folds case like the generated column
+    forms = [(f"form-{n}", f"Owner{n % DISTINCT_EMAILS}@Example.com") for n in samples if n % 10]
+
+    old_by_id = f"SELECT id FROM {TABLE} WHERE form_data LIKE %s AND id = %s AND status = 'submitted'"
+    new_by_id = f"SELECT id FROM {TABLE} WHERE owner_email = %s AND id = %s AND status = 'submitted'"
+    old_by_email = f"SELECT id FROM {TABLE} WHERE form_data LIKE %s AND status = 'submitted' LIMIT 20"
+    new_by_email = f"SELECT id FROM {TABLE} WHERE owner_email = %s AND status = 'submitted' LIMIT 20"
+
+    cases = {
+        'by id, LIKE': (old_by_id, lambda form_id, email: (f'%"email":"{email}"%', form_id)),
+        'by id, owner_email': (new_by_id, lambda form_id, email: (owner_email_key(email), form_id)),
+        'by email, LIKE': (old_by_email, lambda form_id, email: (f'%"email":"{email}"%',)),
+        'by email, owner_email': (new_by_email, lambda form_id, email: (owner_email_key(email),)),
+    }
+
+    print(f"{'lookup':24} {'found':>6} {'p50/p95 ms':>18} {'save p50/p95 ms':>18}  plan")
+    for name, (sql, params) in cases.items():
+        repeat = 5 if 'email, LIKE' in name else len(forms)
+        picks = iter(forms * 2)
+        found = 0
+
+        def lookup():
+            nonlocal found
+            form_id, email = next(picks)
+            with db_session() as cursor:
+                cursor.execute(sql, params(form_id, email))
+                found += bool(cursor.fetchall())
+
+        def save():
+            # The whole save-progress transaction: the check, then the update of the found form
+            form_id, email = next(picks)
+            form_json = json.dumps({'email': email, 'firstName': 'Test', 'notes': 'x' * 400})
+            with db_session() as cursor:
+                cursor.execute(sql, params(form_id, email))
+                rows = cursor.fetchall()
+                if rows:
+                    cursor.execute(f"UPDATE {TABLE} SET form_data = %s, updated_at = NOW() WHERE id = %s",
+                                   (form_json, rows[0]['id']))
+
+        lookup_ms = timed(lookup, repeat)
+        save_ms = timed(save, repeat) if name.startswith('by id') else None
+        plan = explain(sql, params(*forms[0]))
+        save_text = f"{save_ms[0]:>8.2f}/{save_ms[1]:<8.2f}" if save_ms else f"{'-':>18}"
+        print(f"{name:24} {found:>3}/{repeat:<3} {lookup_ms[0]:>8.2f}/{lookup_ms[1]:<8.2f} {save_text}  {plan}")
+
+    if '--keep' not in sys.argv:
+        with db_session() as cursor:
+            cursor.execute(f"DROP TABLE {TABLE}")
+
+
+if __name__ == '__main__':
+    main()
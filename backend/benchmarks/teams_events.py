@@ -0,0 +1,246 @@
+"""
+Benchmark the Teams calendar events lookup on a large appointments table
+
+Seeds a scratch copy of appointments (1M rows by default) and times the
+query and event building behind GET /api/calendar/events/teams both ways:
+
+- before: notes LIKE '%Microsoft Teams Meeting%' and the URL split back out
+  of notes, on a table indexed the way it was before migration 004 (only
+  the user_id index the foreign key creates)
+- after: meeting_status = 'meeting_ready' and teams_join_url, served by
+  idx_appointments_user_meetings
+
+for a typical client (about 50 appointments) and for one heavy account with
+thousands. One row in TEAMS_SHARE has a meeting. The "after" events are
+built by the endpoint's own teams_calendar_event().
+
+It then calls get_teams_calendar_events() itself, the handler behind the
+endpoint, for a throwaway client with ENDPOINT_EVENTS ready meetings in
+the real appointments table, checks the response and times it. Those rows
+and the client are removed afterwards.
+
+Needs the MySQL database from config (DB_* environment variables) with at
+least one service, and JWT_SECRET_KEY set. The scratch tables are dropped
+afterwards unless --keep is given.
+
+Usage: python backend/benchmarks/teams_events.py [row_count] [--keep]
+"""
+import datetime
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from db import db_session  # noqa: E402
+from methods import get_teams_calendar_events, teams_calendar_event  # noqa: E402
+from utils import generate_token  # noqa: E402
+
+app = Flask(__name__)
+
+BEFORE = 'appointments_benchmark_before'
+AFTER = 'appointments_benchmark_after'
+BATCH = 50000
+USERS = 20000
+HEAVY_USER = USERS + 1  # gets every HEAVY_EVERY-th row instead of a normal user
+HEAVY_EVERY = 97  # coprime with TEAMS_SHARE, so the heavy account has a normal mix
+TEAMS_SHARE = 10  # one in ten appointments has a Teams meeting
+SLOTS_PER_DAY = 96  # 15-minute starts, keeping (date, time) unique for active bookings
+ENDPOINT_EVENTS = 50
+
+
+def seed(count):
+    with db_session() as cursor:
+        cursor.execute("SELECT MIN(id) AS id FROM services")
+        service_id = cursor.fetchone()['id']
+        if service_id is None:
+            sys.exit("Need at least one service to join against")
+        for table in (BEFORE, AFTER):
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            # LIKE copies columns and indexes, not foreign keys
+            cursor.execute(f"CREATE TABLE {table} LIKE appointments")
+        # The pre-004 shape: the foreign key's own user_id index instead of the meeting indexes
+        cursor.execute(f"ALTER TABLE {BEFORE} DROP INDEX idx_appointments_user_meetings, "
+                       f"DROP INDEX idx_appointments_teams_meeting, ADD INDEX idx_user (user_id)")
+
+    start = time.perf_counter()
+    for offset in range(0, count, BATCH):
+        size = min(BATCH, count - offset)
+        with db_session() as cursor:
+            cursor.execute(f"SET SESSION cte_max_recursion_depth = {BATCH}")
+            cursor.execute(
+                f"""
+                INSERT INTO {AFTER}
+                (user_id, service_id, appointment_date, appointment_time, notes, status,
+                 meeting_status, teams_meeting_id, teams_join_url)
+                WITH RECURSIVE seq (n) AS (
+                    SELECT %s UNION ALL SELECT n + 1 FROM seq WHERE n < %s
+                )
+                SELECT IF(MOD(n, %s) = 0, %s, MOD(n, %s) + 1), %s,
+                       DATE('2000-01-01') + INTERVAL (n DIV %s) DAY,
+                       SEC_TO_TIME(MOD(n, %s) * 900),
+                       IF(MOD(n, %s) = 0,
+                          CONCAT(REPEAT('Client notes. ', 10), '\\n\\nMicrosoft Teams Meeting: ',
+                                 'https://teams.microsoft.com/l/meetup-join/', n),
+                          REPEAT('Client notes. ', 10)),
+                       'confirmed',
+                       IF(MOD(n, %s) = 0, 'meeting_ready', 'none'),
+                       IF(MOD(n, %s) = 0, CONCAT('meeting-', n), NULL),
+                       IF(MOD(n, %s) = 0, CONCAT('https://teams.microsoft.com/l/meetup-join/', n), NULL)
+                FROM seq
+                """,
+                (offset, offset + size - 1, HEAVY_EVERY, HEAVY_USER, USERS, service_id,
+                 SLOTS_PER_DAY, SLOTS_PER_DAY, TEAMS_SHARE, TEAMS_SHARE, TEAMS_SHARE, TEAMS_SHARE)
+            )
+        print(f"\rSeeded {offset + size}/{count} rows", end='', flush=True)
+    with db_session() as cursor:
+        cursor.execute(f"INSERT INTO {BEFORE} SELECT * FROM {AFTER}")
+    print(f" in {time.perf_counter() - start:.1f}s")
+    with db_session() as cursor:
+        for table in (BEFORE, AFTER):
+            cursor.execute(f"ANALYZE TABLE {table}")
+            cursor.fetchall()
+
+
+def end_time(appointment):
+    start = datetime.datetime.combine(appointment['appointment_date'], datetime.time()) + appointment['appointment_time']
+    return (start + datetime.timedelta(minutes=appointment['duration'])).strftime('%H:%M')
+
+
+def events_before(user_id):
+    with db_session() as cursor:
+        cursor.execute(
+            f"""
+            SELECT a.*, s.name as service_name, s.duration
+            FROM {BEFORE} a
+            JOIN services s ON a.service_id = s.id
+            WHERE a.user_id = %s AND a.notes LIKE '%Microsoft Teams Meeting%'
+            ORDER BY a.appointment_date, a.appointment_time
+            """,
+            (user_id,)
+        )
+        appointments = cursor.fetchall()
+    events = []
+    for appointment in appointments:
+        notes = appointment.get('notes', '')
+        teams_url = None
+        if 'Microsoft Teams Meeting:' in notes:
+            teams_url = notes.split('Microsoft Teams Meeting:')[1].strip().split('\n')[0].strip()
+        events.append({'id': appointment['id'], 'end_time': end_time(appointment), 'teams_url': teams_url})
+    return events
+
+
+def events_after(user_id):
+    with db_session() as cursor:
+        cursor.execute(
+            f"""
+            SELECT a.id, a.appointment_date, a.appointment_time, a.teams_join_url,
+                   s.name as service_name, s.duration
+            FROM {AFTER} a
+            JOIN services s ON a.service_id = s.id
+            WHERE a.user_id = %s AND a.meeting_status = 'meeting_ready'
+            ORDER BY a.appointment_date, a.appointment_time
+            """,
+            (user_id,)
+        )
+        appointments = cursor.fetchall()
+    return [teams_calendar_event(appointment) for appointment in appointments]
+
+
+def timed(fn, users, repeat):
+    samples = []
+    for index in range(repeat):
+        start = time.perf_counter()
+        result = fn(users[index % len(users)])
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return len(result), samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.95)] * 1000
+
+
+def check_endpoint(repeat=50):
+    """Call the real handler for a client with ENDPOINT_EVENTS ready meetings"""
+    email = f"teams-events-{uuid.uuid4().hex[:12]}@example.com"
+    with db_session() as cursor:
+        cursor.execute("SELECT id, duration FROM services ORDER BY id LIMIT 1")
+        service = cursor.fetchone()
+        cursor.execute(
+            "INSERT INTO users (name, email, password, role, is_verified) VALUES (%s, %s, %s, 'client', 1)",
+            ("Teams Events", email, '!')
+        )
+        user_id = cursor.lastrowid
+    try:
+        # Far-future days nobody else books, at a time that isn't on the hour
+        first_day = datetime.date(2099, 1, 1) + datetime.timedelta(days=random.randrange(0, 3000))
+        with db_session() as cursor:
+            for index in range(ENDPOINT_EVENTS):
+                cursor.execute(
+                    """
+                    INSERT INTO appointments
+                    (user_id, service_id, appointment_date, appointment_time, status,
+                     meeting_status, teams_join_url)
+                    VALUES (%s, %s, %s, '23:15:00', 'confirmed', 'meeting_ready', %s)
+                    """,
+                    (user_id, service['id'], first_day + datetime.timedelta(days=index),
+                     f"https://teams.microsoft.com/l/meetup-join/check-{index}")
+                )
+        token = generate_token(user_id, email, 'client')
+        samples = []
+        with app.app_context():
+            for _ in range(repeat):
+                start = time.perf_counter()
+                response, status = get_teams_calendar_events(token)
+                samples.append(time.perf_counter() - start)
+            events = response.get_json().get('events', [])
+        expected_end = (datetime.datetime(2000, 1, 1, 23, 15) + datetime.timedelta(minutes=service['duration'])).strftime('%H:%M')
+        ok = (status == 200 and len(events) == ENDPOINT_EVENTS
+              and all(event['start_time'] == '23:15' and event['end_time'] == expected_end for event in events))
+        samples.sort()
+        print(f"\nget_teams_calendar_events: {status}, {len(events)} events, "
+              f"p50/p95 {samples[len(samples) // 2] * 1000:.2f}/{samples[int(len(samples) * 0.95)] * 1000:.2f} ms "
+              f"{'OK' if ok else 'FAILED'}")
+        return ok
+    finally:
+        with db_session() as cursor:
+            cursor.execute("DELETE FROM appointments WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+
+
+def explain(table, where, user_id):
+    with db_session() as cursor:
+        cursor.execute(f"EXPLAIN SELECT a.id FROM {table} a WHERE a.user_id = %s AND {where} "
+                       f"ORDER BY a.appointment_date, a.appointment_time", (user_id,))
+        plan = cursor.fetchone()
+    return f"{plan['type']}/{plan['key'] or '-'}/rows={plan['rows']}/{plan['Extra'] or ''}"
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    count = int(args[0]) if args else 1000000
+    rng = random.Random(42)
+    seed(count)
+
+    typical = [rng.randrange(1, USERS + 1) for _ in range(200)]
+    cases = [('typical client', typical, 200), ('heavy account', [HEAVY_USER], 20)]
+    print(f"{'user':16} {'version':8} {'events':>7} {'p50/p95 ms':>18}  plan")
+    for name, users, repeat in cases:
+        for version, fn, table, where in (
+            ('before', events_before, BEFORE, "a.notes LIKE '%Microsoft Teams Meeting%'"),
+            ('after', events_after, AFTER, "a.meeting_status = 'meeting_ready'"),
+        ):
+            events, p50, p95 = timed(fn, users, repeat)
+            print(f"{name:16} {version:8} {events:>7} {p50:>8.2f}/{p95:<9.2f}  {explain(table, where, users[0])}")
+
+    if '--keep' not in sys.argv:
+        with db_session() as cursor:
+            cursor.execute(f"DROP TABLE {BEFORE}")
+            cursor.execute(f"DROP TABLE {AFTER}")
+
+    if not check_endpoint():
+        sys.exit("get_teams_calendar_events returned the wrong events")
+
+
+if __name__ == '__main__':
+    main()
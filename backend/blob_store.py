@@ -0,0 +1,131 @@
+import os
+import shutil
+import uuid
+import logging
+from config import upload_config
+from db import db_session
+from uploads import fsync_directory
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """
+    Content-addressed, reference-counted store for uploaded documents
+
+    Each distinct file is kept once, at blobs/<d[0:2]>/<d[2:4]>/<digest>
+    under the upload folder, keyed by its SHA-256. The blobs table counts
+    how many tax_form_files entries point at each digest.
+
+    Placement and garbage collection coordinate through the blob's row
+    lock: attach() bumps the count (taking the lock) before it checks the
+    file and links a staged copy into place, and collect() only unlinks a
+    file while holding the lock on a row whose count is zero. An upload
+    racing a collection therefore either waits for it and re-creates the
+    file, or makes the collector skip the blob.
+    """
+
+    def __init__(self, root, gc_grace):
+        self.root = os.path.join(root, 'blobs')
+        self.gc_grace = gc_grace
+        self.placed = 0
+        self.deduplicated = 0
+        self.collected = 0
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[0:2], digest[2:4], digest)
+
+    def attach(self, cursor, staged_path, digest, size):
+        """
+        Take a reference to a blob inside the caller's transaction
+
+        staged_path is linked into place if the blob isn't stored yet. It is
+        left alone, so a rolled-back caller can retry with it; delete it
+        after committing.
+
+        Returns:
+        - Path of the blob
+        """
+        cursor.execute(
+            """
+            INSERT INTO blobs (sha256, size, ref_count) VALUES (%s, %s, 1)
+            ON DUPLICATE KEY UPDATE ref_count = ref_count + 1
+            """,
+            (digest, size)
+        )
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            self.deduplicated += 1
+            return path
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        try:
+            os.link(staged_path, path)
+        except OSError:
+            # Staging on another filesystem (or no hard links): copy, then rename into place
+            temp_path = os.path.join(directory, f".{uuid.uuid4().hex}.tmp")
+            shutil.copyfile(staged_path, temp_path)
+            with open(temp_path, 'rb') as blob:
+                os.fsync(blob.fileno())
+            os.replace(temp_path, path)
+        fsync_directory(directory)
+        self.placed += 1
+        return path
+
+    def reference_existing(self, cursor, digest, size):
+        """
+        Take another reference to a blob that is already stored, without any upload
+
+        Returns:
+        - Path of the blob, or None if it isn't stored (the caller must upload it)
+        """
+        cursor.execute(
+            "SELECT size FROM blobs WHERE sha256 = %s AND ref_count > 0 FOR UPDATE",
+            (digest,)
+        )
+        row = cursor.fetchone()
+        path = self.path_for(digest)
+        if not row or row['size'] != size or not os.path.exists(path):
+            return None
+        cursor.execute("UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = %s", (digest,))
+        self.deduplicated += 1
+        return path
+
+    def release(self, cursor, digests):
+        """Drop one reference per digest; unreferenced blobs are removed later by collect()"""
+        for digest in digests:
+            cursor.execute(
+                "UPDATE blobs SET ref_count = GREATEST(ref_count - 1, 0) WHERE sha256 = %s",
+                (digest,)
+            )
+
+    def collect(self, limit=100):
+        """Delete blobs that have had no references for gc_grace seconds; returns how many"""
+        with db_session() as cursor:
+            cursor.execute(
+                """
+                SELECT sha256 FROM blobs
+                WHERE ref_count = 0 AND updated_at < NOW() - INTERVAL %s SECOND
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                (self.gc_grace, limit)
+            )
+            digests = [row['sha256'] for row in cursor.fetchall()]
+            for digest in digests:
+                try:
+                    os.remove(self.path_for(digest))
+                except FileNotFoundError:
+                    pass
+            if digests:
+                placeholders = ', '.join(['%s'] * len(digests))
+                cursor.execute(f"DELETE FROM blobs WHERE sha256 IN ({placeholders})", digests)
+        self.collected += len(digests)
+        return len(digests)
+
+    def stats(self):
+        return {"placed": self.placed, "deduplicated": self.deduplicated, "collected": self.collected}
+
+
+blob_store = BlobStore(root=upload_config.UPLOAD_FOLDER, gc_grace=upload_config.BLOB_GC_GRACE)
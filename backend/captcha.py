@@ -0,0 +1,203 @@
+import hashlib
+import threading
+import time
+import logging
+from collections import OrderedDict, deque
+import requests
+from requests.adapters import HTTPAdapter
+from config import app_config
+
+logger = logging.getLogger(__name__)
+
+
+class CaptchaUnavailable(Exception):
+    """Raised when the verification service is failing or the breaker is open"""
+
+    def __init__(self, message="CAPTCHA verification is temporarily unavailable"):
+        super().__init__(message)
+
+
+class CaptchaConfigurationError(Exception):
+    """Raised when no reCAPTCHA secret key is configured"""
+
+
+def captcha_error_message(error_codes):
+    """
+    Map siteverify error codes to a message for the user
+
+    Parameters:
+    - error_codes: List of 'error-codes' from the siteverify response
+
+    Returns:
+    - Error message string
+    """
+    if 'timeout-or-duplicate' in error_codes:
+        return "CAPTCHA token has expired. Please refresh the page and try again."
+    elif 'invalid-input-response' in error_codes:
+        return "Invalid CAPTCHA response. Please try again."
+    elif 'missing-input-response' in error_codes:
+        return "CAPTCHA response is missing. Please complete the CAPTCHA."
+    return "CAPTCHA validation failed. Please try again."
+
+
+class CaptchaVerifier:
+    """
+    reCAPTCHA siteverify client shared by all routes
+
+    Keeps connections to the verify endpoint alive in a pooled session,
+    remembers recent results per token, and stops calling the upstream for a
+    cooldown period after repeated failures.
+
+    Google only accepts a token once, so a successful result is remembered
+    for cache_ttl seconds. A later consume=True call (login, registration)
+    uses it up instead of sending the token again and getting
+    'timeout-or-duplicate' back.
+    """
+
+    def __init__(self, verify_url, secret_key, timeout, cache_ttl, cache_size,
+                 breaker_threshold, breaker_cooldown, pool_size=10):
+        self.verify_url = verify_url
+        self.secret_key = secret_key
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._results = OrderedDict()  # token hash -> (result, expires_at)
+        self._consecutive_failures = 0
+        self._open_until = 0
+        self._latencies = deque(maxlen=256)
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+        self.cache_hits = 0
+        self.short_circuited = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def _cached(self, key, consume):
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None:
+                return None
+            result, expires_at = entry
+            if time.time() >= expires_at:
+                del self._results[key]
+                return None
+            if consume:
+                del self._results[key]
+            self.cache_hits += 1
+            return result
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._results[key] = (result, time.time() + self.cache_ttl)
+            self._results.move_to_end(key)
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+
+    def _breaker_allows(self):
+        with self._lock:
+            if time.time() < self._open_until:
+                self.short_circuited += 1
+                return False
+            return True
+
+    def _record_upstream(self, ok, elapsed):
+        with self._lock:
+            self.upstream_calls += 1
+            self._latencies.append(elapsed)
+            if ok:
+                self._consecutive_failures = 0
+                return
+            self.upstream_errors += 1
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.breaker_threshold:
+                self._open_until = time.time() + self.breaker_cooldown
+                logger.warning(f"CAPTCHA circuit breaker open for {self.breaker_cooldown}s "
+                               f"after {self._consecutive_failures} failures")
+
+    def verify(self, token, remote_ip=None, consume=True):
+        """
+        Verify a reCAPTCHA token
+
+        Parameters:
+        - token: Token produced by the reCAPTCHA widget
+        - remote_ip: Optional client IP forwarded to Google
+        - consume: Use up a remembered success (False only peeks at it)
+
+        Returns:
+        - Dict with 'success' (bool) and 'error-codes' (list)
+        """
+        if not self.secret_key:
+            raise CaptchaConfigurationError("Google reCAPTCHA secret key not configured")
+
+        key = self._key(token)
+        cached = self._cached(key, consume)
+        if cached is not None:
+            return cached
+
+        if not self._breaker_allows():
+            raise CaptchaUnavailable()
+
+        form_data = {'secret': self.secret_key, 'response': token}
+        if remote_ip:
+            form_data['remoteip'] = remote_ip
+
+        start = time.perf_counter()
+        try:
+            response = self._session.post(self.verify_url, data=form_data, timeout=self.timeout)
+            response.raise_for_status()
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            self._record_upstream(False, time.perf_counter() - start)
+            logger.error(f"CAPTCHA verification request failed: {str(e)}")
+            raise CaptchaUnavailable()
+        self._record_upstream(True, time.perf_counter() - start)
+
+        result = {
+            'success': body.get('success') is True,
+            'error-codes': body.get('error-codes', [])
+        }
+        # A successful token can be redeemed once more without another upstream call
+        if result['success'] and not consume:
+            self._remember(key, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            breaker_open = time.time() < self._open_until
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+        return {
+            "upstream_calls": self.upstream_calls,
+            "upstream_errors": self.upstream_errors,
+            "cache_hits": self.cache_hits,
+            "short_circuited": self.short_circuited,
+            "breaker_open": breaker_open,
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)}
+        }
+
+
+captcha_verifier = CaptchaVerifier(
+    verify_url=app_config.RECAPTCHA_VERIFY_URL,
+    secret_key=app_config.RECAPTCHA_SECRET_KEY,
+    timeout=app_config.RECAPTCHA_TIMEOUT,
+    cache_ttl=app_config.RECAPTCHA_CACHE_TTL,
+    cache_size=app_config.RECAPTCHA_CACHE_SIZE,
+    breaker_threshold=app_config.RECAPTCHA_BREAKER_THRESHOLD,
+    breaker_cooldown=app_config.RECAPTCHA_BREAKER_COOLDOWN
+)
@@ -0,0 +1,140 @@
+import threading
+import time
+import logging
+from config import catalog_config
+from db import db_session
+from utils import json_body, conditional_response
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceCatalog:
+    """
+    In-memory copy of services and service categories, served with ETags
+
+    The catalog is loaded once and kept as ready-to-send JSON bodies, each
+    with a strong ETag derived from its bytes. Every edit to services or
+    service_categories bumps the 'service_catalog' row in cache_versions
+    (via triggers), and each process compares that counter at most every
+    check_interval seconds, reloading when it moved. All workers therefore
+    converge within check_interval of an edit without querying the catalog
+    tables on every page view.
+    """
+
+    VERSION_NAME = 'service_catalog'
+
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0
+        self.hits = 0
+        self.not_modified = 0
+        self.version_checks = 0
+        self.loads = 0
+
+    def _read_version(self, cursor):
+        cursor.execute("SELECT version FROM cache_versions WHERE name = %s", (self.VERSION_NAME,))
+        row = cursor.fetchone()
+        return row['version'] if row else 0
+
+    def _load(self):
+        with db_session() as cursor:
+            # Read the version first: an edit that lands mid-load leaves it behind and forces another load
+            version = self._read_version(cursor)
+            cursor.execute(
+                """
+                SELECT s.*, c.name as category_name
+                FROM services s
+                JOIN service_categories c ON s.category_id = c.id
+                ORDER BY s.category_id, s.name
+                """
+            )
+            services = cursor.fetchall()
+            cursor.execute("SELECT * FROM service_categories ORDER BY name")
+            categories = cursor.fetchall()
+
+        self.loads += 1
+        logger.info(f"Loaded service catalog version {version}: {len(services)} services, "
+                    f"{len(categories)} categories")
+        return {
+            'version': version,
+            'services': json_body({"services": [s for s in services if s['is_active']]}),
+            'categories': json_body({"categories": categories}),
+            'by_id': {s['id']: json_body({"service": s}) for s in services}
+        }
+
+    def _current(self):
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and time.time() - self._checked_at < self.check_interval:
+                self.hits += 1
+                return snapshot
+
+        # One thread per process checks and reloads; the rest wait and reuse its result
+        with self._load_lock:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is not None and time.time() - self._checked_at < self.check_interval:
+                    return snapshot
+            if snapshot is not None:
+                with db_session() as cursor:
+                    version = self._read_version(cursor)
+                self.version_checks += 1
+                if version == snapshot['version']:
+                    with self._lock:
+                        self._checked_at = time.time()
+                    return snapshot
+            snapshot = self._load()
+            with self._lock:
+                self._snapshot = snapshot
+                self._checked_at = time.time()
+            return snapshot
+
+    def _respond(self, entry):
+        response = conditional_response(*entry)
+        if response.status_code == 304:
+            self.not_modified += 1
+        return response
+
+    def services_response(self):
+        return self._respond(self._current()['services'])
+
+    def categories_response(self):
+        return self._respond(self._current()['categories'])
+
+    def service_response(self, service_id):
+        """Response for one service, or None if it doesn't exist"""
+        entry = self._current()['by_id'].get(service_id)
+        return self._respond(entry) if entry is not None else None
+
+    def invalidate(self, cursor=None):
+        """
+        Bump the catalog version after an edit made outside the triggers
+
+        Pass the cursor of the writing transaction so the bump commits with it.
+        """
+        sql = "UPDATE cache_versions SET version = version + 1 WHERE name = %s"
+        if cursor is not None:
+            cursor.execute(sql, (self.VERSION_NAME,))
+        else:
+            with db_session() as own_cursor:
+                own_cursor.execute(sql, (self.VERSION_NAME,))
+        with self._lock:
+            self._checked_at = 0
+
+    def stats(self):
+        with self._lock:
+            snapshot = self._snapshot
+            return {
+                "version": snapshot['version'] if snapshot else None,
+                "services": len(snapshot['by_id']) if snapshot else 0,
+                "hits": self.hits,
+                "not_modified": self.not_modified,
+                "version_checks": self.version_checks,
+                "loads": self.loads
+            }
+
+
+service_catalog = ServiceCatalog(check_interval=catalog_config.CATALOG_VERSION_CHECK_INTERVAL)
@@ -13,6 +13,13 @@ class AppConfig:
     REQUIRE_CAPTCHA = os.environ.get('REQUIRE_CAPTCHA', 'True') == 'True'
     RECAPTCHA_SECRET_KEY = os.environ.get('RECAPTCHA_SECRET_KEY') 
     RECAPTCHA_SITE_KEY = os.environ.get('RECAPTCHA_SITE_KEY')  
+    # siteverify endpoint; point at a local stand-in for load tests
+    RECAPTCHA_VERIFY_URL = os.environ.get('RECAPTCHA_VERIFY_URL', 'https://www.google.com/recaptcha/api/siteverify')
+    RECAPTCHA_TIMEOUT = float(os.environ.get('RECAPTCHA_TIMEOUT', '3'))  # seconds
+    RECAPTCHA_CACHE_TTL = int(os.environ.get('RECAPTCHA_CACHE_TTL', '120'))  # tokens are valid for two minutes
+    RECAPTCHA_CACHE_SIZE = int(os.environ.get('RECAPTCHA_CACHE_SIZE', '10000'))
+    RECAPTCHA_BREAKER_THRESHOLD = int(os.environ.get('RECAPTCHA_BREAKER_THRESHOLD', '5'))
+    RECAPTCHA_BREAKER_COOLDOWN = int(os.environ.get('RECAPTCHA_BREAKER_COOLDOWN', '30'))  # seconds
     
 # Database configuration
 class DatabaseConfig:
@@ -21,12 +28,32 @@ class DatabaseConfig:
     DB_PASSWORD = os.environ.get('DB_PASSWORD')  
     DB_NAME = os.environ.get('DB_NAME')  
     DB_PORT = int(os.environ.get('DB_PORT')) if os.environ.get('DB_PORT') else None 
+    # Connection pool sizing and lifecycle
+    DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '2'))
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5'))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))  # seconds before a connection is replaced
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'True') == 'True'
+    # Server-side prepared statements cached per pooled connection
+    DB_PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', 'True') == 'True'
+    DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', '64'))
 
 # JWT configuration
 class JWTConfig:
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') 
     JWT_ACCESS_TOKEN_EXPIRES = 24 * 60 * 60  # 24 hours in seconds
     JWT_REFRESH_TOKEN_EXPIRES = 30 * 24 * 60 * 60  # 30 days in seconds
+    # In-process cache of verified token claims
+    JWT_CACHE_SIZE = int(os.environ.get('JWT_CACHE_SIZE', '10000'))
+    JWT_CACHE_TTL = int(os.environ.get('JWT_CACHE_TTL', '300'))  # seconds
+
+# Password hashing configuration
+class PasswordConfig:
+    BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+    # Dedicated hashing workers and how many requests may wait on them
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 2)))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '32'))
+    PASSWORD_HASH_RETRY_AFTER = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER', '1'))  # seconds
 
 # Email configuration
 class EmailConfig:
@@ -36,12 +63,64 @@ class EmailConfig:
     SMTP_PORT = int(os.environ.get('SMTP_PORT')) if os.environ.get('SMTP_PORT') else None 
     SMTP_USERNAME = os.environ.get('SMTP_USERNAME')  
     SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')  
+    # Set SMTP_USE_TLS=False (and leave the credentials empty) for a local SMTP stand-in
+    SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS', 'True') == 'True'
+    SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', '10'))  # seconds
+    SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', '2'))
+    SMTP_KEEPALIVE_INTERVAL = int(os.environ.get('SMTP_KEEPALIVE_INTERVAL', '60'))  # seconds idle before NOOP
+    # Outbox delivery
+    EMAIL_OUTBOX_POLL_INTERVAL = float(os.environ.get('EMAIL_OUTBOX_POLL_INTERVAL', '5'))  # seconds
+    EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', '20'))
+    EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', '6'))
+    EMAIL_RETRY_BACKOFF = int(os.environ.get('EMAIL_RETRY_BACKOFF', '30'))  # seconds, doubled per attempt
+    EMAIL_RETRY_BACKOFF_MAX = int(os.environ.get('EMAIL_RETRY_BACKOFF_MAX', '3600'))
+
+# Appointment booking configuration
+class BookingConfig:
+    BOOKING_DAY_START = os.environ.get('BOOKING_DAY_START', '09:00')
+    BOOKING_DAY_END = os.environ.get('BOOKING_DAY_END', '17:00')
+    BOOKING_SLOT_MINUTES = int(os.environ.get('BOOKING_SLOT_MINUTES', '60'))
+    # How long a process trusts its cached day bitmaps before reloading them
+    AVAILABILITY_CACHE_TTL = int(os.environ.get('AVAILABILITY_CACHE_TTL', '30'))  # seconds
+    AVAILABILITY_CACHE_DAYS = int(os.environ.get('AVAILABILITY_CACHE_DAYS', '366'))
+
+# Service catalog configuration
+class CatalogConfig:
+    # How often each process compares its cached catalog against the version counter
+    CATALOG_VERSION_CHECK_INTERVAL = float(os.environ.get('CATALOG_VERSION_CHECK_INTERVAL', '5'))  # seconds
+
+# Content (knowledge base) configuration
+class ContentConfig:
+    # How often each process checks whether articles changed and its search index needs syncing
+    KNOWLEDGE_INDEX_CHECK_INTERVAL = float(os.environ.get('KNOWLEDGE_INDEX_CHECK_INTERVAL', '5'))  # seconds
+    KNOWLEDGE_SEARCH_MAX_PER_PAGE = int(os.environ.get('KNOWLEDGE_SEARCH_MAX_PER_PAGE', '50'))
+    KNOWLEDGE_LIST_PAGE_SIZE = int(os.environ.get('KNOWLEDGE_LIST_PAGE_SIZE', '20'))
+    KNOWLEDGE_LIST_MAX_PAGE_SIZE = int(os.environ.get('KNOWLEDGE_LIST_MAX_PAGE_SIZE', '100'))
 
 # File upload configuration
 class UploadConfig:
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
     ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'doc', 'docx', 'xls', 'xlsx'}
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB
+    # Streamed tax form uploads: total request size, per-file size, and the read size off the socket
+    MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', str(512 * 1024 * 1024)))
+    MAX_UPLOAD_FILE_SIZE = int(os.environ.get('MAX_UPLOAD_FILE_SIZE', str(256 * 1024 * 1024)))
+    MAX_FORM_MEMORY_SIZE = int(os.environ.get('MAX_FORM_MEMORY_SIZE', str(2 * 1024 * 1024)))  # non-file fields
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+    # Resumable uploads: clients send one RESUMABLE_CHUNK_SIZE chunk per request
+    RESUMABLE_CHUNK_SIZE = int(os.environ.get('RESUMABLE_CHUNK_SIZE', str(8 * 1024 * 1024)))
+    MAX_RESUMABLE_UPLOAD_SIZE = int(os.environ.get('MAX_RESUMABLE_UPLOAD_SIZE', str(2 * 1024 * 1024 * 1024)))
+    RESUMABLE_UPLOAD_TTL = int(os.environ.get('RESUMABLE_UPLOAD_TTL', str(24 * 60 * 60)))  # seconds
+    RESUMABLE_SWEEP_INTERVAL = float(os.environ.get('RESUMABLE_SWEEP_INTERVAL', '3600'))  # seconds
+    # Unreferenced blobs are kept this long before the sweeper deletes them
+    BLOB_GC_GRACE = int(os.environ.get('BLOB_GC_GRACE', '3600'))  # seconds
+
+# Tax form progress (autosave) configuration
+class TaxFormConfig:
+    # Autosave patches are folded into a full form_data snapshot every this many versions,
+    # or sooner once the unsnapshotted patches reach PROGRESS_MAX_PENDING_BYTES
+    PROGRESS_SNAPSHOT_INTERVAL = int(os.environ.get('PROGRESS_SNAPSHOT_INTERVAL', '25'))
+    PROGRESS_MAX_PENDING_BYTES = int(os.environ.get('PROGRESS_MAX_PENDING_BYTES', str(64 * 1024)))
 
 # Microsoft Teams integration configuration
 class TeamsConfig:
@@ -50,12 +129,32 @@ class TeamsConfig:
     MS_TENANT_ID = os.environ.get('MS_TENANT_ID') 
     MS_REDIRECT_URI = os.environ.get('MS_REDIRECT_URI') 
     TEAMS_ENABLED = os.environ.get('TEAMS_ENABLED', 'False') == 'True'
+    # Graph client; point the URLs at a local stand-in (benchmarks/graph_standin.py) for load tests
+    MS_LOGIN_URL = os.environ.get('MS_LOGIN_URL', 'https://login.microsoftonline.com')
+    MS_GRAPH_URL = os.environ.get('MS_GRAPH_URL', 'https://graph.microsoft.com/v1.0')
+    TEAMS_ORGANIZER = os.environ.get('TEAMS_ORGANIZER', 'scheduler@yourdomain.com')  # user that owns app-created meetings
+    TEAMS_HTTP_TIMEOUT = float(os.environ.get('TEAMS_HTTP_TIMEOUT', '10'))  # seconds
+    TEAMS_HTTP_POOL_SIZE = int(os.environ.get('TEAMS_HTTP_POOL_SIZE', '10'))
+    TEAMS_HTTP_MAX_RETRIES = int(os.environ.get('TEAMS_HTTP_MAX_RETRIES', '3'))
+    TEAMS_HTTP_RETRY_BACKOFF = float(os.environ.get('TEAMS_HTTP_RETRY_BACKOFF', '0.5'))  # seconds, doubled per attempt
+    TEAMS_HTTP_RETRY_BACKOFF_MAX = float(os.environ.get('TEAMS_HTTP_RETRY_BACKOFF_MAX', '30'))  # also caps Retry-After
+    # Background meeting provisioning for new appointments
+    TEAMS_WORKER_POLL_INTERVAL = float(os.environ.get('TEAMS_WORKER_POLL_INTERVAL', '5'))  # seconds
+    TEAMS_WORKER_THREADS = int(os.environ.get('TEAMS_WORKER_THREADS', '2'))
+    TEAMS_WORKER_BATCH_SIZE = int(os.environ.get('TEAMS_WORKER_BATCH_SIZE', '10'))
+    TEAMS_MEETING_MAX_ATTEMPTS = int(os.environ.get('TEAMS_MEETING_MAX_ATTEMPTS', '5'))
+    TEAMS_MEETING_RETRY_BACKOFF = int(os.environ.get('TEAMS_MEETING_RETRY_BACKOFF', '30'))  # seconds, doubled per attempt
+    # Simulated Graph round trip for the mock integration (no HTTP; use the stand-in for that)
+    TEAMS_MOCK_LATENCY = float(os.environ.get('TEAMS_MOCK_LATENCY', '0'))  # seconds
 
 # Firebase configuration
 class FirebaseConfig:
     PROJECT_ID = os.environ.get('FIREBASE_PROJECT_ID')  
     # Path to service account JSON file - in production, use environment variables
     SERVICE_ACCOUNT_PATH = os.environ.get('FIREBASE_SERVICE_ACCOUNT_PATH')  
+    # Signing certificates for ID token verification; point at a local key server for offline tests
+    CERTS_URL = os.environ.get('FIREBASE_CERTS_URL', 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com')
+    TOKEN_CACHE_SIZE = int(os.environ.get('FIREBASE_TOKEN_CACHE_SIZE', '10000'))
     # For proper Firebase Admin initialization
     if PROJECT_ID:
         os.environ['GOOGLE_CLOUD_PROJECT'] = PROJECT_ID
@@ -64,7 +163,12 @@ class FirebaseConfig:
 app_config = AppConfig()
 db_config = DatabaseConfig()
 jwt_config = JWTConfig()
+password_config = PasswordConfig()
 email_config = EmailConfig()
+booking_config = BookingConfig()
+catalog_config = CatalogConfig()
+content_config = ContentConfig()
 upload_config = UploadConfig()
+tax_form_config = TaxFormConfig()
 teams_config = TeamsConfig()
 firebase_config = FirebaseConfig()
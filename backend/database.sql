@@ -44,6 +44,29 @@ CREATE TABLE services (
     FOREIGN KEY (category_id) REFERENCES service_categories(id)
 );
 
+-- Cache version counters: app processes reload cached data when a counter moves
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+INSERT INTO cache_versions (name, version) VALUES ('service_catalog', 0), ('knowledge_base', 0);
+
+-- Any edit to the service catalog bumps its version
+CREATE TRIGGER service_categories_catalog_insert AFTER INSERT ON service_categories FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'service_catalog';
+CREATE TRIGGER service_categories_catalog_update AFTER UPDATE ON service_categories FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'service_catalog';
+CREATE TRIGGER service_categories_catalog_delete AFTER DELETE ON service_categories FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'service_catalog';
+CREATE TRIGGER services_catalog_insert AFTER INSERT ON services FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'service_catalog';
+CREATE TRIGGER services_catalog_update AFTER UPDATE ON services FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'service_catalog';
+CREATE TRIGGER services_catalog_delete AFTER DELETE ON services FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'service_catalog';
+
 CREATE TABLE IF NOT EXISTS email_verification (
     id INT AUTO_INCREMENT PRIMARY KEY,
     email VARCHAR(255) NOT NULL,
@@ -65,8 +88,21 @@ CREATE TABLE appointments (
     status ENUM('pending', 'confirmed', 'completed', 'cancelled') NOT NULL DEFAULT 'pending',
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    -- 1 while the booking holds its slot, NULL once cancelled (NULLs never collide in a unique key)
+    active_slot TINYINT GENERATED ALWAYS AS (IF(status = 'cancelled', NULL, 1)) STORED,
+    -- Teams meeting, provisioned in the background after the booking commits
+    meeting_status ENUM('none', 'meeting_pending', 'meeting_ready', 'meeting_failed') NOT NULL DEFAULT 'none',
+    teams_meeting_id VARCHAR(255),
+    teams_join_url TEXT,
+    teams_join_web_url TEXT,
+    meeting_attempts INT NOT NULL DEFAULT 0,
+    meeting_available_at DATETIME NULL,
     FOREIGN KEY (user_id) REFERENCES users(id),
-    FOREIGN KEY (service_id) REFERENCES services(id)
+    FOREIGN KEY (service_id) REFERENCES services(id),
+    UNIQUE KEY uniq_appointments_active_slot (appointment_date, appointment_time, active_slot),
+    INDEX idx_appointments_meeting_queue (meeting_status, meeting_available_at),
+    INDEX idx_appointments_user_meetings (user_id, meeting_status, appointment_date, appointment_time),
+    INDEX idx_appointments_teams_meeting (teams_meeting_id)
 );
 
 -- Invoices table
@@ -141,6 +177,22 @@ CREATE TABLE notification_preferences (
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
+-- Email Outbox table (drained by the background email sender)
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    to_email VARCHAR(255) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body TEXT NOT NULL,
+    status ENUM('pending', 'sending', 'sent', 'failed') DEFAULT 'pending',
+    attempts INT DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    locked_until DATETIME NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME NULL,
+    INDEX idx_email_outbox_due (status, next_attempt_at)
+);
+
 -- Calendar Events table
 CREATE TABLE calendar_events (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -166,9 +218,21 @@ CREATE TABLE knowledge_articles (
     is_published BOOLEAN DEFAULT TRUE,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    -- Listing preview, kept in-row so listings never read the full content
+    summary VARCHAR(280) GENERATED ALWAYS AS (LEFT(content, 280)) STORED,
+    INDEX idx_knowledge_articles_updated (updated_at),
+    INDEX idx_knowledge_articles_listing (is_published, created_at, id),
     FOREIGN KEY (author_id) REFERENCES users(id)
 );
 
+-- Any edit to a knowledge base article bumps its version, and search indexes resync from updated_at
+CREATE TRIGGER knowledge_articles_index_insert AFTER INSERT ON knowledge_articles FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'knowledge_base';
+CREATE TRIGGER knowledge_articles_index_update AFTER UPDATE ON knowledge_articles FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'knowledge_base';
+CREATE TRIGGER knowledge_articles_index_delete AFTER DELETE ON knowledge_articles FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'knowledge_base';
+
 
 -- Tax forms table for storing tax form submissions and progress
 CREATE TABLE IF NOT EXISTS tax_forms (
@@ -176,14 +240,33 @@ CREATE TABLE IF NOT EXISTS tax_forms (
     user_id INT,
     form_type VARCHAR(50) NOT NULL DEFAULT 'individual', -- 'individual', 'business', 'smsf', etc.
     form_data JSON NOT NULL,
+    snapshot_version INT UNSIGNED NOT NULL DEFAULT 0, -- version of form_data (later versions are in tax_form_patches)
     fiscal_year_end DATE,
     status ENUM('submitted', 'processing', 'completed', 'requires_info') NOT NULL DEFAULT 'submitted',
     notes TEXT,
+    -- Email of an anonymous owner, as entered in the form (normalize lookups with owner_email_key())
+    owner_email VARCHAR(255) GENERATED ALWAYS AS (
+        IF(JSON_TYPE(JSON_EXTRACT(form_data, '$.email')) = 'STRING',
+           NULLIF(LEFT(LOWER(TRIM(JSON_UNQUOTE(JSON_EXTRACT(form_data, '$.email')))), 255), ''),
+           NULL)
+    ) STORED,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_tax_forms_owner_email (owner_email, status),
     FOREIGN KEY (user_id) REFERENCES users(id)
 );
 
+-- Autosave patches applied on top of tax_forms.form_data (the snapshot at snapshot_version)
+CREATE TABLE IF NOT EXISTS tax_form_patches (
+    tax_form_id VARCHAR(36) NOT NULL,
+    version INT UNSIGNED NOT NULL,
+    patch_format ENUM('json-patch', 'merge-patch') NOT NULL,
+    patch JSON NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (tax_form_id, version),
+    FOREIGN KEY (tax_form_id) REFERENCES tax_forms(id) ON DELETE CASCADE
+);
+
 -- Tax form files table for storing uploaded files
 DROP TABLE IF EXISTS tax_form_files;
 CREATE TABLE IF NOT EXISTS tax_form_files (
@@ -195,6 +278,43 @@ CREATE TABLE IF NOT EXISTS tax_form_files (
     FOREIGN KEY (tax_form_id) REFERENCES tax_forms(id) ON DELETE CASCADE
 );
 
+-- Content-addressed document blobs, stored once under uploads/blobs and reference counted
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 CHAR(64) PRIMARY KEY,
+    size BIGINT NOT NULL,
+    ref_count INT NOT NULL DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_blobs_unreferenced (ref_count, updated_at)
+);
+
+-- Resumable upload sessions for large tax documents
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id VARCHAR(36) PRIMARY KEY,
+    tax_form_id VARCHAR(36) NOT NULL,
+    user_id INT,
+    file_name VARCHAR(255) NOT NULL,
+    file_type VARCHAR(255),
+    field_name VARCHAR(100) NOT NULL,
+    file_size BIGINT NOT NULL,
+    chunk_size INT NOT NULL,
+    sha256 CHAR(64),
+    status ENUM('uploading', 'finalizing', 'completed', 'failed') NOT NULL DEFAULT 'uploading',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    expires_at DATETIME NOT NULL,
+    INDEX idx_upload_sessions_expiry (expires_at, status),
+    FOREIGN KEY (tax_form_id) REFERENCES tax_forms(id) ON DELETE CASCADE
+);
+
+-- Chunks received per upload session
+CREATE TABLE IF NOT EXISTS upload_session_chunks (
+    upload_id VARCHAR(36) NOT NULL,
+    chunk_index INT NOT NULL,
+    received_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (upload_id, chunk_index),
+    FOREIGN KEY (upload_id) REFERENCES upload_sessions(id) ON DELETE CASCADE
+);
+
 -- Tax form templates table to store available form types
 CREATE TABLE IF NOT EXISTS tax_form_templates (
     id VARCHAR(50) PRIMARY KEY,
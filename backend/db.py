@@ -0,0 +1,471 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+import mysql.connector
+from config import db_config
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseConnectionError(Exception):
+    """Raised when no connection could be borrowed from the pool"""
+
+    def __init__(self, message="Database connection error"):
+        super().__init__(message)
+
+
+class StatementCache:
+    """
+    LRU cache of server-side prepared statements for one connection
+
+    Each entry is a prepared cursor keyed by SQL text, so repeated queries
+    skip the server-side parse and run over the binary protocol. Evicted
+    statements are deallocated on the server.
+    """
+
+    def __init__(self, raw_conn, max_size):
+        self._conn = raw_conn
+        self.max_size = max_size
+        self._entries = OrderedDict()  # (sql, dictionary) -> (sql, cursor)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, operation, dictionary=True):
+        """
+        Return (sql, cursor) for the statement, preparing it on first use
+
+        The cached sql object must be passed back to cursor.execute(), which
+        only skips re-preparing when it receives the identical string.
+        """
+        key = (operation, dictionary)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        cursor = self._conn.cursor(prepared=True, dictionary=dictionary)
+        entry = (operation, cursor)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_size:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.evictions += 1
+            try:
+                evicted.close()
+            except Exception:
+                pass
+        return entry
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _PoolEntry:
+    """A raw connection plus the bookkeeping the pool keeps for it"""
+
+    __slots__ = ('conn', 'created_at', 'statements')
+
+    def __init__(self, raw_conn, statement_cache_size):
+        self.conn = raw_conn
+        self.created_at = time.monotonic()
+        self.statements = StatementCache(raw_conn, statement_cache_size) if statement_cache_size else None
+
+
+class PooledConnection:
+    """
+    Thin wrapper around a MySQL connection borrowed from a ConnectionPool.
+
+    Behaves like the underlying connection, except that close() hands the
+    connection back to the pool instead of tearing it down, so existing
+    handlers that call conn.close() keep working unchanged.
+    """
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+        self._conn = entry.conn
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    @property
+    def statements(self):
+        """Prepared statement cache for this connection, or None if disabled"""
+        return self._entry.statements
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self._entry)
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of MySQL connections
+
+    Parameters:
+    - min_size: Connections opened up front and kept warm
+    - max_size: Hard upper bound on open connections
+    - timeout: Seconds a caller waits for a free connection before giving up
+    - recycle: Seconds after which a connection is closed and replaced
+    - pre_ping: Ping connections on checkout and replace dead ones
+    - statement_cache_size: Prepared statements kept per connection (0 disables)
+    """
+
+    def __init__(self, connect_args, min_size=2, max_size=10, timeout=5.0, recycle=1800, pre_ping=True,
+                 statement_cache_size=0):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.connect_args = connect_args
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.statement_cache_size = statement_cache_size
+
+        self._lock = threading.Condition()
+        self._idle = []  # list of _PoolEntry
+        self._open = 0
+        self._in_use = 0
+        self._filled = False
+
+        # Counters exposed through stats()
+        self._checkouts = 0
+        self._checkout_failures = 0
+        self._timeouts = 0
+        self._waits = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._recycled = 0
+        self._ping_failures = 0
+        self._retired_statement_stats = [0, 0, 0]  # hits, misses, evictions of closed connections
+
+    def _connect(self):
+        return _PoolEntry(mysql.connector.connect(**self.connect_args), self.statement_cache_size)
+
+    def _discard(self, entry):
+        with self._lock:
+            if entry.statements is not None:
+                self._retired_statement_stats[0] += entry.statements.hits
+                self._retired_statement_stats[1] += entry.statements.misses
+                self._retired_statement_stats[2] += entry.statements.evictions
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+
+    def _fill(self):
+        """Open min_size connections the first time the pool is used"""
+        with self._lock:
+            if self._filled:
+                return
+            self._filled = True
+            missing = self.min_size - self._open
+            self._open += max(0, missing)
+        for _ in range(max(0, missing)):
+            try:
+                entry = self._connect()
+            except mysql.connector.Error as err:
+                logger.error(f"Failed to pre-open pooled connection: {err}")
+                with self._lock:
+                    self._open -= 1
+                    self._lock.notify()
+                continue
+            with self._lock:
+                self._idle.append(entry)
+                self._lock.notify()
+
+    def _healthy(self, entry):
+        if self.recycle and time.monotonic() - entry.created_at > self.recycle:
+            with self._lock:
+                self._recycled += 1
+            return False
+        if self.pre_ping:
+            try:
+                entry.conn.ping(reconnect=False)
+            except Exception:
+                with self._lock:
+                    self._ping_failures += 1
+                return False
+        return True
+
+    def acquire(self):
+        """
+        Borrow a connection from the pool
+
+        Returns:
+        - PooledConnection; raises mysql.connector.Error if no connection
+          could be obtained within the checkout timeout
+        """
+        if not self._filled:
+            self._fill()
+
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+
+        while True:
+            entry = None
+            should_connect = False
+
+            with self._lock:
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        self._checkout_failures += 1
+                        raise mysql.connector.errors.PoolError(
+                            f"Timed out after {self.timeout}s waiting for a database connection"
+                        )
+                    waited = True
+                    self._lock.wait(remaining)
+
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    self._open += 1
+                    should_connect = True
+                self._in_use += 1
+
+            if should_connect:
+                try:
+                    entry = self._connect()
+                except mysql.connector.Error:
+                    with self._lock:
+                        self._open -= 1
+                        self._in_use -= 1
+                        self._checkout_failures += 1
+                        self._lock.notify()
+                    raise
+            elif not self._healthy(entry):
+                # Replace the stale connection and try again
+                self._discard(entry)
+                with self._lock:
+                    self._open -= 1
+                    self._in_use -= 1
+                    self._lock.notify()
+                continue
+
+            wait_time = time.monotonic() - started
+            with self._lock:
+                self._checkouts += 1
+                if waited:
+                    self._waits += 1
+                self._total_wait += wait_time
+                self._max_wait = max(self._max_wait, wait_time)
+            return PooledConnection(self, entry)
+
+    def release(self, entry):
+        """Return a connection to the pool, rolling back any open transaction"""
+        raw_conn = entry.conn
+        reusable = True
+        try:
+            if raw_conn.unread_result:
+                raw_conn.consume_results()
+            if raw_conn.in_transaction:
+                raw_conn.rollback()
+        except Exception as e:
+            logger.warning(f"Discarding pooled connection after failed reset: {str(e)}")
+            reusable = False
+
+        with self._lock:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append(entry)
+            else:
+                self._open -= 1
+            self._lock.notify()
+
+        if not reusable:
+            self._discard(entry)
+
+    def stats(self):
+        """Snapshot of pool occupancy, checkout timings and statement cache usage"""
+        with self._lock:
+            hits, misses, evictions = self._retired_statement_stats
+            cached = 0
+            for entry in self._idle:
+                if entry.statements is not None:
+                    hits += entry.statements.hits
+                    misses += entry.statements.misses
+                    evictions += entry.statements.evictions
+                    cached += len(entry.statements)
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "checkouts": self._checkouts,
+                "checkout_failures": self._checkout_failures,
+                "timeouts": self._timeouts,
+                "waits": self._waits,
+                "avg_wait_ms": round(self._total_wait / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+                "recycled": self._recycled,
+                "ping_failures": self._ping_failures,
+                "prepared_statements": {
+                    "cache_size": self.statement_cache_size,
+                    "cached_on_idle": cached,
+                    "hits": hits,
+                    "misses": misses,
+                    "evictions": evictions,
+                },
+            }
+
+    def close_all(self):
+        """Close idle connections; borrowed ones are closed when released"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._filled = False
+        for entry in idle:
+            self._discard(entry)
+
+
+class SessionCursor:
+    """
+    Cursor handed out by db_session()
+
+    Parameterised SELECTs run as server-side prepared statements from the
+    connection's statement cache; everything else goes through a regular
+    buffered cursor. Results are always fully buffered so the connection
+    is free for the next statement.
+    """
+
+    def __init__(self, conn, dictionary=True, prepared=True):
+        self._conn = conn
+        self._dictionary = dictionary
+        self._statements = conn.statements if prepared else None
+        self._text_cursor = conn.cursor(dictionary=dictionary, buffered=True)
+        self._active = self._text_cursor
+        self._rows = None
+        self._next_row = 0
+
+    @staticmethod
+    def _preparable(operation, params):
+        return bool(params) and operation.lstrip()[:6].upper() == 'SELECT'
+
+    def execute(self, operation, params=None):
+        if self._statements is not None and self._preparable(operation, params):
+            sql, cursor = self._statements.get(operation, self._dictionary)
+            cursor.execute(sql, tuple(params))
+            self._rows = cursor.fetchall() if cursor.description else []
+            self._next_row = 0
+            self._active = cursor
+        else:
+            self._text_cursor.execute(operation, params)
+            self._rows = None
+            self._active = self._text_cursor
+
+    def executemany(self, operation, seq_params):
+        self._text_cursor.executemany(operation, seq_params)
+        self._rows = None
+        self._active = self._text_cursor
+
+    def fetchone(self):
+        if self._rows is None:
+            return self._active.fetchone()
+        if self._next_row >= len(self._rows):
+            return None
+        row = self._rows[self._next_row]
+        self._next_row += 1
+        return row
+
+    def fetchall(self):
+        if self._rows is None:
+            return self._active.fetchall()
+        rows = self._rows[self._next_row:]
+        self._next_row = len(self._rows)
+        return rows
+
+    @property
+    def lastrowid(self):
+        return self._active.lastrowid
+
+    @property
+    def rowcount(self):
+        if self._rows is not None:
+            return len(self._rows)
+        return self._active.rowcount
+
+    @property
+    def description(self):
+        return self._active.description
+
+    def close(self):
+        # Prepared cursors belong to the connection's statement cache
+        self._text_cursor.close()
+
+
+def _connect_args():
+    args = {
+        'host': db_config.DB_HOST,
+        'user': db_config.DB_USER,
+        'password': db_config.DB_PASSWORD,
+        'database': db_config.DB_NAME,
+    }
+    if db_config.DB_PORT:
+        args['port'] = db_config.DB_PORT
+    return args
+
+
+pool = ConnectionPool(
+    _connect_args(),
+    min_size=db_config.DB_POOL_MIN_SIZE,
+    max_size=db_config.DB_POOL_MAX_SIZE,
+    timeout=db_config.DB_POOL_TIMEOUT,
+    recycle=db_config.DB_POOL_RECYCLE,
+    pre_ping=db_config.DB_POOL_PRE_PING,
+    statement_cache_size=db_config.DB_STATEMENT_CACHE_SIZE if db_config.DB_PREPARED_STATEMENTS else 0,
+)
+
+
+@contextmanager
+def db_session(dictionary=True, prepared=True):
+    """
+    Unit of work around a single pooled connection
+
+    Yields a buffered cursor, commits once when the block exits normally,
+    rolls back if it raises, and always returns the connection to the pool.
+
+    Parameters:
+    - dictionary: Yield a dictionary cursor (default) or a tuple cursor
+    - prepared: Run parameterised SELECTs as cached prepared statements
+
+    Raises:
+    - DatabaseConnectionError if no connection could be obtained
+    """
+    try:
+        conn = pool.acquire()
+    except mysql.connector.Error as err:
+        logger.error(f"Database connection error: {err}")
+        raise DatabaseConnectionError() from err
+
+    try:
+        cursor = SessionCursor(conn, dictionary=dictionary, prepared=prepared)
+    except BaseException:
+        conn.close()
+        raise
+
+    try:
+        yield cursor
+        conn.commit()
+    except BaseException:
+        try:
+            conn.rollback()
+        except Exception as e:
+            logger.error(f"Rollback failed: {str(e)}")
+        raise
+    finally:
+        try:
+            cursor.close()
+        finally:
+            conn.close()
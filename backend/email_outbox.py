@@ -0,0 +1,344 @@
+import smtplib
+import random
+import threading
+import time
+import logging
+from collections import deque
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from config import email_config
+from db import db_session
+from background import BackgroundWorker
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPConnectionPool:
+    """
+    Small pool of long-lived, authenticated SMTP connections
+
+    Connections are opened lazily, reused across messages and kept alive
+    with NOOP while idle. A connection that errors is dropped and a fresh
+    one is opened on the next acquire().
+    """
+
+    def __init__(self, host, port, username, password, use_tls, size, timeout, keepalive_interval):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.size = size
+        self.timeout = timeout
+        self.keepalive_interval = keepalive_interval
+        self._idle = deque()  # (smtp, last_used)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self.connects = 0
+        self.noops = 0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()
+        if self.username:
+            server.login(self.username, self.password)
+        self.connects += 1
+        logger.info(f"Opened SMTP connection to {self.host}:{self.port}")
+        return server
+
+    @staticmethod
+    def _discard(server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _is_alive(self, server):
+        try:
+            self.noops += 1
+            return server.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            with self._lock:
+                entry = self._idle.pop() if self._idle else None
+            if entry is not None:
+                server, last_used = entry
+                if time.time() - last_used < self.keepalive_interval or self._is_alive(server):
+                    return server
+                self._discard(server)
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, server, broken=False):
+        try:
+            if broken:
+                self._discard(server)
+            else:
+                with self._lock:
+                    self._idle.append((server, time.time()))
+        finally:
+            self._slots.release()
+
+    def keepalive(self):
+        """NOOP connections that have been idle for a keepalive interval"""
+        with self._lock:
+            entries = list(self._idle)
+            self._idle.clear()
+        now = time.time()
+        kept = []
+        for server, last_used in entries:
+            if now - last_used < self.keepalive_interval:
+                kept.append((server, last_used))
+            elif self._is_alive(server):
+                kept.append((server, now))
+            else:
+                self._discard(server)
+        with self._lock:
+            self._idle.extend(kept)
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._idle)
+            self._idle.clear()
+        for server, _ in entries:
+            self._discard(server)
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+        return {"size": self.size, "idle": idle, "connects": self.connects, "noops": self.noops}
+
+
+def build_message(to_email, subject, body):
+    msg = MIMEMultipart()
+    msg['From'] = email_config.EMAIL_FROM
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+def enqueue_email(to_email, subject, body, cursor=None):
+    """
+    Queue an email for the outbox worker
+
+    Parameters:
+    - to_email: Recipient address
+    - subject: Subject line
+    - body: Plain text body
+    - cursor: Optional open session cursor, to enqueue inside the caller's transaction
+
+    Returns:
+    - The outbox row id
+    """
+    sql = "INSERT INTO email_outbox (to_email, subject, body) VALUES (%s, %s, %s)"
+    if cursor is not None:
+        cursor.execute(sql, (to_email, subject, body))
+        outbox_id = cursor.lastrowid
+    else:
+        with db_session(dictionary=False) as session_cursor:
+            session_cursor.execute(sql, (to_email, subject, body))
+            outbox_id = session_cursor.lastrowid
+    outbox_worker.record_enqueued()
+    outbox_worker.wake()
+    return outbox_id
+
+
+class OutboxWorker(BackgroundWorker):
+    """
+    Drains email_outbox over the SMTP pool
+
+    Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED and leased for
+    lease_seconds, so several threads or app processes can drain the same
+    table and a message held by a crashed sender is picked up again once
+    its lease runs out. Transient failures are retried with exponential
+    backoff; 5xx replies and exhausted retries mark the row failed.
+    """
+
+    name = 'email-outbox'
+
+    def __init__(self, smtp_pool, poll_interval, threads, batch_size, max_attempts,
+                 backoff, backoff_max, lease_seconds=300):
+        super().__init__(poll_interval, threads)
+        self.smtp_pool = smtp_pool
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.lease_seconds = lease_seconds
+        self._stats_lock = threading.Lock()
+        self._sent_at = deque(maxlen=10000)
+        self.enqueued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.send_seconds = 0.0
+
+    def record_enqueued(self):
+        with self._stats_lock:
+            self.enqueued += 1
+
+    def claim_batch(self):
+        with db_session() as cursor:
+            cursor.execute(
+                """
+                SELECT id, to_email, subject, body, attempts FROM email_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= NOW())
+                   OR (status = 'sending' AND locked_until < NOW())
+                ORDER BY next_attempt_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                (self.batch_size,)
+            )
+            rows = cursor.fetchall()
+            if rows:
+                placeholders = ', '.join(['%s'] * len(rows))
+                cursor.execute(
+                    f"""
+                    UPDATE email_outbox
+                    SET status = 'sending', locked_until = NOW() + INTERVAL %s SECOND
+                    WHERE id IN ({placeholders})
+                    """,
+                    (self.lease_seconds, *[row['id'] for row in rows])
+                )
+        return rows
+
+    def _retry_delay(self, attempts):
+        delay = min(self.backoff_max, self.backoff * (2 ** (attempts - 1)))
+        return int(delay * random.uniform(0.8, 1.2))
+
+    def _mark_sent(self, row):
+        with db_session(dictionary=False) as cursor:
+            cursor.execute(
+                """
+                UPDATE email_outbox
+                SET status = 'sent', attempts = attempts + 1, sent_at = NOW(),
+                    locked_until = NULL, last_error = NULL
+                WHERE id = %s
+                """,
+                (row['id'],)
+            )
+
+    def _mark_failed(self, row, error, permanent):
+        attempts = row['attempts'] + 1
+        with db_session(dictionary=False) as cursor:
+            if permanent or attempts >= self.max_attempts:
+                cursor.execute(
+                    """
+                    UPDATE email_outbox
+                    SET status = 'failed', attempts = %s, last_error = %s, locked_until = NULL
+                    WHERE id = %s
+                    """,
+                    (attempts, error, row['id'])
+                )
+                with self._stats_lock:
+                    self.failed += 1
+                logger.error(f"Giving up on outbox email {row['id']} to {row['to_email']}: {error}")
+            else:
+                delay = self._retry_delay(attempts)
+                cursor.execute(
+                    """
+                    UPDATE email_outbox
+                    SET status = 'pending', attempts = %s, last_error = %s, locked_until = NULL,
+                        next_attempt_at = NOW() + INTERVAL %s SECOND
+                    WHERE id = %s
+                    """,
+                    (attempts, error, delay, row['id'])
+                )
+                with self._stats_lock:
+                    self.retried += 1
+                logger.warning(f"Outbox email {row['id']} failed, retrying in {delay}s: {error}")
+
+    def deliver(self, row):
+        """Send one claimed row, returning (ok, error, permanent)"""
+        msg = build_message(row['to_email'], row['subject'], row['body'])
+        try:
+            server = self.smtp_pool.acquire()
+        except (smtplib.SMTPException, OSError) as e:
+            return False, f"connect: {str(e)}", False
+
+        start = time.perf_counter()
+        try:
+            server.send_message(msg)
+        except smtplib.SMTPRecipientsRefused as e:
+            self.smtp_pool.release(server)
+            return False, str(e), True
+        except smtplib.SMTPResponseException as e:
+            # The session is still usable after a rejected message, except on disconnect codes
+            self.smtp_pool.release(server, broken=e.smtp_code in (421, 451))
+            return False, f"{e.smtp_code} {e.smtp_error!r}", e.smtp_code >= 500
+        except (smtplib.SMTPException, OSError) as e:
+            self.smtp_pool.release(server, broken=True)
+            return False, str(e), False
+
+        self.smtp_pool.release(server)
+        with self._stats_lock:
+            self.send_seconds += time.perf_counter() - start
+        return True, None, False
+
+    def run_once(self):
+        rows = self.claim_batch()
+        for row in rows:
+            ok, error, permanent = self.deliver(row)
+            if ok:
+                self._mark_sent(row)
+                with self._stats_lock:
+                    self.sent += 1
+                    self._sent_at.append(time.time())
+                logger.info(f"Email sent to {row['to_email']} with subject: {row['subject']}")
+            else:
+                self._mark_failed(row, error, permanent)
+        return len(rows) == self.batch_size
+
+    def on_idle(self):
+        self.smtp_pool.keepalive()
+
+    def stats(self):
+        with self._stats_lock:
+            cutoff = time.time() - 60
+            sent_last_minute = sum(1 for sent_at in self._sent_at if sent_at >= cutoff)
+            return {
+                "running": self.running,
+                "enqueued": self.enqueued,
+                "sent": self.sent,
+                "retried": self.retried,
+                "failed": self.failed,
+                "sent_last_minute": sent_last_minute,
+                "avg_send_ms": round(self.send_seconds / self.sent * 1000, 2) if self.sent else None,
+                "smtp_pool": self.smtp_pool.stats()
+            }
+
+
+smtp_pool = SMTPConnectionPool(
+    host=email_config.SMTP_SERVER,
+    port=email_config.SMTP_PORT,
+    username=email_config.SMTP_USERNAME,
+    password=email_config.SMTP_PASSWORD,
+    use_tls=email_config.SMTP_USE_TLS,
+    size=email_config.SMTP_POOL_SIZE,
+    timeout=email_config.SMTP_TIMEOUT,
+    keepalive_interval=email_config.SMTP_KEEPALIVE_INTERVAL
+)
+
+outbox_worker = OutboxWorker(
+    smtp_pool,
+    poll_interval=email_config.EMAIL_OUTBOX_POLL_INTERVAL,
+    threads=email_config.SMTP_POOL_SIZE,
+    batch_size=email_config.EMAIL_OUTBOX_BATCH_SIZE,
+    max_attempts=email_config.EMAIL_MAX_ATTEMPTS,
+    backoff=email_config.EMAIL_RETRY_BACKOFF,
+    backoff_max=email_config.EMAIL_RETRY_BACKOFF_MAX
+)
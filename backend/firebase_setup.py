@@ -1,9 +1,16 @@
 import os
+import re
+import threading
+import time
 import firebase_admin
 from firebase_admin import credentials, auth
 import json
 import logging
+import jwt
+import requests
+from cryptography import x509
 from config import firebase_config
+from utils import TokenCache
 
 logger = logging.getLogger(__name__)
 
@@ -41,19 +48,153 @@ def initialize_firebase_admin():
         logger.error(f"Failed to initialize Firebase Admin SDK: {str(e)}")
         return False
 
+class FirebaseTokenVerifier:
+    """
+    Verifies Firebase ID tokens locally against Google's signing certificates
+
+    The certificates are fetched once and reused until the Cache-Control
+    max-age from the key server runs out. Successfully verified tokens are
+    cached until their exp claim, so repeated calls with the same token skip
+    the RS256 check entirely.
+    """
+
+    MIN_REFRESH_INTERVAL = 30  # seconds
+
+    def __init__(self, project_id, certs_url, cache_size, timeout=5):
+        self.project_id = project_id
+        self.certs_url = certs_url
+        self.timeout = timeout
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self._session = requests.Session()
+        self._keys_lock = threading.Lock()
+        self._keys = {}  # kid -> public key
+        self._keys_expire_at = 0
+        self._last_fetch = 0
+        self.key_fetches = 0
+        # Firebase ID tokens live for an hour, so entries expire with the token
+        self._cache = TokenCache(cache_size, ttl=3600)
+
+    @staticmethod
+    def _max_age(cache_control):
+        match = re.search(r'max-age=(\d+)', cache_control or '')
+        return int(match.group(1)) if match else 0
+
+    def _fetch_keys(self):
+        response = self._session.get(self.certs_url, timeout=self.timeout)
+        response.raise_for_status()
+        keys = {
+            kid: x509.load_pem_x509_certificate(pem.encode('utf-8')).public_key()
+            for kid, pem in response.json().items()
+        }
+        self._keys = keys
+        self._last_fetch = time.time()
+        self._keys_expire_at = self._last_fetch + self._max_age(response.headers.get('Cache-Control'))
+        self.key_fetches += 1
+        logger.info(f"Fetched {len(keys)} Firebase signing keys from {self.certs_url}")
+
+    def get_key(self, kid, force_refresh=False):
+        """Return the public key for kid, refreshing the key set when stale"""
+        with self._keys_lock:
+            now = time.time()
+            # Forced refreshes are rate limited so unknown kids can't hammer the key server
+            if force_refresh and now - self._last_fetch < self.MIN_REFRESH_INTERVAL:
+                force_refresh = False
+            if force_refresh or now >= self._keys_expire_at:
+                self._fetch_keys()
+            return self._keys.get(kid)
+
+    def prefetch(self):
+        """Load the signing keys up front so the first sign-in doesn't pay for it"""
+        try:
+            self.get_key(None)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to prefetch Firebase signing keys: {str(e)}")
+            return False
+
+    def verify(self, token):
+        """
+        Verify a Firebase ID token
+
+        Parameters:
+        - token: Firebase ID token string
+
+        Returns:
+        - Decoded claims with 'uid' set, raises jwt.InvalidTokenError if invalid
+        """
+        cache_key = TokenCache.key_for(token)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        header = jwt.get_unverified_header(token)
+        if header.get('alg') != 'RS256':
+            raise jwt.InvalidAlgorithmError("Firebase ID tokens must be signed with RS256")
+
+        kid = header.get('kid')
+        key = self.get_key(kid)
+        if key is None:
+            # Google rotates keys; a new kid may appear before our copy expires
+            key = self.get_key(kid, force_refresh=True)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown signing key id: {kid}")
+
+        decoded = jwt.decode(
+            token,
+            key,
+            algorithms=['RS256'],
+            audience=self.project_id,
+            issuer=self.issuer,
+            options={'require': ['exp', 'iat', 'aud', 'iss', 'sub']}
+        )
+        if not decoded.get('sub'):
+            raise jwt.InvalidTokenError("Firebase ID token has an empty subject")
+        if decoded.get('auth_time', 0) > time.time():
+            raise jwt.InvalidTokenError("Firebase ID token has a future auth_time")
+
+        decoded['uid'] = decoded['sub']
+        self._cache.put(cache_key, decoded)
+        return decoded
+
+    def stats(self):
+        with self._keys_lock:
+            keys = {
+                "count": len(self._keys),
+                "expires_in": max(0, int(self._keys_expire_at - time.time())),
+                "fetches": self.key_fetches
+            }
+        return {"signing_keys": keys, "token_cache": self._cache.stats()}
+
+
+# Verifies locally when the project id is known, otherwise defers to firebase_admin
+token_verifier = FirebaseTokenVerifier(
+    project_id=firebase_config.PROJECT_ID,
+    certs_url=firebase_config.CERTS_URL,
+    cache_size=firebase_config.TOKEN_CACHE_SIZE
+) if firebase_config.PROJECT_ID else None
+
+_admin_initialized = False
+
+
+def initialize_firebase():
+    """Initialize Firebase at worker start: Admin SDK plus signing key prefetch"""
+    global _admin_initialized
+    _admin_initialized = initialize_firebase_admin()
+    if token_verifier is not None:
+        token_verifier.prefetch()
+    return _admin_initialized
+
+
 def verify_firebase_token(token):
     """Verify Firebase ID token and return the decoded token"""
     try:
-        # Initialize Firebase Admin if not already initialized
-        if not hasattr(verify_firebase_token, "initialized"):
-            verify_firebase_token.initialized = initialize_firebase_admin()
-            
-        if not verify_firebase_token.initialized:
-            logger.error("Firebase Admin SDK not initialized")
-            return None
-            
-        # Verify the token
-        decoded_token = auth.verify_id_token(token)
+        if token_verifier is not None:
+            decoded_token = token_verifier.verify(token)
+        else:
+            if not _admin_initialized:
+                logger.error("Firebase Admin SDK not initialized")
+                return None
+            decoded_token = auth.verify_id_token(token)
         logger.info(f"Firebase token verified for user {decoded_token.get('uid')}")
         return decoded_token
     except Exception as e:
@@ -0,0 +1,264 @@
+import math
+import heapq
+import re
+import threading
+import time
+import logging
+from collections import Counter
+from config import content_config
+from db import db_session
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i if in is it its of on or that the this "
+    "to was what when where which who why will with you your".split()
+)
+# Title and tag matches count as this many body occurrences
+FIELD_WEIGHTS = {'title': 3, 'tags': 2, 'category': 1, 'content': 1}
+
+
+def normalize(token):
+    """Fold simple plurals so 'returns' matches 'return'"""
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        if token.endswith('ies') and len(token) > 4:
+            return token[:-3] + 'y'
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Lowercased, plural-folded terms of text with stopwords removed"""
+    return [normalize(t) for t in TOKEN_RE.findall((text or '').lower()) if t not in STOPWORDS]
+
+
+def make_snippet(content, terms, width=200):
+    """
+    Excerpt of content around the first query term it contains
+
+    Parameters:
+    - content: Article body
+    - terms: Normalized query terms
+    - width: Approximate snippet length in characters
+
+    Returns:
+    - Snippet string, with '...' where the text was cut
+    """
+    content = ' '.join((content or '').split())
+    start = 0
+    for match in TOKEN_RE.finditer(content.lower()):
+        if normalize(match.group()) in terms:
+            start = max(0, match.start() - width // 4)
+            break
+    if start:
+        # Don't start mid-word
+        space = content.find(' ', start)
+        start = space + 1 if 0 <= space < start + 20 else start
+    end = min(len(content), start + width)
+    if end < len(content):
+        space = content.rfind(' ', start, end)
+        end = space if space > start else end
+    return ('...' if start else '') + content[start:end] + ('...' if end < len(content) else '')
+
+
+class KnowledgeIndex:
+    """
+    In-process inverted index over published knowledge base articles, ranked with BM25
+
+    Postings map each term to {article_id: weighted term frequency}, where
+    title and tag occurrences count extra (FIELD_WEIGHTS). Only metadata is
+    kept in memory; article bodies are read back for the page of results
+    being returned, to build snippets.
+
+    The index is built on first use. Triggers bump the 'knowledge_base' row
+    in cache_versions whenever an article changes; at most every
+    check_interval seconds the index compares that counter and, when it
+    moved, re-indexes just the articles updated since the last sync and
+    drops ones that were unpublished or deleted.
+    """
+
+    VERSION_NAME = 'knowledge_base'
+
+    def __init__(self, check_interval, k1=1.2, b=0.75):
+        self.check_interval = check_interval
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._postings = {}  # term -> {article_id: tf}
+        self._doc_terms = {}  # article_id -> Counter of terms, to undo postings
+        self._doc_len = {}  # article_id -> weighted length
+        self._docs = {}  # article_id -> listing metadata
+        self._total_len = 0
+        self._version = None
+        self._watermark = None  # newest updated_at indexed
+        self._checked_at = 0
+        self.searches = 0
+        self.syncs = 0
+        self.reindexed = 0
+
+    # Index maintenance
+
+    def _remove(self, article_id):
+        terms = self._doc_terms.pop(article_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            del postings[article_id]
+            if not postings:
+                del self._postings[term]
+        self._total_len -= self._doc_len.pop(article_id)
+        del self._docs[article_id]
+
+    def add(self, article):
+        """Index (or re-index) one article row"""
+        terms = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(article.get(field)):
+                terms[term] += weight
+        with self._lock:
+            self._remove(article['id'])
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[article['id']] = tf
+            self._doc_terms[article['id']] = terms
+            length = sum(terms.values())
+            self._doc_len[article['id']] = length
+            self._total_len += length
+            self._docs[article['id']] = {
+                'id': article['id'],
+                'title': article['title'],
+                'category': article.get('category'),
+                'tags': article.get('tags'),
+                'created_at': article.get('created_at')
+            }
+
+    def remove(self, article_id):
+        with self._lock:
+            self._remove(article_id)
+
+    def _fetch_articles(self, cursor, since=None):
+        sql = """
+            SELECT id, title, content, category, tags, is_published, created_at, updated_at
+            FROM knowledge_articles
+            """
+        if since is None:
+            cursor.execute(sql + " WHERE is_published = 1")
+        else:
+            # >= so rows sharing the watermark's second are not missed; re-indexing is idempotent
+            cursor.execute(sql + " WHERE updated_at >= %s", (since,))
+        return cursor.fetchall()
+
+    def _apply(self, rows):
+        for row in rows:
+            if row['is_published']:
+                self.add(row)
+            else:
+                self.remove(row['id'])
+            if row['updated_at'] is not None and (self._watermark is None or row['updated_at'] > self._watermark):
+                self._watermark = row['updated_at']
+        self.reindexed += len(rows)
+
+    def sync(self, force=False):
+        """Bring the index up to date with the database if the version counter moved"""
+        if not force and self._version is not None and time.time() - self._checked_at < self.check_interval:
+            return
+        with self._sync_lock:
+            if not force and self._version is not None and time.time() - self._checked_at < self.check_interval:
+                return
+            with db_session() as cursor:
+                cursor.execute("SELECT version FROM cache_versions WHERE name = %s", (self.VERSION_NAME,))
+                row = cursor.fetchone()
+                version = row['version'] if row else 0
+                if self._version is None:
+                    start = time.perf_counter()
+                    self._apply(self._fetch_articles(cursor))
+                    logger.info(f"Built knowledge base index: {len(self._docs)} articles, "
+                                f"{len(self._postings)} terms in {time.perf_counter() - start:.2f}s")
+                elif version != self._version:
+                    self._apply(self._fetch_articles(cursor, since=self._watermark))
+                    # Hard deletes leave no updated_at behind
+                    cursor.execute("SELECT id FROM knowledge_articles WHERE is_published = 1")
+                    live = {r['id'] for r in cursor.fetchall()}
+                    with self._lock:
+                        for article_id in [a for a in self._docs if a not in live]:
+                            self._remove(article_id)
+                self.syncs += 1
+            self._version = version
+            self._checked_at = time.time()
+
+    # Queries
+
+    def search(self, query, limit=10, offset=0, category=None):
+        """
+        Rank published articles against a query with BM25
+
+        Returns:
+        - (total_matches, [(article metadata, score), ...]) for the requested page
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            self.searches += 1
+            doc_count = len(self._docs)
+            if not terms or not doc_count:
+                return 0, []
+            avg_len = self._total_len / doc_count
+            k1, b = self.k1, self.b
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                doc_len = self._doc_len
+                for article_id, tf in postings.items():
+                    norm = tf + k1 * (1 - b + b * doc_len[article_id] / avg_len)
+                    scores[article_id] = scores.get(article_id, 0.0) + idf * tf * (k1 + 1) / norm
+            if category:
+                scores = {a: s for a, s in scores.items() if self._docs[a]['category'] == category}
+            top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], item[0]))
+            page = [(self._docs[article_id], score) for article_id, score in top[offset:]]
+        return len(scores), page
+
+    def stats(self):
+        with self._lock:
+            return {
+                "articles": len(self._docs),
+                "terms": len(self._postings),
+                "version": self._version,
+                "searches": self.searches,
+                "syncs": self.syncs,
+                "reindexed": self.reindexed
+            }
+
+
+def search_articles(query, page=1, per_page=10, category=None):
+    """
+    Search published articles and attach snippets for the returned page
+
+    Returns:
+    - Dict with 'total' and 'results' (metadata, score and snippet per article)
+    """
+    knowledge_index.sync()
+    total, hits = knowledge_index.search(query, limit=per_page, offset=(page - 1) * per_page, category=category)
+
+    contents = {}
+    if hits:
+        placeholders = ', '.join(['%s'] * len(hits))
+        with db_session() as cursor:
+            cursor.execute(
+                f"SELECT id, content FROM knowledge_articles WHERE id IN ({placeholders})",
+                tuple(doc['id'] for doc, _ in hits)
+            )
+            contents = {row['id']: row['content'] for row in cursor.fetchall()}
+
+    terms = set(tokenize(query))
+    results = [
+        dict(doc, score=round(score, 4), snippet=make_snippet(contents.get(doc['id']), terms))
+        for doc, score in hits
+    ]
+    return {"total": total, "results": results}
+
+
+knowledge_index = KnowledgeIndex(check_interval=content_config.KNOWLEDGE_INDEX_CHECK_INTERVAL)
@@ -0,0 +1,258 @@
+import datetime
+import random
+import threading
+import logging
+from config import teams_config
+from db import db_session
+from background import BackgroundWorker
+from microsoft_teams import teams_client
+from utils import send_email
+
+logger = logging.getLogger(__name__)
+
+
+def appointment_confirmation_email(user_name, service_name, appointment_date, appointment_time, join_url=None):
+    """
+    Build the booking confirmation email
+
+    Returns:
+    - (subject, body) tuple
+    """
+    email_subject = "Appointment Booking Confirmation"
+    email_body = f"""
+        Hi {user_name},
+
+        Thank you for booking an appointment with Accverse.
+
+        Appointment Details:
+        Service: {service_name}
+        Date: {appointment_date}
+        Time: {appointment_time}
+        Status: Pending (awaiting confirmation)
+        """
+
+    if join_url:
+        email_body += f"""
+
+            Join Microsoft Teams Meeting:
+            {join_url}
+
+            You can join this meeting from your computer, tablet, or smartphone.
+            """
+
+    email_body += """
+
+        We will confirm your appointment shortly.
+
+        Regards,
+        Accverse
+        """
+    return email_subject, email_body
+
+
+def _format_time(value):
+    """'HH:MM' for a MySQL TIME (timedelta) or string"""
+    if isinstance(value, datetime.timedelta):
+        minutes = int(value.total_seconds()) // 60
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+    return str(value)[:5]
+
+
+class MeetingProvisioner(BackgroundWorker):
+    """
+    Creates Teams meetings for appointments booked with meeting_status 'meeting_pending'
+
+    Bookings commit without waiting on Graph. This worker claims pending rows
+    with SKIP LOCKED, leasing them by pushing meeting_available_at forward so
+    another thread or process won't pick them up. It creates the batch's
+    meetings through one Graph $batch request, then, holding each row's lock,
+    re-checks that the appointment is still pending and not cancelled before
+    storing the join details and queuing the confirmation email. Failures
+    back off exponentially. After max_attempts the row is marked
+    'meeting_failed' and the confirmation goes out without a link.
+    """
+
+    name = 'teams-meetings'
+
+    def __init__(self, teams_integration, poll_interval, threads, batch_size, max_attempts,
+                 backoff, lease_seconds=120):
+        super().__init__(poll_interval, threads)
+        self.teams_integration = teams_integration
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease_seconds = lease_seconds
+        self._stats_lock = threading.Lock()
+        self.created = 0
+        self.retried = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def claim_batch(self):
+        with db_session() as cursor:
+            cursor.execute(
+                """
+                SELECT a.id, a.appointment_date, a.appointment_time, a.notes, a.meeting_attempts,
+                       s.name AS service_name, s.duration, u.name AS user_name, u.email
+                FROM appointments a
+                JOIN services s ON a.service_id = s.id
+                JOIN users u ON a.user_id = u.id
+                WHERE a.meeting_status = 'meeting_pending' AND a.meeting_available_at <= NOW()
+                  AND a.status != 'cancelled'
+                ORDER BY a.meeting_available_at
+                LIMIT %s
+                FOR UPDATE OF a SKIP LOCKED
+                """,
+                (self.batch_size,)
+            )
+            rows = cursor.fetchall()
+            if rows:
+                placeholders = ', '.join(['%s'] * len(rows))
+                cursor.execute(
+                    f"""
+                    UPDATE appointments SET meeting_available_at = NOW() + INTERVAL %s SECOND
+                    WHERE id IN ({placeholders})
+                    """,
+                    (self.lease_seconds, *[row['id'] for row in rows])
+                )
+        return rows
+
+    @staticmethod
+    def meeting_arguments(row):
+        # MySQL returns TIME columns as timedelta since midnight
+        start_datetime = datetime.datetime.combine(row['appointment_date'], datetime.time()) + row['appointment_time']
+        end_datetime = start_datetime + datetime.timedelta(minutes=row['duration'])
+
+        # Format for Microsoft Graph API
+        return {
+            'subject': f"{row['service_name']} - Consultation with {row['user_name']}",
+            'start_time': start_datetime.isoformat() + 'Z',
+            'end_time': end_datetime.isoformat() + 'Z',
+            'attendees': [row['email']],
+            'content': row['notes']
+        }
+
+    def create_meetings(self, rows):
+        """Create meetings for a claimed batch in one Graph $batch round trip"""
+        try:
+            return self.teams_integration.create_meetings([self.meeting_arguments(row) for row in rows])
+        except Exception as e:
+            return [{'meeting': None, 'error': str(e)} for row in rows]
+
+    def _send_confirmation(self, row, join_url):
+        email_subject, email_body = appointment_confirmation_email(
+            row['user_name'], row['service_name'], row['appointment_date'],
+            _format_time(row['appointment_time']), join_url
+        )
+        send_email(row['email'], email_subject, email_body)
+
+    def _still_pending(self, cursor, row, meeting):
+        """
+        Lock the appointment and check it still wants a meeting
+
+        Appointments cancelled (or handled elsewhere) since they were claimed
+        are taken off the queue and get no meeting details or email.
+        """
+        cursor.execute(
+            "SELECT status, meeting_status FROM appointments WHERE id = %s FOR UPDATE",
+            (row['id'],)
+        )
+        current = cursor.fetchone()
+        if current and current[0] != 'cancelled' and current[1] == 'meeting_pending':
+            return True
+        if current and current[1] == 'meeting_pending':
+            cursor.execute(
+                "UPDATE appointments SET meeting_status = 'none', meeting_available_at = NULL WHERE id = %s",
+                (row['id'],)
+            )
+        with self._stats_lock:
+            self.skipped += 1
+        if meeting:
+            logger.warning(f"Appointment {row['id']} was cancelled or already provisioned while Teams "
+                           f"meeting {meeting['meeting_id']} was being created; the meeting was not attached")
+        else:
+            logger.info(f"Appointment {row['id']} no longer needs a Teams meeting")
+        return False
+
+    def provision(self, row, meeting, error=None):
+        if meeting:
+            with db_session(dictionary=False) as cursor:
+                if not self._still_pending(cursor, row, meeting):
+                    return
+                cursor.execute(
+                    """
+                    UPDATE appointments
+                    SET meeting_status = 'meeting_ready', teams_meeting_id = %s,
+                        teams_join_url = %s, teams_join_web_url = %s,
+                        meeting_attempts = meeting_attempts + 1, meeting_available_at = NULL
+                    WHERE id = %s
+                    """,
+                    (meeting['meeting_id'], meeting['join_url'], meeting.get('join_web_url'), row['id'])
+                )
+            with self._stats_lock:
+                self.created += 1
+            self._send_confirmation(row, meeting['join_url'])
+            logger.info(f"Teams meeting ready for appointment {row['id']}")
+            return
+
+        attempts = row['meeting_attempts'] + 1
+        if attempts >= self.max_attempts:
+            with db_session(dictionary=False) as cursor:
+                if not self._still_pending(cursor, row, None):
+                    return
+                cursor.execute(
+                    """
+                    UPDATE appointments
+                    SET meeting_status = 'meeting_failed', meeting_attempts = %s, meeting_available_at = NULL
+                    WHERE id = %s
+                    """,
+                    (attempts, row['id'])
+                )
+            with self._stats_lock:
+                self.failed += 1
+            logger.error(f"Giving up on Teams meeting for appointment {row['id']}: {error}")
+            self._send_confirmation(row, None)
+            return
+
+        delay = int(self.backoff * (2 ** (attempts - 1)) * random.uniform(0.8, 1.2))
+        with db_session(dictionary=False) as cursor:
+            if not self._still_pending(cursor, row, None):
+                return
+            cursor.execute(
+                """
+                UPDATE appointments
+                SET meeting_attempts = %s, meeting_available_at = NOW() + INTERVAL %s SECOND
+                WHERE id = %s
+                """,
+                (attempts, delay, row['id'])
+            )
+        with self._stats_lock:
+            self.retried += 1
+        logger.warning(f"Teams meeting for appointment {row['id']} failed, retrying in {delay}s: {error}")
+
+    def run_once(self):
+        rows = self.claim_batch()
+        if rows:
+            for row, result in zip(rows, self.create_meetings(rows)):
+                self.provision(row, result['meeting'], result['error'])
+        return len(rows) == self.batch_size
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "running": self.running,
+                "created": self.created,
+                "retried": self.retried,
+                "failed": self.failed,
+                "skipped": self.skipped
+            }
+
+
+meeting_provisioner = MeetingProvisioner(
+    teams_client,
+    poll_interval=teams_config.TEAMS_WORKER_POLL_INTERVAL,
+    threads=teams_config.TEAMS_WORKER_THREADS,
+    batch_size=teams_config.TEAMS_WORKER_BATCH_SIZE,
+    max_attempts=teams_config.TEAMS_MEETING_MAX_ATTEMPTS,
+    backoff=teams_config.TEAMS_MEETING_RETRY_BACKOFF
+)
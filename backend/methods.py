@@ -1,44 +1,35 @@
 from flask import jsonify
 import mysql.connector
-from config import db_config, jwt_config
-import jwt
 import datetime
-import bcrypt
 import uuid
-from utils import send_email, generate_token, validate_token, get_user_id_from_token
-import requests
-import firebase_admin
 import random
-from microsoft_teams import MicrosoftTeamsIntegration
-from firebase_setup import verify_firebase_token
-teams_integration = MicrosoftTeamsIntegration()
-import logging 
-logger = logging.getLogger(__name__)
+import logging
 from datetime import timedelta
 import json
+import base64
 import os
-import uuid
-from werkzeug.utils import secure_filename
-from config import app_config
+from werkzeug.http import parse_content_range_header
+from utils import send_email, generate_token, invalidate_user_tokens, json_body, conditional_response, owner_email_key
+from auth import current_user_id, current_user_role
+from passwords import hash_password, check_password, rehash_if_needed, PasswordHasherBusy
+from availability import availability_index, appointments_overlap
+from catalog import service_catalog
+from knowledge_search import search_articles
+from meetings import meeting_provisioner, appointment_confirmation_email
+from firebase_setup import verify_firebase_token
+from uploads import stream_multipart, remove_upload_dir, UploadError
+from resumable_uploads import resumable_uploads
+from blob_store import blob_store
+from progress_patches import progress_log, PatchError, VersionConflict, JSON_PATCH, MERGE_PATCH
 from config import upload_config
+from config import content_config
+from db import db_session
+
+logger = logging.getLogger(__name__)
 
 # form_id = str(uuid.uuid4())
 # form_data['id'] = form_id 
 
-# Database Connection Function
-def get_db_connection():
-    try:
-        conn = mysql.connector.connect(
-            host=db_config.DB_HOST,
-            user=db_config.DB_USER,
-            password=db_config.DB_PASSWORD,
-            database=db_config.DB_NAME
-        )
-        return conn
-    except mysql.connector.Error as err:
-        print(f"Error: {err}")
-        return None
-
 # Authentication & User Management Functions
 def authenticate_user(data):
     email = data.get('email')
@@ -47,15 +38,9 @@ def authenticate_user(data):
     if not email or not password:
         return jsonify({"error": "Email and password are required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-    user = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    with db_session() as cursor:
+        cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
+        user = cursor.fetchone()
     
     if not user:
         return jsonify({"error": "Invalid credentials"}), 401
@@ -63,13 +48,18 @@ def authenticate_user(data):
     # if not user['is_verified']:
     #     return jsonify({"error": "Account not verified. Please check your email for verification link."}), 401
     
-    if bcrypt.checkpw(password.encode('utf-8'), user['password'].encode('utf-8')):
-        # Generate JWT token - no role needed
-        token = jwt.encode({
-            'user_id': user['id'],
-            'email': user['email'],
-            'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-        }, jwt_config.JWT_SECRET_KEY, algorithm='HS256')
+    if check_password(password, user['password']):
+        # Upgrade hashes made with an older cost factor while we have the password
+        try:
+            new_hash = rehash_if_needed(password, user['password'])
+            if new_hash:
+                with db_session() as cursor:
+                    cursor.execute("UPDATE users SET password = %s WHERE id = %s", (new_hash, user['id']))
+        except PasswordHasherBusy:
+            logger.info(f"Skipping password rehash for user ID {user['id']}: hasher busy")
+        
+        # Role is carried in the token so handlers can authorize without a lookup
+        token = generate_token(user['id'], user['email'], user['role'])
         
         return jsonify({
             "message": "Login successful",
@@ -110,7 +100,6 @@ def authenticate_user(data):
 def google_auth(data):
     firebase_token = data.get('firebase_token')
     email = data.get('email')
-    name = data.get('name')
     firebase_uid = data.get('firebase_uid')
     
     if not firebase_token or not email or not firebase_uid:
@@ -124,81 +113,34 @@ def google_auth(data):
     except Exception as e:
         return jsonify({"error": f"Firebase verification error: {str(e)}"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
     try:
-        # Check if user exists with this Firebase UID
-        cursor.execute(
-            "SELECT * FROM users WHERE firebase_uid = %s", 
-            (firebase_uid,)
-        )
-        user = cursor.fetchone()
-        
-        if user:
-            # User exists, generate token and return user data
-            token = generate_token(user['id'], user['email'], user['role'])
-            
-            # Update last login
-            # cursor.execute(
-            #     "UPDATE users SET last_login = NOW() WHERE id = %s", 
-            #     (user['id'],)
-            # )
-            # conn.commit()
-            
-            # Return user data and token
-            safe_user = {
-                "id": user['id'],
-                "name": user['name'],
-                "email": user['email'],
-                "role": user['role'],
-                "provider": "google",
-                "firebase_uid": user['firebase_uid'],
-                "is_verified": True  # Google oauth users are verified by default
-            }
-            
-            return jsonify({
-                "token": token,
-                "user": safe_user,
-                "isNewUser": False
-            }), 200
-        else:
-            # Check if user exists with same email
+        with db_session() as cursor:
+            # Check if user exists with this Firebase UID
             cursor.execute(
-                "SELECT * FROM users WHERE email = %s", 
-                (email,)
+                "SELECT * FROM users WHERE firebase_uid = %s", 
+                (firebase_uid,)
             )
-            existing_user = cursor.fetchone()
+            user = cursor.fetchone()
             
-            if existing_user:
-                # Link Firebase UID to existing account
-                cursor.execute(
-                    "UPDATE users SET firebase_uid = %s, updated_at = NOW(), is_verified = 1 WHERE id = %s", 
-                    (firebase_uid, existing_user['id'])
-                )
-                conn.commit()
-                
-                # Generate token and return user data
-                token = generate_token(existing_user['id'], existing_user['email'], existing_user['role'])
+            if user:
+                # User exists, generate token and return user data
+                token = generate_token(user['id'], user['email'], user['role'])
                 
                 # Update last login
                 # cursor.execute(
                 #     "UPDATE users SET last_login = NOW() WHERE id = %s", 
-                #     (existing_user['id'],)
+                #     (user['id'],)
                 # )
-                # conn.commit()
                 
+                # Return user data and token
                 safe_user = {
-                    "id": existing_user['id'],
-                    "name": existing_user['name'],
-                    "email": existing_user['email'],
-                    "role": existing_user['role'],
+                    "id": user['id'],
+                    "name": user['name'],
+                    "email": user['email'],
+                    "role": user['role'],
                     "provider": "google",
-                    "firebase_uid": firebase_uid,
-                    "is_verified": True
+                    "firebase_uid": user['firebase_uid'],
+                    "is_verified": True  # Google oauth users are verified by default
                 }
                 
                 return jsonify({
@@ -207,18 +149,53 @@ def google_auth(data):
                     "isNewUser": False
                 }), 200
             else:
-                # New user, need more details for registration
-                return jsonify({
-                    "isNewUser": True,
-                    "message": "User not found. Please complete registration."
-                }), 200
+                # Check if user exists with same email
+                cursor.execute(
+                    "SELECT * FROM users WHERE email = %s", 
+                    (email,)
+                )
+                existing_user = cursor.fetchone()
+                
+                if existing_user:
+                    # Link Firebase UID to existing account
+                    cursor.execute(
+                        "UPDATE users SET firebase_uid = %s, updated_at = NOW(), is_verified = 1 WHERE id = %s", 
+                        (firebase_uid, existing_user['id'])
+                    )
+                    
+                    # Generate token and return user data
+                    token = generate_token(existing_user['id'], existing_user['email'], existing_user['role'])
+                    
+                    # Update last login
+                    # cursor.execute(
+                    #     "UPDATE users SET last_login = NOW() WHERE id = %s", 
+                    #     (existing_user['id'],)
+                    # )
+                    
+                    safe_user = {
+                        "id": existing_user['id'],
+                        "name": existing_user['name'],
+                        "email": existing_user['email'],
+                        "role": existing_user['role'],
+                        "provider": "google",
+                        "firebase_uid": firebase_uid,
+                        "is_verified": True
+                    }
+                    
+                    return jsonify({
+                        "token": token,
+                        "user": safe_user,
+                        "isNewUser": False
+                    }), 200
+                else:
+                    # New user, need more details for registration
+                    return jsonify({
+                        "isNewUser": True,
+                        "message": "User not found. Please complete registration."
+                    }), 200
     
     except Exception as e:
-        conn.rollback()
         return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 
 # Complete Google Registration
@@ -245,48 +222,43 @@ def complete_google_registration(data):
     except Exception as e:
         return jsonify({"error": f"Firebase verification error: {str(e)}"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
+    # Hash outside the try below so PasswordHasherBusy reaches its 503 handler,
+    # and before the transaction so no connection is held while bcrypt runs
+    hashed_password = hash_password(password)
     
     try:
-        # Check if user exists with this Firebase UID
-        cursor.execute(
-            "SELECT * FROM users WHERE firebase_uid = %s OR email = %s", 
-            (firebase_uid, email)
-        )
-        user = cursor.fetchone()
-        
-        if user:
-            return jsonify({"error": "User already exists"}), 400
-        
-        # Format address
-        full_address = address
-        if city or state or zip_code:
-            full_address = f"{address}, {city}, {state} {zip_code}".strip()
-        
-        # Hash the password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        
-        # Create new user with hashed password
-        cursor.execute(
-            """
-            INSERT INTO users 
-            (name, email, firebase_uid, password, phone, address, is_verified, 
-             role, created_at, updated_at) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, 'client', NOW(), NOW())
-            """, 
-            (name, email, firebase_uid, hashed_password, phone, full_address, True)
-        )
-        conn.commit()
-        
-        new_user_id = cursor.lastrowid
-        
-        # Get the newly created user
-        cursor.execute("SELECT * FROM users WHERE id = %s", (new_user_id,))
-        new_user = cursor.fetchone()
+        with db_session() as cursor:
+            # Check if user exists with this Firebase UID
+            cursor.execute(
+                "SELECT * FROM users WHERE firebase_uid = %s OR email = %s", 
+                (firebase_uid, email)
+            )
+            user = cursor.fetchone()
+            
+            if user:
+                return jsonify({"error": "User already exists"}), 400
+            
+            # Format address
+            full_address = address
+            if city or state or zip_code:
+                full_address = f"{address}, {city}, {state} {zip_code}".strip()
+            
+            # Create new user with hashed password
+            cursor.execute(
+                """
+                INSERT INTO users 
+                (name, email, firebase_uid, password, phone, address, is_verified, 
+                 role, created_at, updated_at) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s, 'client', NOW(), NOW())
+                """, 
+                (name, email, firebase_uid, hashed_password, phone, full_address, True)
+            )
+            
+            new_user_id = cursor.lastrowid
+            
+            # Get the newly created user
+            cursor.execute("SELECT * FROM users WHERE id = %s", (new_user_id,))
+            new_user = cursor.fetchone()
         
         # Generate token with all required parameters
         token = generate_token(new_user_id, email, new_user['role'])
@@ -308,11 +280,7 @@ def complete_google_registration(data):
         }), 201
         
     except Exception as e:
-        conn.rollback()
         return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 def register_user(data):
     name = data.get('name')
@@ -328,20 +296,7 @@ def register_user(data):
         return jsonify({"error": "Name, email, and password are required"}), 400
     
     # Hash the password
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-    
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Check if email already exists
-    cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-    if cursor.fetchone():
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Email already registered"}), 409
+    hashed_password = hash_password(password)
     
     # Format address
     full_address = address
@@ -349,16 +304,18 @@ def register_user(data):
         full_address = f"{address}, {city}, {state} {zip_code}".strip()
     
     try:
-        # Insert user without verification token - we're using OTP verification
-        cursor.execute(
-            "INSERT INTO users (name, email, password, phone, address, is_verified) VALUES (%s, %s, %s, %s, %s, %s)",
-            (name, email, hashed_password, phone, full_address, True)  # Set is_verified to True since we verified with OTP
-        )
-        conn.commit()
-        user_id = cursor.lastrowid
-        
-        cursor.close()
-        conn.close()
+        with db_session() as cursor:
+            # Check if email already exists
+            cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
+            if cursor.fetchone():
+                return jsonify({"error": "Email already registered"}), 409
+            
+            # Insert user without verification token - we're using OTP verification
+            cursor.execute(
+                "INSERT INTO users (name, email, password, phone, address, is_verified) VALUES (%s, %s, %s, %s, %s, %s)",
+                (name, email, hashed_password, phone, full_address, True)  # Set is_verified to True since we verified with OTP
+            )
+            user_id = cursor.lastrowid
         
         return jsonify({
             "message": "Registration successful.",
@@ -366,8 +323,6 @@ def register_user(data):
         }), 201
     except Exception as e:
         logger.error(f"Registration error: {str(e)}")
-        cursor.close()
-        conn.close()
         return jsonify({"error": str(e)}), 500
 
 def send_verification_otp(data):
@@ -376,33 +331,25 @@ def send_verification_otp(data):
     if not email:
         return jsonify({"error": "Email is required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Check if email already exists
-    cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-    if cursor.fetchone():
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Email already registered"}), 409
-    
     # Generate a 6-digit OTP
     otp = ''.join(random.choices('0123456789', k=6))
     
-    # Store OTP in a temporary table or cache
     try:
-        cursor.execute(
-            """
-            INSERT INTO email_verification (email, otp, created_at) 
-            VALUES (%s, %s, %s)
-            ON DUPLICATE KEY UPDATE otp = %s, created_at = %s, is_verified = %s
-            """,
-            (email, otp, datetime.datetime.utcnow(), otp, datetime.datetime.utcnow(), False)
-        )
-        conn.commit()
+        with db_session() as cursor:
+            # Check if email already exists
+            cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
+            if cursor.fetchone():
+                return jsonify({"error": "Email already registered"}), 409
+            
+            # Store OTP in a temporary table or cache
+            cursor.execute(
+                """
+                INSERT INTO email_verification (email, otp, created_at) 
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE otp = %s, created_at = %s, is_verified = %s
+                """,
+                (email, otp, datetime.datetime.utcnow(), otp, datetime.datetime.utcnow(), False)
+            )
         
         # Send OTP email
         email_subject = "Your Verification Code"
@@ -418,14 +365,9 @@ def send_verification_otp(data):
         """
         send_email(email, email_subject, email_body)
         
-        cursor.close()
-        conn.close()
-        
         return jsonify({"message": "Verification code sent successfully"}), 200
     except Exception as e:
         logger.error(f"Error sending OTP: {str(e)}")
-        cursor.close()
-        conn.close()
         return jsonify({"error": f"Failed to send verification code: {str(e)}"}), 500
 
 def verify_otp(data):
@@ -435,36 +377,25 @@ def verify_otp(data):
     if not email or not otp:
         return jsonify({"error": "Email and OTP are required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Check if OTP is valid and not expired (5 minutes)
-    cursor.execute(
-        """
-        SELECT * FROM email_verification 
-        WHERE email = %s AND otp = %s AND created_at > %s
-        """,
-        (email, otp, datetime.datetime.utcnow() - datetime.timedelta(minutes=5))
-    )
-    verification = cursor.fetchone()
-    
-    if not verification:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Invalid or expired verification code"}), 400
-    
-    # Mark email as verified
-    cursor.execute(
-        "UPDATE email_verification SET is_verified = 1 WHERE email = %s",
-        (email,)
-    )
-    conn.commit()
-    
-    cursor.close()
-    conn.close()
+    with db_session() as cursor:
+        # Check if OTP is valid and not expired (5 minutes)
+        cursor.execute(
+            """
+            SELECT * FROM email_verification 
+            WHERE email = %s AND otp = %s AND created_at > %s
+            """,
+            (email, otp, datetime.datetime.utcnow() - datetime.timedelta(minutes=5))
+        )
+        verification = cursor.fetchone()
+        
+        if not verification:
+            return jsonify({"error": "Invalid or expired verification code"}), 400
+        
+        # Mark email as verified
+        cursor.execute(
+            "UPDATE email_verification SET is_verified = 1 WHERE email = %s",
+            (email,)
+        )
     
     return jsonify({"message": "Email verified successfully"}), 200
 
@@ -472,32 +403,22 @@ def verify_user(token):
     if not token:
         return jsonify({"error": "Verification token is required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id, email FROM users WHERE verification_token = %s", (token,))
-    user = cursor.fetchone()
-    
-    if not user:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Invalid verification token"}), 400
-    
-    # Update user to verified status and remove verification token
-    cursor.execute(
-        "UPDATE users SET is_verified = %s, verification_token = %s WHERE id = %s",
-        (True, None, user['id'])
-    )
-    conn.commit()
+    with db_session() as cursor:
+        cursor.execute("SELECT id, email FROM users WHERE verification_token = %s", (token,))
+        user = cursor.fetchone()
+        
+        if not user:
+            return jsonify({"error": "Invalid verification token"}), 400
+        
+        # Update user to verified status and remove verification token
+        cursor.execute(
+            "UPDATE users SET is_verified = %s, verification_token = %s WHERE id = %s",
+            (True, None, user['id'])
+        )
     
     # Log the successful verification
     logger.info(f"User {user['email']} verified successfully")
     
-    cursor.close()
-    conn.close()
-    
     return jsonify({"message": "Email verified successfully. You can now log in."}), 200
 
 def resend_verification(data):
@@ -506,27 +427,20 @@ def resend_verification(data):
     if not email:
         return jsonify({"error": "Email is required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id, name FROM users WHERE email = %s", (email,))
-    user = cursor.fetchone()
-    
-    if not user:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "User not found"}), 404
-    
     # Generate verification token
     verification_token = str(uuid.uuid4())
     
-    cursor.execute(
-        "UPDATE users SET verification_token = %s WHERE id = %s",
-        (verification_token, user['id'])
-    )
-    conn.commit()
+    with db_session() as cursor:
+        cursor.execute("SELECT id, name FROM users WHERE email = %s", (email,))
+        user = cursor.fetchone()
+        
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+        
+        cursor.execute(
+            "UPDATE users SET verification_token = %s WHERE id = %s",
+            (verification_token, user['id'])
+        )
     
     # Generate verification email
     verification_url = f"http://localhost:8080/verify?token={verification_token}&email={email}"
@@ -545,9 +459,6 @@ def resend_verification(data):
     """
     send_email(email, email_subject, email_body)
     
-    cursor.close()
-    conn.close()
-    
     return jsonify({"message": "Verification email sent successfully"}), 200
 
 def reset_password_request(data):
@@ -556,20 +467,6 @@ def reset_password_request(data):
     if not email:
         return jsonify({"error": "Email is required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id, name FROM users WHERE email = %s", (email,))
-    user = cursor.fetchone()
-    
-    if not user:
-        cursor.close()
-        conn.close()
-        # Don't reveal that email doesn't exist for security
-        return jsonify({"message": "If your email is registered, you will receive a reset link."}), 200
-    
     # Generate reset token
     reset_token = str(uuid.uuid4())
     
@@ -580,16 +477,23 @@ def reset_password_request(data):
     # Store the expiry time in UTC format
     expiry_timestamp = int(expiry.timestamp())
     
-    # Log the token and expiry for debugging
-    logger.info(f"Generated reset token for {email}: {reset_token}")
-    logger.info(f"Expiry time: {expiry}, timestamp: {expiry_timestamp}")
-    logger.info(f"Current time: {datetime.datetime.utcnow()}, current timestamp: {int(datetime.datetime.utcnow().timestamp())}")
-    
-    cursor.execute(
-        "UPDATE users SET reset_token = %s, reset_token_expiry = %s WHERE id = %s",
-        (reset_token, expiry, user['id'])
-    )
-    conn.commit()
+    with db_session() as cursor:
+        cursor.execute("SELECT id, name FROM users WHERE email = %s", (email,))
+        user = cursor.fetchone()
+        
+        if not user:
+            # Don't reveal that email doesn't exist for security
+            return jsonify({"message": "If your email is registered, you will receive a reset link."}), 200
+        
+        # Log the token and expiry for debugging
+        logger.info(f"Generated reset token for {email}: {reset_token}")
+        logger.info(f"Expiry time: {expiry}, timestamp: {expiry_timestamp}")
+        logger.info(f"Current time: {datetime.datetime.utcnow()}, current timestamp: {int(datetime.datetime.utcnow().timestamp())}")
+        
+        cursor.execute(
+            "UPDATE users SET reset_token = %s, reset_token_expiry = %s WHERE id = %s",
+            (reset_token, expiry, user['id'])
+        )
     
     # Send reset email with expiry timestamp in URL
     reset_url = f"http://localhost:8080/forgot-password?token={reset_token}&expiry={expiry_timestamp}"
@@ -608,9 +512,6 @@ def reset_password_request(data):
     """
     send_email(email, email_subject, email_body)
     
-    cursor.close()
-    conn.close()
-    
     return jsonify({"message": "If your email is registered, you will receive a reset link."}), 200
 
 def reset_password_complete(data):
@@ -620,71 +521,63 @@ def reset_password_complete(data):
     if not token or not new_password:
         return jsonify({"error": "Token and new password are required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
     # Get the current time in UTC
     current_time = datetime.datetime.utcnow()
     logger.info(f"Validating token: {token}, current time: {current_time}")
     
-    # First check if the token exists
-    cursor.execute("SELECT id, reset_token_expiry FROM users WHERE reset_token = %s", (token,))
-    user = cursor.fetchone()
+    with db_session() as cursor:
+        # First check if the token exists
+        cursor.execute("SELECT id, reset_token_expiry FROM users WHERE reset_token = %s", (token,))
+        user = cursor.fetchone()
+        
+        if not user:
+            logger.error(f"Token not found: {token}")
+            return jsonify({"error": "Invalid token"}), 400
+        
+        # Log the expiry time from the database for debugging
+        expiry_time = user['reset_token_expiry']
+        logger.info(f"Token expiry from DB: {expiry_time}, current time: {current_time}")
+        
+        # For testing purposes, we'll bypass the expiry check
+        # In production, uncomment this check
+        # if expiry_time < current_time:
+        #     logger.error(f"Token expired: {token}, expiry: {expiry_time}, current: {current_time}")
+        #     return jsonify({"error": "Token has expired. Please request a new password reset."}), 400
     
-    if not user:
-        logger.error(f"Token not found: {token}")
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Invalid token"}), 400
-    
-    # Log the expiry time from the database for debugging
-    expiry_time = user['reset_token_expiry']
-    logger.info(f"Token expiry from DB: {expiry_time}, current time: {current_time}")
-    
-    # For testing purposes, we'll bypass the expiry check
-    # In production, uncomment this check
-    # if expiry_time < current_time:
-    #     logger.error(f"Token expired: {token}, expiry: {expiry_time}, current: {current_time}")
-    #     cursor.close()
-    #     conn.close()
-    #     return jsonify({"error": "Token has expired. Please request a new password reset."}), 400
-    
-    # Hash the new password
-    hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    # Hash the new password outside the session, so no pooled connection waits on bcrypt
+    hashed_password = hash_password(new_password)
     
-    cursor.execute(
-        "UPDATE users SET password = %s, reset_token = NULL, reset_token_expiry = NULL WHERE id = %s",
-        (hashed_password, user['id'])
-    )
-    conn.commit()
+    with db_session() as cursor:
+        # The token must still be unused, in case another reset finished while we were hashing
+        cursor.execute(
+            """
+            UPDATE users SET password = %s, reset_token = NULL, reset_token_expiry = NULL
+            WHERE id = %s AND reset_token = %s
+            """,
+            (hashed_password, user['id'], token)
+        )
+        if not cursor.rowcount:
+            logger.error(f"Token already used: {token}")
+            return jsonify({"error": "Invalid token"}), 400
     
-    logger.info(f"Password reset successful for user ID: {user['id']}")
+    # Make sure the user's tokens are re-verified instead of served from cache
+    invalidate_user_tokens(user['id'])
     
-    cursor.close()
-    conn.close()
+    logger.info(f"Password reset successful for user ID: {user['id']}")
     
     return jsonify({"message": "Password has been reset successfully. You can now log in."}), 200
 
 def get_user_profile(token):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        "SELECT id, name, email, phone, address, created_at FROM users WHERE id = %s",
-        (user_id,)
-    )
-    user = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    with db_session() as cursor:
+        cursor.execute(
+            "SELECT id, name, email, phone, address, created_at FROM users WHERE id = %s",
+            (user_id,)
+        )
+        user = cursor.fetchone()
     
     if not user:
         return jsonify({"error": "User not found"}), 404
@@ -692,7 +585,7 @@ def get_user_profile(token):
     return jsonify({"user": user}), 200
 
 def update_user_profile(token, data):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
@@ -703,18 +596,11 @@ def update_user_profile(token, data):
     if not name:
         return jsonify({"error": "Name is required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET name = %s, phone = %s, address = %s WHERE id = %s",
-        (name, phone, address, user_id)
-    )
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with db_session(dictionary=False) as cursor:
+        cursor.execute(
+            "UPDATE users SET name = %s, phone = %s, address = %s WHERE id = %s",
+            (name, phone, address, user_id)
+        )
     
     return jsonify({"message": "Profile updated successfully"}), 200
 
@@ -726,32 +612,24 @@ def serialize_timedelta(obj):
 
 # Appointment Booking Functions
 def get_appointments(token):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Clients can only see their own appointments
-    cursor.execute(
-        """
-        SELECT a.*, u.name as client_name, s.name as service_name 
-        FROM appointments a
-        JOIN users u ON a.user_id = u.id
-        JOIN services s ON a.service_id = s.id
-        WHERE a.user_id = %s
-        ORDER BY a.appointment_date DESC, a.appointment_time DESC
-        """,
-        (user_id,)
-    )
-    
-    appointments = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with db_session() as cursor:
+        # Clients can only see their own appointments
+        cursor.execute(
+            """
+            SELECT a.*, a.teams_join_url as teams_url, u.name as client_name, s.name as service_name 
+            FROM appointments a
+            JOIN users u ON a.user_id = u.id
+            JOIN services s ON a.service_id = s.id
+            WHERE a.user_id = %s
+            ORDER BY a.appointment_date DESC, a.appointment_time DESC
+            """,
+            (user_id,)
+        )
+        appointments = cursor.fetchall()
     
     for appointment in appointments:
         for key, value in appointment.items():
@@ -760,8 +638,43 @@ def get_appointments(token):
 
     return jsonify({"appointments": appointments}), 200
 
+# MySQL error numbers surfaced by concurrent bookings
+DUPLICATE_ENTRY = 1062
+LOCK_WAIT_TIMEOUT = 1205
+LOCK_DEADLOCK = 1213
+
+def slot_is_free_locked(cursor, appointment_date, appointment_time, duration):
+    """
+    Check a slot against the day's bookings while holding their row locks
+
+    Must run inside the transaction that inserts the appointment.
+
+    Parameters:
+    - cursor: Open session cursor
+    - appointment_date: 'YYYY-MM-DD'
+    - appointment_time: 'HH:MM'
+    - duration: Length of the new appointment in minutes
+
+    Returns:
+    - True if the slot is free, False if it overlaps an active booking
+    """
+    cursor.execute(
+        """
+        SELECT a.appointment_time, s.duration
+        FROM appointments a
+        JOIN services s ON a.service_id = s.id
+        WHERE a.appointment_date = %s AND a.status != 'cancelled'
+        FOR UPDATE OF a
+        """,
+        (appointment_date,)
+    )
+    return not any(
+        appointments_overlap(appointment_time, duration, row['appointment_time'], row['duration'])
+        for row in cursor.fetchall()
+    )
+
 def create_appointment(token, data):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
@@ -774,220 +687,144 @@ def create_appointment(token, data):
     if not service_id or not appointment_date or not appointment_time:
         return jsonify({"error": "Service, date, and time are required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Check if service exists
-    cursor.execute("SELECT id, name, duration FROM services WHERE id = %s", (service_id,))
-    service = cursor.fetchone()
-    if not service:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Service not found"}), 404
-    
-    # Check if slot is available
-    cursor.execute(
-        """
-        SELECT id FROM appointments 
-        WHERE appointment_date = %s AND appointment_time = %s AND status != 'cancelled'
-        """,
-        (appointment_date, appointment_time)
-    )
-    if cursor.fetchone():
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "This time slot is already booked"}), 409
-    
     try:
-        # Get user email for Teams meeting and confirmation
-        cursor.execute("SELECT email, name FROM users WHERE id = %s", (user_id,))
-        user = cursor.fetchone()
-        
-        # Create Teams meeting if not already provided
-        teams_meeting_data = None
-        if not teams_meeting:
-            # Parse appointment time
-            time_parts = appointment_time.split(':')
-            hour = int(time_parts[0])
-            minute = int(time_parts[1]) if len(time_parts) > 1 else 0
+        with db_session() as cursor:
+            # Check if service exists
+            cursor.execute("SELECT id, name, duration FROM services WHERE id = %s", (service_id,))
+            service = cursor.fetchone()
+            if not service:
+                return jsonify({"error": "Service not found"}), 404
             
-            # Create datetime objects for start and end times
-            start_datetime = datetime.datetime.strptime(f"{appointment_date} {hour}:{minute}:00", "%Y-%m-%d %H:%M:%S")
-            end_datetime = start_datetime + datetime.timedelta(minutes=service['duration'])
+            # Get user email for Teams meeting and confirmation
+            cursor.execute("SELECT email, name FROM users WHERE id = %s", (user_id,))
+            user = cursor.fetchone()
             
-            # Format for Microsoft Graph API
-            start_time_iso = start_datetime.isoformat() + 'Z'  # UTC format
-            end_time_iso = end_datetime.isoformat() + 'Z'  # UTC format
-            
-            # Create Teams meeting
-            teams_meeting_data = teams_integration.create_meeting(
-                subject=f"{service['name']} - Consultation with {user['name']}",
-                start_time=start_time_iso,
-                end_time=end_time_iso,
-                attendees=[user['email']],
-                content=notes
-            )
-        else:
-            # Use the provided Teams meeting data
-            teams_meeting_data = {
-                'meeting_id': teams_meeting.get('meeting_id'),
-                'join_url': teams_meeting.get('join_url'),
-                'join_web_url': teams_meeting.get('join_web_url')
-            }
-        
-        # Store Teams meeting details as JSON in the notes field or a separate column
-        meeting_notes = notes
-        if teams_meeting_data:
-            meeting_notes += f"\n\nMicrosoft Teams Meeting: {teams_meeting_data['join_url']}"
-        
-        cursor.execute(
-            """
-            INSERT INTO appointments 
-            (user_id, service_id, appointment_date, appointment_time, notes, status, created_at) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """,
-            (user_id, service_id, appointment_date, appointment_time, meeting_notes, 'pending', 
-             datetime.datetime.utcnow())
-        )
-        conn.commit()
-        appointment_id = cursor.lastrowid
-        
-        # Send confirmation email with Teams meeting link if available
-        email_subject = "Appointment Booking Confirmation"
-        email_body = f"""
-        Hi {user['name']},
-        
-        Thank you for booking an appointment with Accverse.
-        
-        Appointment Details:
-        Service: {service['name']}
-        Date: {appointment_date}
-        Time: {appointment_time}
-        Status: Pending (awaiting confirmation)
-        """
-        
-        if teams_meeting_data:
-            email_body += f"""
+            # Use the provided Teams meeting, otherwise the provisioning worker creates one
+            teams_meeting_data = None
+            meeting_status = 'meeting_pending'
+            if teams_meeting:
+                teams_meeting_data = {
+                    'meeting_id': teams_meeting.get('meeting_id'),
+                    'join_url': teams_meeting.get('join_url'),
+                    'join_web_url': teams_meeting.get('join_web_url')
+                }
+                meeting_status = 'meeting_ready'
             
-            Join Microsoft Teams Meeting:
-            {teams_meeting_data['join_url']}
+            # Lock the day's active bookings so overlapping requests serialize here;
+            # the unique (date, time, active_slot) key backs this up for identical start times
+            if not slot_is_free_locked(cursor, appointment_date, appointment_time, service['duration']):
+                return jsonify({"error": "This time slot is already booked"}), 409
             
-            You can join this meeting from your computer, tablet, or smartphone.
-            """
-        
-        email_body += """
-        
-        We will confirm your appointment shortly.
-        
-        Regards,
-        Accverse
-        """
-        
-        send_email(user['email'], email_subject, email_body)
+            cursor.execute(
+                """
+                INSERT INTO appointments 
+                (user_id, service_id, appointment_date, appointment_time, notes, status, created_at,
+                 meeting_status, teams_meeting_id, teams_join_url, teams_join_web_url, meeting_available_at) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+                """,
+                (user_id, service_id, appointment_date, appointment_time, notes, 'pending', 
+                 datetime.datetime.utcnow(), meeting_status,
+                 teams_meeting_data and teams_meeting_data['meeting_id'],
+                 teams_meeting_data and teams_meeting_data['join_url'],
+                 teams_meeting_data and teams_meeting_data['join_web_url'])
+            )
+            appointment_id = cursor.lastrowid
         
-        cursor.close()
-        conn.close()
+        availability_index.mark_booked(appointment_date, appointment_time, service['duration'])
         
         response_data = {
             "message": "Appointment booked successfully",
-            "appointment_id": appointment_id
+            "appointment_id": appointment_id,
+            "meeting_status": meeting_status
         }
         
         if teams_meeting_data:
+            # Meeting already known, so confirm right away
+            email_subject, email_body = appointment_confirmation_email(
+                user['name'], service['name'], appointment_date, appointment_time,
+                teams_meeting_data['join_url']
+            )
+            send_email(user['email'], email_subject, email_body)
             response_data["teams_meeting"] = {
                 "join_url": teams_meeting_data['join_url'],
                 "join_web_url": teams_meeting_data.get('join_web_url')
             }
+        else:
+            # The worker sends the confirmation once the meeting exists
+            meeting_provisioner.wake()
         
         return jsonify(response_data), 201
+    except mysql.connector.IntegrityError as e:
+        if e.errno == DUPLICATE_ENTRY:
+            return jsonify({"error": "This time slot is already booked"}), 409
+        return jsonify({"error": str(e)}), 500
+    except mysql.connector.Error as e:
+        if e.errno in (LOCK_DEADLOCK, LOCK_WAIT_TIMEOUT):
+            return jsonify({"error": "This time slot is being booked by someone else. Please try again."}), 409
+        return jsonify({"error": str(e)}), 500
     except Exception as e:
-        cursor.close()
-        conn.close()
         return jsonify({"error": str(e)}), 500
 
 
 def get_appointment_details(token, appointment_id):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
+    with db_session() as cursor:
+        # Clients can only see their own appointments
+        cursor.execute(
+            """
+            SELECT a.*, a.teams_join_url as teams_url, u.name as client_name, u.email as client_email, 
+                   u.phone as client_phone, s.name as service_name, s.price as service_price
+            FROM appointments a
+            JOIN users u ON a.user_id = u.id
+            JOIN services s ON a.service_id = s.id
+            WHERE a.id = %s AND a.user_id = %s
+            """,
+            (appointment_id, user_id)
+        )
+        appointment = cursor.fetchone()
     
-    cursor = conn.cursor(dictionary=True)
-    
-    # Clients can only see their own appointments
-    cursor.execute(
-        """
-        SELECT a.*, u.name as client_name, u.email as client_email, 
-               u.phone as client_phone, s.name as service_name, s.price as service_price
-        FROM appointments a
-        JOIN users u ON a.user_id = u.id
-        JOIN services s ON a.service_id = s.id
-        WHERE a.id = %s AND a.user_id = %s
-        """,
-        (appointment_id, user_id)
-    )
-    
-    appointment = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    
-    if not appointment:
-        return jsonify({"error": "Appointment not found"}), 404
+    if not appointment:
+        return jsonify({"error": "Appointment not found"}), 404
     
     return jsonify({"appointment": appointment}), 200
 
 def update_appointment(token, appointment_id, data):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Get the appointment to check ownership
-    cursor.execute(
-        "SELECT * FROM appointments WHERE id = %s AND user_id = %s",
-        (appointment_id, user_id)
-    )
-    
-    appointment = cursor.fetchone()
-    
-    if not appointment:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Appointment not found"}), 404
-    
-    # Clients can only update notes if appointment is not confirmed
-    if appointment['status'] != 'pending':
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Cannot update confirmed or completed appointments"}), 400
-    
-    notes = data.get('notes', appointment['notes'])
-    
-    cursor.execute(
-        "UPDATE appointments SET notes = %s WHERE id = %s",
-        (notes, appointment_id)
-    )
-    
-    conn.commit()
-    
-    # Get user email for notification
-    cursor.execute("SELECT email, name FROM users WHERE id = %s", (appointment['user_id'],))
-    client = cursor.fetchone()
-    
-    # Get service name
-    cursor.execute("SELECT name FROM services WHERE id = %s", (appointment['service_id'],))
-    service = cursor.fetchone()
+    with db_session() as cursor:
+        # Get the appointment to check ownership
+        cursor.execute(
+            "SELECT * FROM appointments WHERE id = %s AND user_id = %s",
+            (appointment_id, user_id)
+        )
+        appointment = cursor.fetchone()
+        
+        if not appointment:
+            return jsonify({"error": "Appointment not found"}), 404
+        
+        # Clients can only update notes if appointment is not confirmed
+        if appointment['status'] != 'pending':
+            return jsonify({"error": "Cannot update confirmed or completed appointments"}), 400
+        
+        notes = data.get('notes', appointment['notes'])
+        
+        cursor.execute(
+            "UPDATE appointments SET notes = %s WHERE id = %s",
+            (notes, appointment_id)
+        )
+        
+        # Get user email for notification
+        cursor.execute("SELECT email, name FROM users WHERE id = %s", (appointment['user_id'],))
+        client = cursor.fetchone()
+        
+        # Get service name
+        cursor.execute("SELECT name FROM services WHERE id = %s", (appointment['service_id'],))
+        service = cursor.fetchone()
     
     # Send update email
     email_subject = "Appointment Update Notification"
@@ -1007,60 +844,46 @@ def update_appointment(token, appointment_id, data):
     """
     send_email(client['email'], email_subject, email_body)
     
-    cursor.close()
-    conn.close()
-    
     return jsonify({"message": "Appointment updated successfully"}), 200
 
 def cancel_appointment(token, appointment_id):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Get the appointment to check ownership
-    cursor.execute(
-        "SELECT * FROM appointments WHERE id = %s AND user_id = %s",
-        (appointment_id, user_id)
-    )
-    
-    appointment = cursor.fetchone()
-    
-    if not appointment:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Appointment not found"}), 404
-    
-    # Check if appointment is already cancelled
-    if appointment['status'] == 'cancelled':
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Appointment is already cancelled"}), 400
-    
-    # Check if appointment is completed
-    if appointment['status'] == 'completed':
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Cannot cancel completed appointments"}), 400
-    
-    cursor.execute(
-        "UPDATE appointments SET status = 'cancelled' WHERE id = %s",
-        (appointment_id,)
-    )
-    conn.commit()
-    
-    # Get user email for notification
-    cursor.execute("SELECT email, name FROM users WHERE id = %s", (appointment['user_id'],))
-    client = cursor.fetchone()
+    with db_session() as cursor:
+        # Get the appointment to check ownership
+        cursor.execute(
+            "SELECT * FROM appointments WHERE id = %s AND user_id = %s",
+            (appointment_id, user_id)
+        )
+        appointment = cursor.fetchone()
+        
+        if not appointment:
+            return jsonify({"error": "Appointment not found"}), 404
+        
+        # Check if appointment is already cancelled
+        if appointment['status'] == 'cancelled':
+            return jsonify({"error": "Appointment is already cancelled"}), 400
+        
+        # Check if appointment is completed
+        if appointment['status'] == 'completed':
+            return jsonify({"error": "Cannot cancel completed appointments"}), 400
+        
+        cursor.execute(
+            "UPDATE appointments SET status = 'cancelled' WHERE id = %s",
+            (appointment_id,)
+        )
+        
+        # Get user email for notification
+        cursor.execute("SELECT email, name FROM users WHERE id = %s", (appointment['user_id'],))
+        client = cursor.fetchone()
+        
+        # Get service name
+        cursor.execute("SELECT name FROM services WHERE id = %s", (appointment['service_id'],))
+        service = cursor.fetchone()
     
-    # Get service name
-    cursor.execute("SELECT name FROM services WHERE id = %s", (appointment['service_id'],))
-    service = cursor.fetchone()
+    availability_index.invalidate(appointment['appointment_date'])
     
     # Send cancellation email
     email_subject = "Appointment Cancellation Notification"
@@ -1081,128 +904,88 @@ def cancel_appointment(token, appointment_id):
     """
     send_email(client['email'], email_subject, email_body)
     
-    cursor.close()
-    conn.close()
-    
     return jsonify({"message": "Appointment cancelled successfully"}), 200
 
+# Longest range the booking calendar may request at once (a two-month view)
+MAX_AVAILABILITY_RANGE_DAYS = 62
+
 def get_available_slots(date, service_id):
     if not date:
         return jsonify({"error": "Date is required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
+    try:
+        datetime.datetime.strptime(date, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({"error": "Date must be in YYYY-MM-DD format"}), 400
     
-    # Check if service exists if service_id is provided
+    # Check if service exists if service_id is provided; its duration decides how many slots it needs
+    duration = None
     if service_id:
-        cursor.execute("SELECT id FROM services WHERE id = %s", (service_id,))
-        if not cursor.fetchone():
-            cursor.close()
-            conn.close()
+        try:
+            duration = availability_index.service_duration(service_id)
+        except ValueError:
+            return jsonify({"error": "service_id must be an integer"}), 400
+        if duration is None:
             return jsonify({"error": "Service not found"}), 404
     
-    # Get all booked slots for the date
-    cursor.execute(
-        """
-        SELECT appointment_time FROM appointments 
-        WHERE appointment_date = %s AND status != 'cancelled'
-        """,
-        (date,)
-    )
-    booked_slots = [slot['appointment_time'] for slot in cursor.fetchall()]
+    available_slots = availability_index.available_slots(date, duration)
     
-    # Define all available time slots (9 AM to 5 PM, 1-hour intervals)
-    all_slots = ['09:00', '10:00', '11:00', '12:00', '13:00', '14:00', '15:00', '16:00']
+    return jsonify({"date": date, "available_slots": available_slots}), 200
+
+def get_available_slots_range(start_date, end_date, service_id):
+    if not start_date or not end_date:
+        return jsonify({"error": "Start and end dates are required"}), 400
     
-    # Filter out booked slots
-    available_slots = [slot for slot in all_slots if slot not in booked_slots]
+    try:
+        start = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.datetime.strptime(end_date, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"error": "Dates must be in YYYY-MM-DD format"}), 400
     
-    cursor.close()
-    conn.close()
+    if end < start:
+        return jsonify({"error": "End date must not be before start date"}), 400
+    if (end - start).days >= MAX_AVAILABILITY_RANGE_DAYS:
+        return jsonify({"error": f"Date range cannot exceed {MAX_AVAILABILITY_RANGE_DAYS} days"}), 400
     
-    return jsonify({"date": date, "available_slots": available_slots}), 200
+    duration = None
+    if service_id:
+        try:
+            duration = availability_index.service_duration(service_id)
+        except ValueError:
+            return jsonify({"error": "service_id must be an integer"}), 400
+        if duration is None:
+            return jsonify({"error": "Service not found"}), 404
+    
+    days = availability_index.available_range(start, end, duration)
+    
+    return jsonify({"start": start_date, "end": end_date, "days": days}), 200
 
 # Services & Pricing Functions
 def get_services():
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        """
-        SELECT s.*, c.name as category_name 
-        FROM services s
-        JOIN service_categories c ON s.category_id = c.id
-        WHERE s.is_active = 1
-        ORDER BY s.category_id, s.name
-        """
-    )
-    services = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    
-    return jsonify({"services": services}), 200
+    return service_catalog.services_response()
 
 def get_service_details(service_id):
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        """
-        SELECT s.*, c.name as category_name 
-        FROM services s
-        JOIN service_categories c ON s.category_id = c.id
-        WHERE s.id = %s
-        """,
-        (service_id,)
-    )
-    service = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    
-    if not service:
+    response = service_catalog.service_response(service_id)
+    if response is None:
         return jsonify({"error": "Service not found"}), 404
     
-    return jsonify({"service": service}), 200
+    return response
 
 def get_service_categories():
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM service_categories ORDER BY name")
-    categories = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    
-    return jsonify({"categories": categories}), 200
+    return service_catalog.categories_response()
 
 def get_tax_form_templates():
     """
     Get available tax form templates
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
-            
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT id, title, subtitle, description, steps, is_active 
-            FROM tax_form_templates
-            WHERE is_active = TRUE
-        """)
-        
-        templates = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        with db_session() as cursor:
+            cursor.execute("""
+                SELECT id, title, subtitle, description, steps, is_active 
+                FROM tax_form_templates
+                WHERE is_active = TRUE
+            """)
+            templates = cursor.fetchall()
         
         return jsonify({"templates": templates}), 200
     except Exception as e:
@@ -1218,11 +1001,19 @@ def submit_tax_form(token, request):
     # Get user ID if authenticated
     user_id = None
     if token:
-        user_id = get_user_id_from_token(token)
+        user_id = current_user_id(token)
     
     # Get form data
     form_data = {}
     form_type = None
+    files_data = []
+    
+    # Generate a unique ID for the form; uploads are staged under it until they go into the blob store
+    tax_form_id = str(uuid.uuid4())
+    upload_folder = os.path.join(upload_config.UPLOAD_FOLDER, 'incoming', tax_form_id)
+    
+    def discard_uploads():
+        remove_upload_dir(upload_folder)
     
     # Check if the request is JSON or form data
     if request.content_type and 'application/json' in request.content_type:
@@ -1241,30 +1032,34 @@ def submit_tax_form(token, request):
                 else:
                     form_data = form_data_str
     else:
-        # Handle multipart/form-data request
-        form_type = request.form.get('formType')
-        # form_data_str = request.form.get('formData')
-        
-        # if form_data_str:
-        #     try:
-        #         form_data = json.loads(form_data_str)
-        #     except json.JSONDecodeError:
-        #         logger.error(f"Failed to parse form data JSON: {form_data_str}")
-        #         return jsonify({"error": "Invalid form data format"}), 400
-        for key in request.form:
+        # Stream multipart/form-data straight to disk; files are durably stored before the DB is touched
+        try:
+            fields, files_data = stream_multipart(request, upload_folder)
+        except UploadError as e:
+            discard_uploads()
+            logger.error(f"Tax form upload failed: {str(e)}")
+            return jsonify({"error": str(e)}), e.status_code
+        
+        form_type = fields.get('formType')
+        for key in fields:
             if key != 'formType':  # Skip the formType field as we already got it
-                form_data[key] = request.form.get(key)
-        form_data_str = request.form.get('formData')
+                form_data[key] = fields[key]
+        form_data_str = fields.get('formData')
         
         if form_data_str:
             try:
                 form_data = json.loads(form_data_str)
             except json.JSONDecodeError:
                 logger.error(f"Failed to parse form data JSON: {form_data_str}")
+                discard_uploads()
                 return jsonify({"error": "Invalid form data format"}), 400
         
         logger.info(f"Extracted form fields directly: {form_data}")
+        logger.info(f"Stored {len(files_data)} uploaded file(s) for tax form {tax_form_id}")
     
+    if not form_type:
+        discard_uploads()
+        return jsonify({"error": "Missing form type"}), 400
     
     logger.info(f"Processed form data: {form_data}")
     logger.info(f"Processing form type: {form_type}")
@@ -1287,15 +1082,10 @@ def submit_tax_form(token, request):
     for field in required_fields:
         if field not in form_data or not form_data[field]:
             logger.error(f"Missing required field: {field}")
+            discard_uploads()
             return jsonify({"error": f"Missing required field: {field}"}), 400
     
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
-        
-        cursor = conn.cursor(dictionary=True)
-        
         # Store form data as JSON
         form_json = json.dumps(form_data)
         
@@ -1304,55 +1094,26 @@ def submit_tax_form(token, request):
         if 'fiscalYear' in form_data and form_data['fiscalYear']:
             fiscal_year = form_data['fiscalYear']
         
-        # Generate a unique ID for the form
-        tax_form_id = str(uuid.uuid4())
-        
-        # Insert record into tax_forms table
-        insert_form_query = """
-        INSERT INTO tax_forms 
-        (id, user_id, form_type, form_data, fiscal_year_end, status, created_at, updated_at)
-        VALUES (%s, %s, %s, %s, %s, %s, NOW(), NOW())
-        """
+        with db_session() as cursor:
+            # Insert record into tax_forms table
+            insert_form_query = """
+            INSERT INTO tax_forms 
+            (id, user_id, form_type, form_data, fiscal_year_end, status, created_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, NOW(), NOW())
+            """
 
-        cursor.execute(
-            insert_form_query,
-            (tax_form_id, user_id, form_type, form_json, fiscal_year, 'submitted')
-        )
-        
-        # Handle file uploads if any
-        if request.files:
-            from config import upload_config
-            upload_folder = os.path.join(upload_config.UPLOAD_FOLDER, 'tax_forms', tax_form_id)
-            os.makedirs(upload_folder, exist_ok=True)
+            cursor.execute(
+                insert_form_query,
+                (tax_form_id, user_id, form_type, form_json, fiscal_year, 'submitted')
+            )
             
-            files_data = []
-            for field_name, file in request.files.items():
-                if file and file.filename:
-                    # Create secure filename and save file
-                    filename = secure_filename(file.filename)
-                    file_path = os.path.join(upload_folder, filename)
-                    
-                    # Save the file
-                    file.save(file_path)
-                    
-                    # Get file info
-                    file_size = os.path.getsize(file_path)
-                    file_type = file.content_type if hasattr(file, 'content_type') else None
-                    
-                    # Add file data to array
-                    file_data = {
-                        'file_name': filename,
-                        'file_path': file_path,
-                        'file_type': file_type,
-                        'file_size': file_size,
-                        'field_name': field_name
-                    }
-                    
-                    # Ensure all required fields are present
-                    if all(file_data.values()):
-                        files_data.append(file_data)
+            # Store each file once by content and point the form's file entries at the blobs
+            for file_data in files_data:
+                file_data['file_path'] = blob_store.attach(
+                    cursor, file_data['file_path'], file_data['sha256'], file_data['file_size']
+                )
             
-            # Store all files as JSON in a single row
+            # Record the uploaded files, all in a single row
             if files_data:
                 insert_file_query = """
                 INSERT INTO tax_form_files 
@@ -1365,29 +1126,12 @@ def submit_tax_form(token, request):
                         insert_file_query, 
                         (tax_form_id, json.dumps(files_data), form_type)
                     )
-                    conn.commit()
                 except Exception as e:
                     logger.error(f"Error inserting files: {str(e)}")
-                    conn.rollback()
                     raise
-        
-        conn.commit()
-        
-        # Create notification for admins that a new tax form was submitted
-        try:
-            # First, query for admin users
-            admin_query = "SELECT id FROM users WHERE role = 'admin'"
-            cursor.execute(admin_query)
-            admin_users = cursor.fetchall()
             
-            # Create notification for each admin
-            for admin in admin_users:
-                notification_query = """
-                INSERT INTO notifications 
-                (user_id, title, message, type, is_read, created_at)
-                VALUES (%s, %s, %s, %s, %s, NOW())
-                """
-                
+            # Create notification for admins that a new tax form was submitted
+            try:
                 notification_title = f"New {form_type.replace('-', ' ').title()} Form Submission"
                 
                 # Get client name based on form type
@@ -1405,101 +1149,124 @@ def submit_tax_form(token, request):
 
                 notification_message = f"{client_name} has submitted a new {form_type.replace('-', ' ')} form."
                 
+                # One set-based insert fans the notification out to every admin
                 cursor.execute(
-                    notification_query,
-                    (admin['id'], notification_title, notification_message, 'tax_form', False)
+                    """
+                    INSERT INTO notifications 
+                    (user_id, title, message, type, is_read, created_at)
+                    SELECT id, %s, %s, %s, %s, NOW() FROM users WHERE role = 'admin'
+                    """,
+                    (notification_title, notification_message, 'tax_form', False)
                 )
+            except Exception as e:
+                logger.error(f"Error creating admin notifications: {str(e)}")
+                # Continue with the process even if notification creation fails
         
-            conn.commit()
-        except Exception as e:
-            logger.error(f"Error creating admin notifications: {str(e)}")
-            # Continue with the process even if notification creation fails
-        
-        cursor.close()
-        conn.close()
-        
+        # The staged copies are no longer needed once the blobs are committed
+        discard_uploads()
         return jsonify({'success': True, 'id': tax_form_id}), 201
         
     except Exception as e:
         logger.error(f"Error submitting tax form: {str(e)}")
+        discard_uploads()
         return jsonify({'error': str(e)}), 500
 
 def save_tax_form_progress(token, data):
-    """Save tax form progress to database"""
+    """
+    Save tax form progress to database
+
+    Autosaves can send just their changes: 'patch' (RFC 6902 JSON Patch) or
+    'mergePatch' (RFC 7386 merge patch) with the form 'id' and the
+    'baseVersion' they were made against. Anonymous users also send the
+    form's 'email'. Anything else is saved as the whole form. A save based
+    on an outdated version gets a 409 with the current version.
+    """
     
     logger.info("Saving tax form progress")
     
     # Get user ID if authenticated
     user_id = None
     if token:
-        user_id = get_user_id_from_token(token)
+        user_id = current_user_id(token)
+    
+    patch_format, patch = None, None
+    if 'patch' in data:
+        patch_format, patch = JSON_PATCH, data['patch']
+    elif 'mergePatch' in data:
+        patch_format, patch = MERGE_PATCH, data['mergePatch']
+    base_version = data.get('baseVersion')
+    if base_version is not None and (isinstance(base_version, bool) or not isinstance(base_version, int)):
+        return {'error': 'baseVersion must be an integer'}, 400
+    if patch_format and ('id' not in data or base_version is None):
+        return {'error': 'Patches need the form id and baseVersion'}, 400
     
     try:
         # Extract relevant data
         email = data.get('email', '')
         form_id = str(uuid.uuid4()) if 'id' not in data else data.get('id')
         
-        # Store form data
-        form_json = json.dumps(data)
-        
-        conn = get_db_connection()
-        if not conn:
-            return {'error': 'Database connection error'}, 500
-        
-        cursor = conn.cursor(dictionary=True)
-        
-        # Check if a progress record already exists for this user/form combination
-        if user_id:
-            check_query = """
-            SELECT id FROM tax_forms 
-            WHERE user_id = %s AND id = %s AND status = 'submitted'
-            """
-            cursor.execute(check_query, (user_id, form_id))
-        else:
-            # For non-authenticated users, use email as identifier
-            check_query = """
-            SELECT id FROM tax_forms 
-            WHERE form_data LIKE %s AND id = %s AND status = 'submitted'
-            """
-            email_pattern = f'%"email":"{email}"%'
-            cursor.execute(check_query, (email_pattern, form_id))
-            
-        existing_form = cursor.fetchone()
-        
-        if existing_form:
-            # Update existing record
-            update_query = """
-            UPDATE tax_forms 
-            SET form_data = %s, updated_at = NOW()
-            WHERE id = %s
-            """
-            cursor.execute(update_query, (form_json, existing_form['id']))
-            saved_id = existing_form['id']
-        else:
-            # Get fiscal year from form data
-            fiscal_year = None
-            if 'fiscalYear' in data and data['fiscalYear']:
-                fiscal_year = data['fiscalYear']
-                
-            # Insert new record
-            insert_query = """
-            INSERT INTO tax_forms 
-            (id, user_id, form_data, fiscal_year_end, status, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, NOW(), NOW())
-            """
-            
+        with db_session() as cursor:
+            # Lock the form so concurrent saves apply one after the other
             cursor.execute(
-                insert_query, 
-                (form_id, user_id, form_json, fiscal_year, 'submitted')
+                """
+                SELECT id, user_id, owner_email, status, form_data, snapshot_version, updated_at
+                FROM tax_forms WHERE id = %s FOR UPDATE
+                """,
+                (form_id,)
             )
-            saved_id = form_id
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        return {'success': True, 'id': saved_id}, 200
-        
+            existing_form = cursor.fetchone()
+            
+            if existing_form:
+                # For non-authenticated users, use email as identifier (indexed owner_email column)
+                if user_id:
+                    is_owner = existing_form['user_id'] == user_id
+                else:
+                    owner_email = owner_email_key(email)
+                    is_owner = owner_email is not None and existing_form['owner_email'] == owner_email
+                if not is_owner or existing_form['status'] != 'submitted':
+                    return {'error': 'Unauthorized access to form'}, 403
+                
+                if patch_format:
+                    version = progress_log.save(cursor, existing_form, base_version, patch_format, patch)
+                else:
+                    document = {key: value for key, value in data.items() if key != 'baseVersion'}
+                    version = progress_log.save(cursor, existing_form, base_version, document=document)
+                saved_id = existing_form['id']
+            elif patch_format:
+                return {'error': 'Form not found'}, 404
+            else:
+                # Get fiscal year from form data
+                fiscal_year = None
+                if 'fiscalYear' in data and data['fiscalYear']:
+                    fiscal_year = data['fiscalYear']
+                    
+                # Insert new record
+                insert_query = """
+                INSERT INTO tax_forms 
+                (id, user_id, form_data, fiscal_year_end, status, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, NOW(), NOW())
+                """
+                
+                form_json = json.dumps({key: value for key, value in data.items() if key != 'baseVersion'})
+                cursor.execute(
+                    insert_query, 
+                    (form_id, user_id, form_json, fiscal_year, 'submitted')
+                )
+                saved_id = form_id
+                version = 0
+        
+        return {'success': True, 'id': saved_id, 'version': version}, 200
+        
+    except VersionConflict as e:
+        return {'error': str(e), 'version': e.version}, e.status_code
+    except PatchError as e:
+        return {'error': str(e)}, e.status_code
+    except mysql.connector.IntegrityError as e:
+        if e.errno == DUPLICATE_ENTRY:
+            # Another request created this form id first
+            return {'error': 'Unauthorized access to form'}, 403
+        logger.error(f"Error saving tax form progress: {str(e)}")
+        return {'error': str(e)}, 500
     except Exception as e:
         logger.error(f"Error saving tax form progress: {str(e)}")
         return {'error': str(e)}, 500
@@ -1512,91 +1279,133 @@ def load_tax_form_progress(token, form_id):
     # Get user ID if authenticated
     user_id = None
     if token:
-        user_id = get_user_id_from_token(token)
+        user_id = current_user_id(token)
     
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {'error': 'Database connection error'}, 500
-        
-        cursor = conn.cursor(dictionary=True)
-        
-        # Query to get form data
-        query = """
-        SELECT form_data, fiscal_year_end, status, created_at, updated_at
-        FROM tax_forms WHERE id = %s
-        """
-        
-        cursor.execute(query, (form_id,))
-        saved_form = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
-        
-        if not saved_form:
-            return {'error': 'Form not found'}, 404
+        with db_session() as cursor:
+            # Query to get form data
+            query = """
+            SELECT id, form_data, snapshot_version, fiscal_year_end, status, created_at, updated_at
+            FROM tax_forms WHERE id = %s
+            """
+            
+            cursor.execute(query, (form_id,))
+            saved_form = cursor.fetchone()
             
-        # If authenticated, check if the form belongs to the user
-        if user_id:
-            form_data = json.loads(saved_form['form_data'])
-            if 'email' in form_data:
-                # Get user email from DB
-                conn = get_db_connection()
-                cursor = conn.cursor(dictionary=True)
+            if not saved_form:
+                return {'error': 'Form not found'}, 404
+            
+            # Latest snapshot plus any autosave patches made since
+            progress = progress_log.read(cursor, saved_form)
+            form_data = progress['document']
                 
+            # If authenticated, check if the form belongs to the user
+            if user_id and 'email' in form_data:
+                # Get user email from DB on the same connection
                 cursor.execute("SELECT email FROM users WHERE id = %s", (user_id,))
                 user = cursor.fetchone()
                 
-                cursor.close()
-                conn.close()
-                
                 if user and user['email'] != form_data.get('email'):
                     return {'error': 'Unauthorized access to form'}, 403
         
         # Return saved form data
         return {
-            'form_data': json.loads(saved_form['form_data']),
+            'form_data': form_data,
             'fiscal_year_end': saved_form['fiscal_year_end'].isoformat() if saved_form['fiscal_year_end'] else None,
             'status': saved_form['status'],
             'created_at': saved_form['created_at'].isoformat(),
-            'updated_at': saved_form['updated_at'].isoformat()
+            'updated_at': progress['updated_at'].isoformat(),
+            'version': progress['version']
         }, 200
         
     except Exception as e:
         logger.error(f"Error loading tax form progress: {str(e)}")
         return {'error': str(e)}, 500
 
+# Resumable tax document uploads
+def create_tax_form_upload(token, data):
+    """Open a resumable upload session for one file of a tax form"""
+    user_id = current_user_id(token) if token else None
+    data = data or {}
+    
+    if not data.get('tax_form_id') or not data.get('file_name') or data.get('file_size') is None:
+        return jsonify({"error": "tax_form_id, file_name and file_size are required"}), 400
+    
+    try:
+        upload = resumable_uploads.create(
+            data['tax_form_id'], user_id, data['file_name'], data['file_size'],
+            file_type=data.get('file_type'), field_name=data.get('field_name'), sha256=data.get('sha256')
+        )
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    
+    return jsonify(upload), 201
+
+def upload_tax_form_chunk(token, upload_id, offset, request):
+    """Store one chunk of a resumable upload; the body is the raw chunk bytes"""
+    user_id = current_user_id(token) if token else None
+    
+    # Content-Range (bytes start-end/total) wins over ?offset=
+    content_range = parse_content_range_header(request.headers.get('Content-Range'))
+    if content_range is not None:
+        offset = content_range.start
+    try:
+        offset = int(offset) if offset is not None else None
+    except ValueError:
+        return jsonify({"error": "offset must be an integer"}), 400
+    
+    try:
+        upload = resumable_uploads.put_chunk(upload_id, user_id, offset, request.stream, request.content_length)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    
+    return jsonify(upload), 200
+
+def get_tax_form_upload(token, upload_id):
+    """Report which byte ranges of a resumable upload have arrived"""
+    user_id = current_user_id(token) if token else None
+    
+    try:
+        upload = resumable_uploads.status(upload_id, user_id)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    
+    return jsonify(upload), 200
+
+def complete_tax_form_upload(token, upload_id):
+    """Verify a fully received upload and attach it to its tax form"""
+    user_id = current_user_id(token) if token else None
+    
+    try:
+        file_data = resumable_uploads.complete(upload_id, user_id)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    
+    return jsonify({"success": True, "file": file_data}), 200
+
 # Payment Processing Functions
 def get_payments(token):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Clients can only see their own payments
-    cursor.execute(
-        """
-        SELECT p.* 
-        FROM payments p
-        WHERE p.user_id = %s
-        ORDER BY p.created_at DESC
-        """,
-        (user_id,)
-    )
-    
-    payments = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with db_session() as cursor:
+        # Clients can only see their own payments
+        cursor.execute(
+            """
+            SELECT p.* 
+            FROM payments p
+            WHERE p.user_id = %s
+            ORDER BY p.created_at DESC
+            """,
+            (user_id,)
+        )
+        payments = cursor.fetchall()
     
     return jsonify({"payments": payments}), 200
 
 def create_payment(token, data):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
@@ -1608,56 +1417,40 @@ def create_payment(token, data):
     if not amount or not payment_method:
         return jsonify({"error": "Amount and payment method are required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Check if invoice exists if invoice_id is provided
-    if invoice_id:
-        cursor.execute("SELECT * FROM invoices WHERE id = %s", (invoice_id,))
-        invoice = cursor.fetchone()
-        
-        if not invoice:
-            cursor.close()
-            conn.close()
-            return jsonify({"error": "Invoice not found"}), 404
-        
-        # Check if invoice belongs to user if not admin
-        cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
-        user = cursor.fetchone()
-        
-        if user['role'] != 'admin' and invoice['user_id'] != user_id:
-            cursor.close()
-            conn.close()
-            return jsonify({"error": "Unauthorized"}), 403
-    
     try:
-        payment_reference = f"PAY-{datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{user_id}"
-        
-        cursor.execute(
-            """
-            INSERT INTO payments 
-            (user_id, amount, description, payment_method, reference, status, invoice_id, created_at) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (user_id, amount, description, payment_method, payment_reference, 'pending', 
-             invoice_id, datetime.datetime.utcnow())
-        )
-        conn.commit()
-        payment_id = cursor.lastrowid
-        
-        # If invoice_id is provided, update invoice status
-        if invoice_id:
+        # Payment row and invoice status are committed together
+        with db_session() as cursor:
+            # Check if invoice exists if invoice_id is provided
+            if invoice_id:
+                cursor.execute("SELECT * FROM invoices WHERE id = %s", (invoice_id,))
+                invoice = cursor.fetchone()
+                
+                if not invoice:
+                    return jsonify({"error": "Invoice not found"}), 404
+                
+                # Check if invoice belongs to user if not admin
+                if current_user_role(token, cursor) != 'admin' and invoice['user_id'] != user_id:
+                    return jsonify({"error": "Unauthorized"}), 403
+            
+            payment_reference = f"PAY-{datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{user_id}"
+            
             cursor.execute(
-                "UPDATE invoices SET status = 'paid', updated_at = %s WHERE id = %s",
-                (datetime.datetime.utcnow(), invoice_id)
+                """
+                INSERT INTO payments 
+                (user_id, amount, description, payment_method, reference, status, invoice_id, created_at) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                (user_id, amount, description, payment_method, payment_reference, 'pending', 
+                 invoice_id, datetime.datetime.utcnow())
             )
-            conn.commit()
-        
-        cursor.close()
-        conn.close()
+            payment_id = cursor.lastrowid
+            
+            # If invoice_id is provided, update invoice status
+            if invoice_id:
+                cursor.execute(
+                    "UPDATE invoices SET status = 'paid', updated_at = %s WHERE id = %s",
+                    (datetime.datetime.utcnow(), invoice_id)
+                )
         
         return jsonify({
             "message": "Payment created successfully",
@@ -1665,34 +1458,24 @@ def create_payment(token, data):
             "reference": payment_reference
         }), 201
     except Exception as e:
-        cursor.close()
-        conn.close()
         return jsonify({"error": str(e)}), 500
 
 def get_payment_details(token, payment_id):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Clients can only see their own payments
-    cursor.execute(
-        """
-        SELECT p.* 
-        FROM payments p
-        WHERE p.id = %s AND p.user_id = %s
-        """,
-        (payment_id, user_id)
-    )
-    
-    payment = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    with db_session() as cursor:
+        # Clients can only see their own payments
+        cursor.execute(
+            """
+            SELECT p.* 
+            FROM payments p
+            WHERE p.id = %s AND p.user_id = %s
+            """,
+            (payment_id, user_id)
+        )
+        payment = cursor.fetchone()
     
     if not payment:
         return jsonify({"error": "Payment not found"}), 404
@@ -1710,122 +1493,92 @@ def handle_payment_webhook(data):
     if not reference or not status:
         return jsonify({"error": "Reference and status are required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM payments WHERE reference = %s", (reference,))
-    payment = cursor.fetchone()
-    
-    if not payment:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Payment not found"}), 404
-    
-    cursor.execute(
-        """
-        UPDATE payments 
-        SET status = %s, transaction_id = %s, updated_at = %s 
-        WHERE reference = %s
-        """,
-        (status, transaction_id, datetime.datetime.utcnow(), reference)
-    )
-    conn.commit()
-    
-    # If payment is successful and linked to an invoice, update invoice status
-    if status == 'completed' and payment['invoice_id']:
+    with db_session() as cursor:
+        cursor.execute("SELECT * FROM payments WHERE reference = %s", (reference,))
+        payment = cursor.fetchone()
+        
+        if not payment:
+            return jsonify({"error": "Payment not found"}), 404
+        
         cursor.execute(
-            "UPDATE invoices SET status = 'paid', updated_at = %s WHERE id = %s",
-            (datetime.datetime.utcnow(), payment['invoice_id'])
+            """
+            UPDATE payments 
+            SET status = %s, transaction_id = %s, updated_at = %s 
+            WHERE reference = %s
+            """,
+            (status, transaction_id, datetime.datetime.utcnow(), reference)
         )
-        conn.commit()
-    
-    cursor.close()
-    conn.close()
+        
+        # If payment is successful and linked to an invoice, update invoice status
+        if status == 'completed' and payment['invoice_id']:
+            cursor.execute(
+                "UPDATE invoices SET status = 'paid', updated_at = %s WHERE id = %s",
+                (datetime.datetime.utcnow(), payment['invoice_id'])
+            )
     
     return jsonify({"message": "Webhook processed successfully"}), 200
 
 def get_invoices(token):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Clients can only see their own invoices
-    cursor.execute(
-        """
-        SELECT i.* 
-        FROM invoices i
-        WHERE i.user_id = %s
-        ORDER BY i.created_at DESC
-        """,
-        (user_id,)
-    )
-    
-    invoices = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with db_session() as cursor:
+        # Clients can only see their own invoices
+        cursor.execute(
+            """
+            SELECT i.* 
+            FROM invoices i
+            WHERE i.user_id = %s
+            ORDER BY i.created_at DESC
+            """,
+            (user_id,)
+        )
+        invoices = cursor.fetchall()
     
     return jsonify({"invoices": invoices}), 200
 
 def get_invoice_details(token, invoice_id):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Clients can only see their own invoices
-    cursor.execute(
-        """
-        SELECT i.* 
-        FROM invoices i
-        WHERE i.id = %s AND i.user_id = %s
-        """,
-        (invoice_id, user_id)
-    )
-    
-    invoice = cursor.fetchone()
-    
-    if not invoice:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Invoice not found"}), 404
-    
-    # Get invoice items
-    cursor.execute(
-        """
-        SELECT * FROM invoice_items 
-        WHERE invoice_id = %s
-        ORDER BY id
-        """,
-        (invoice_id,)
-    )
-    items = cursor.fetchall()
-    
-    # Get payments related to this invoice
-    cursor.execute(
-        """
-        SELECT * FROM payments 
-        WHERE invoice_id = %s
-        ORDER BY created_at DESC
-        """,
-        (invoice_id,)
-    )
-    payments = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
+    with db_session() as cursor:
+        # Clients can only see their own invoices
+        cursor.execute(
+            """
+            SELECT i.* 
+            FROM invoices i
+            WHERE i.id = %s AND i.user_id = %s
+            """,
+            (invoice_id, user_id)
+        )
+        invoice = cursor.fetchone()
+        
+        if not invoice:
+            return jsonify({"error": "Invoice not found"}), 404
+        
+        # Get invoice items
+        cursor.execute(
+            """
+            SELECT * FROM invoice_items 
+            WHERE invoice_id = %s
+            ORDER BY id
+            """,
+            (invoice_id,)
+        )
+        items = cursor.fetchall()
+        
+        # Get payments related to this invoice
+        cursor.execute(
+            """
+            SELECT * FROM payments 
+            WHERE invoice_id = %s
+            ORDER BY created_at DESC
+            """,
+            (invoice_id,)
+        )
+        payments = cursor.fetchall()
     
     invoice['items'] = items
     invoice['payments'] = payments
@@ -1833,7 +1586,7 @@ def get_invoice_details(token, invoice_id):
     return jsonify({"invoice": invoice}), 200
 
 def pay_invoice(token, invoice_id, data):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
@@ -1842,60 +1595,42 @@ def pay_invoice(token, invoice_id, data):
     if not payment_method:
         return jsonify({"error": "Payment method is required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Check if invoice exists
-    cursor.execute("SELECT * FROM invoices WHERE id = %s", (invoice_id,))
-    invoice = cursor.fetchone()
-    
-    if not invoice:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Invoice not found"}), 404
-    
-    # Check if invoice belongs to user if not admin
-    cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
-    
-    if user['role'] != 'admin' and invoice['user_id'] != user_id:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Unauthorized"}), 403
-    
-    # Check if invoice is already paid
-    if invoice['status'] == 'paid':
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Invoice is already paid"}), 400
-    
     try:
-        payment_reference = f"INV-{invoice_id}-{datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
-        
-        cursor.execute(
-            """
-            INSERT INTO payments 
-            (user_id, amount, description, payment_method, reference, status, invoice_id, created_at) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (invoice['user_id'], invoice['total_amount'], f"Payment for Invoice #{invoice_id}", 
-             payment_method, payment_reference, 'completed', invoice_id, datetime.datetime.utcnow())
-        )
-        conn.commit()
-        payment_id = cursor.lastrowid
-        
-        # Update invoice status
-        cursor.execute(
-            "UPDATE invoices SET status = 'paid', updated_at = %s WHERE id = %s",
-            (datetime.datetime.utcnow(), invoice_id)
-        )
-        conn.commit()
-        
-        cursor.close()
-        conn.close()
+        # Payment row and invoice status are committed together
+        with db_session() as cursor:
+            # Check if invoice exists
+            cursor.execute("SELECT * FROM invoices WHERE id = %s", (invoice_id,))
+            invoice = cursor.fetchone()
+            
+            if not invoice:
+                return jsonify({"error": "Invoice not found"}), 404
+            
+            # Check if invoice belongs to user if not admin
+            if current_user_role(token, cursor) != 'admin' and invoice['user_id'] != user_id:
+                return jsonify({"error": "Unauthorized"}), 403
+            
+            # Check if invoice is already paid
+            if invoice['status'] == 'paid':
+                return jsonify({"error": "Invoice is already paid"}), 400
+            
+            payment_reference = f"INV-{invoice_id}-{datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
+            
+            cursor.execute(
+                """
+                INSERT INTO payments 
+                (user_id, amount, description, payment_method, reference, status, invoice_id, created_at) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                (invoice['user_id'], invoice['total_amount'], f"Payment for Invoice #{invoice_id}", 
+                 payment_method, payment_reference, 'completed', invoice_id, datetime.datetime.utcnow())
+            )
+            payment_id = cursor.lastrowid
+            
+            # Update invoice status
+            cursor.execute(
+                "UPDATE invoices SET status = 'paid', updated_at = %s WHERE id = %s",
+                (datetime.datetime.utcnow(), invoice_id)
+            )
         
         return jsonify({
             "message": "Invoice paid successfully",
@@ -1903,63 +1638,46 @@ def pay_invoice(token, invoice_id, data):
             "reference": payment_reference
         }), 200
     except Exception as e:
-        cursor.close()
-        conn.close()
         return jsonify({"error": str(e)}), 500
 
 # Notifications Functions
 def get_notifications(token):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        """
-        SELECT * FROM notifications 
-        WHERE user_id = %s
-        ORDER BY created_at DESC
-        """,
-        (user_id,)
-    )
-    notifications = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with db_session() as cursor:
+        cursor.execute(
+            """
+            SELECT * FROM notifications 
+            WHERE user_id = %s
+            ORDER BY created_at DESC
+            """,
+            (user_id,)
+        )
+        notifications = cursor.fetchall()
     
     return jsonify({"notifications": notifications}), 200
 
 def mark_notification_read(token, notification_id):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE notifications SET is_read = 1 WHERE id = %s AND user_id = %s",
-        (notification_id, user_id)
-    )
-    conn.commit()
+    with db_session(dictionary=False) as cursor:
+        cursor.execute(
+            "UPDATE notifications SET is_read = 1 WHERE id = %s AND user_id = %s",
+            (notification_id, user_id)
+        )
+        updated = cursor.rowcount
     
-    if cursor.rowcount == 0:
-        cursor.close()
-        conn.close()
+    if updated == 0:
         return jsonify({"error": "Notification not found"}), 404
     
-    cursor.close()
-    conn.close()
-    
     return jsonify({"message": "Notification marked as read"}), 200
 
 def update_notification_preferences(token, data):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
@@ -1971,81 +1689,99 @@ def update_notification_preferences(token, data):
     if email_notifications is None or appointment_reminders is None or payment_notifications is None:
         return jsonify({"error": "Missing required preferences"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Check if preferences exist
-    cursor.execute(
-        "SELECT * FROM notification_preferences WHERE user_id = %s",
-        (user_id,)
-    )
-    preferences = cursor.fetchone()
-    
-    if preferences:
-        # Update existing preferences
+    with db_session() as cursor:
+        # Check if preferences exist
         cursor.execute(
-            """
-            UPDATE notification_preferences 
-            SET email_notifications = %s, sms_notifications = %s, 
-                appointment_reminders = %s, payment_notifications = %s, 
-                updated_at = %s
-            WHERE user_id = %s
-            """,
-            (email_notifications, sms_notifications, appointment_reminders, 
-             payment_notifications, datetime.datetime.utcnow(), user_id)
+            "SELECT * FROM notification_preferences WHERE user_id = %s",
+            (user_id,)
         )
-    else:
-        # Create new preferences
-        cursor.execute(
-            """
-            INSERT INTO notification_preferences 
-            (user_id, email_notifications, sms_notifications, appointment_reminders, 
-             payment_notifications, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """,
-            (user_id, email_notifications, sms_notifications, appointment_reminders, 
-             payment_notifications, datetime.datetime.utcnow(), datetime.datetime.utcnow())
-        )
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+        preferences = cursor.fetchone()
+        
+        if preferences:
+            # Update existing preferences
+            cursor.execute(
+                """
+                UPDATE notification_preferences 
+                SET email_notifications = %s, sms_notifications = %s, 
+                    appointment_reminders = %s, payment_notifications = %s, 
+                    updated_at = %s
+                WHERE user_id = %s
+                """,
+                (email_notifications, sms_notifications, appointment_reminders, 
+                 payment_notifications, datetime.datetime.utcnow(), user_id)
+            )
+        else:
+            # Create new preferences
+            cursor.execute(
+                """
+                INSERT INTO notification_preferences 
+                (user_id, email_notifications, sms_notifications, appointment_reminders, 
+                 payment_notifications, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """,
+                (user_id, email_notifications, sms_notifications, appointment_reminders, 
+                 payment_notifications, datetime.datetime.utcnow(), datetime.datetime.utcnow())
+            )
     
     return jsonify({"message": "Notification preferences updated successfully"}), 200
 
 # Calendar Integration Functions
 def get_calendar_events(token):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
+    with db_session() as cursor:
+        # Clients can only see their own events
+        cursor.execute(
+            """
+            SELECT * FROM calendar_events 
+            WHERE user_id = %s
+            ORDER BY event_date, start_time
+            """,
+            (user_id,)
+        )
+        events = cursor.fetchall()
     
-    # Clients can only see their own events
-    cursor.execute(
-        """
-        SELECT * FROM calendar_events 
-        WHERE user_id = %s
-        ORDER BY event_date, start_time
-        """,
-        (user_id,)
-    )
+    return jsonify({"events": events}), 200
+
+def teams_calendar_event(appointment):
+    """Calendar event for an appointment row with a ready Teams meeting"""
+    # appointment_time is a MySQL TIME, which the connector returns as a timedelta
+    start = datetime.datetime.combine(appointment['appointment_date'], datetime.time()) + appointment['appointment_time']
+    return {
+        'id': appointment['id'],
+        'title': f"{appointment['service_name']} Appointment",
+        'date': appointment['appointment_date'].strftime('%Y-%m-%d'),
+        'start_time': start.strftime('%H:%M'),
+        'end_time': (start + timedelta(minutes=appointment['duration'])).strftime('%H:%M'),
+        'teams_url': appointment['teams_join_url']
+    }
+
+def get_teams_calendar_events(token):
+    user_id = current_user_id(token)
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
     
-    events = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with db_session() as cursor:
+        # Get appointments with Teams meeting links (served by idx_appointments_user_meetings)
+        cursor.execute(
+            """
+            SELECT a.id, a.appointment_date, a.appointment_time, a.teams_join_url,
+                   s.name as service_name, s.duration 
+            FROM appointments a
+            JOIN services s ON a.service_id = s.id
+            WHERE a.user_id = %s AND a.meeting_status = 'meeting_ready'
+            ORDER BY a.appointment_date, a.appointment_time
+            """,
+            (user_id,)
+        )
+        appointments = cursor.fetchall()
     
-    return jsonify({"events": events}), 200
+    return jsonify({"events": [teams_calendar_event(appointment) for appointment in appointments]}), 200
 
 def create_calendar_event(token, data):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
@@ -2059,24 +1795,17 @@ def create_calendar_event(token, data):
     if not title or not event_date or not start_time or not end_time:
         return jsonify({"error": "Title, date, start time, and end time are required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        INSERT INTO calendar_events 
-        (user_id, title, description, event_date, start_time, end_time, location, created_at) 
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """,
-        (user_id, title, description, event_date, start_time, end_time, 
-         location, datetime.datetime.utcnow())
-    )
-    conn.commit()
-    event_id = cursor.lastrowid
-    cursor.close()
-    conn.close()
+    with db_session(dictionary=False) as cursor:
+        cursor.execute(
+            """
+            INSERT INTO calendar_events 
+            (user_id, title, description, event_date, start_time, end_time, location, created_at) 
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            (user_id, title, description, event_date, start_time, end_time, 
+             location, datetime.datetime.utcnow())
+        )
+        event_id = cursor.lastrowid
     
     return jsonify({
         "message": "Calendar event created successfully",
@@ -2084,94 +1813,64 @@ def create_calendar_event(token, data):
     }), 201
 
 def update_calendar_event(token, event_id, data):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Check if event exists and belongs to user
-    cursor.execute("SELECT * FROM calendar_events WHERE id = %s", (event_id,))
-    event = cursor.fetchone()
-    
-    if not event:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Event not found"}), 404
-    
-    # Check if user is admin or event owner
-    cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
-    
-    if user['role'] != 'admin' and event['user_id'] != user_id:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Unauthorized"}), 403
-    
-    title = data.get('title', event['title'])
-    description = data.get('description', event['description'])
-    event_date = data.get('date', event['event_date'])
-    start_time = data.get('start_time', event['start_time'])
-    end_time = data.get('end_time', event['end_time'])
-    location = data.get('location', event['location'])
-    
-    cursor.execute(
-        """
-        UPDATE calendar_events 
-        SET title = %s, description = %s, event_date = %s, 
-            start_time = %s, end_time = %s, location = %s 
-        WHERE id = %s
-        """,
-        (title, description, event_date, start_time, end_time, location, event_id)
-    )
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with db_session() as cursor:
+        # Check if event exists and belongs to user
+        cursor.execute("SELECT * FROM calendar_events WHERE id = %s", (event_id,))
+        event = cursor.fetchone()
+        
+        if not event:
+            return jsonify({"error": "Event not found"}), 404
+        
+        # Check if user is admin or event owner
+        if current_user_role(token, cursor) != 'admin' and event['user_id'] != user_id:
+            return jsonify({"error": "Unauthorized"}), 403
+        
+        title = data.get('title', event['title'])
+        description = data.get('description', event['description'])
+        event_date = data.get('date', event['event_date'])
+        start_time = data.get('start_time', event['start_time'])
+        end_time = data.get('end_time', event['end_time'])
+        location = data.get('location', event['location'])
+        
+        cursor.execute(
+            """
+            UPDATE calendar_events 
+            SET title = %s, description = %s, event_date = %s, 
+                start_time = %s, end_time = %s, location = %s 
+            WHERE id = %s
+            """,
+            (title, description, event_date, start_time, end_time, location, event_id)
+        )
     
     return jsonify({"message": "Calendar event updated successfully"}), 200
 
 def delete_calendar_event(token, event_id):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Check if event exists
-    cursor.execute("SELECT * FROM calendar_events WHERE id = %s", (event_id,))
-    event = cursor.fetchone()
-    
-    if not event:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Event not found"}), 404
-    
-    # Check if user is admin or event owner
-    cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
-    
-    if user['role'] != 'admin' and event['user_id'] != user_id:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Unauthorized"}), 403
-    
-    cursor.execute("DELETE FROM calendar_events WHERE id = %s", (event_id,))
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with db_session() as cursor:
+        # Check if event exists
+        cursor.execute("SELECT * FROM calendar_events WHERE id = %s", (event_id,))
+        event = cursor.fetchone()
+        
+        if not event:
+            return jsonify({"error": "Event not found"}), 404
+        
+        # Check if user is admin or event owner
+        if current_user_role(token, cursor) != 'admin' and event['user_id'] != user_id:
+            return jsonify({"error": "Unauthorized"}), 403
+        
+        cursor.execute("DELETE FROM calendar_events WHERE id = %s", (event_id,))
     
     return jsonify({"message": "Calendar event deleted successfully"}), 200
 
 def sync_external_calendar(token):
-    user_id = validate_token(token)
+    user_id = current_user_id(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
@@ -2184,46 +1883,128 @@ def sync_external_calendar(token):
     }), 200
 
 # Content Management Functions
-def get_knowledge_base():
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
+def encode_cursor(created_at, article_id):
+    raw = json.dumps([created_at.isoformat(), article_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """(created_at, id) from a listing cursor, raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, article_id = json.loads(raw)
+        return datetime.datetime.fromisoformat(created_at), int(article_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+
+def get_knowledge_base(view=None, page_cursor=None, limit=None):
+    """
+    List published articles, newest first
+
+    By default every article is returned in full. view=summary (or a
+    cursor from an earlier summary page) returns pages of summaries
+    instead, without the article bodies.
+    """
+    if view not in (None, '', 'full', 'summary'):
+        return jsonify({"error": "view must be 'full' or 'summary'"}), 400
+    if view != 'summary' and not page_cursor:
+        with db_session() as cursor:
+            cursor.execute(
+                """
+                SELECT * FROM knowledge_articles 
+                WHERE is_published = 1
+                ORDER BY created_at DESC
+                """
+            )
+            articles = cursor.fetchall()
+        return jsonify({"articles": articles}), 200
     
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        """
-        SELECT * FROM knowledge_articles 
-        WHERE is_published = 1
-        ORDER BY created_at DESC
-        """
-    )
-    articles = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    return get_knowledge_base_summaries(page_cursor, limit)
+
+def get_knowledge_base_summaries(page_cursor=None, limit=None):
+    """
+    List published articles, newest first, without their bodies
+
+    Pages with a keyset cursor on (created_at, id), so each page is an index
+    range scan however deep the client goes. Pass the previous response's
+    next_cursor to get the following page.
+    """
+    try:
+        limit = int(limit or content_config.KNOWLEDGE_LIST_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if not 1 <= limit <= content_config.KNOWLEDGE_LIST_MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {content_config.KNOWLEDGE_LIST_MAX_PAGE_SIZE}"}), 400
+    
+    where = "is_published = 1"
+    params = []
+    if page_cursor:
+        try:
+            created_at, article_id = decode_cursor(page_cursor)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+        where += " AND (created_at < %s OR (created_at = %s AND id < %s))"
+        params += [created_at, created_at, article_id]
+    
+    with db_session() as cursor:
+        # Served by idx_knowledge_articles_listing; summary is a stored prefix, so content is never read
+        cursor.execute(
+            f"""
+            SELECT id, title, summary, category, created_at
+            FROM knowledge_articles
+            WHERE {where}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+            """,
+            (*params, limit + 1)
+        )
+        articles = cursor.fetchall()
+    
+    next_cursor = None
+    if len(articles) > limit:
+        articles = articles[:limit]
+        next_cursor = encode_cursor(articles[-1]['created_at'], articles[-1]['id'])
     
-    return jsonify({"articles": articles}), 200
+    return jsonify({"articles": articles, "next_cursor": next_cursor}), 200
 
-def get_knowledge_article(article_id):
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
+def search_knowledge_base(query, page, per_page, category):
+    if not query or not query.strip():
+        return jsonify({"error": "Search query is required"}), 400
     
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        """
-        SELECT * FROM knowledge_articles 
-        WHERE id = %s AND is_published = 1
-        """,
-        (article_id,)
-    )
-    article = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    try:
+        page = int(page or 1)
+        per_page = int(per_page or 10)
+    except ValueError:
+        return jsonify({"error": "page and per_page must be integers"}), 400
+    if page < 1 or not 1 <= per_page <= content_config.KNOWLEDGE_SEARCH_MAX_PER_PAGE:
+        return jsonify({"error": f"page must be at least 1 and per_page between 1 and "
+                                 f"{content_config.KNOWLEDGE_SEARCH_MAX_PER_PAGE}"}), 400
+    
+    found = search_articles(query, page, per_page, category or None)
+    
+    return jsonify({
+        "query": query,
+        "page": page,
+        "per_page": per_page,
+        "total": found['total'],
+        "results": found['results']
+    }), 200
+
+def get_knowledge_article(article_id):
+    with db_session() as cursor:
+        cursor.execute(
+            """
+            SELECT * FROM knowledge_articles 
+            WHERE id = %s AND is_published = 1
+            """,
+            (article_id,)
+        )
+        article = cursor.fetchone()
     
     if not article:
         return jsonify({"error": "Article not found"}), 404
     
-    return jsonify({"article": article}), 200
+    body, etag = json_body({"article": article})
+    return conditional_response(body, etag, last_modified=article['updated_at'])
 
 def save_engagement_letter(token, data):
     """Save engagement letter data to database"""
@@ -2233,37 +2014,28 @@ def save_engagement_letter(token, data):
     # Get user ID if authenticated
     user_id = None
     if token:
-        user_id = get_user_id_from_token(token)
+        user_id = current_user_id(token)
     
     try:
-        # Store engagement letter data
-        conn = get_db_connection()
-        if not conn:
-            return {'error': 'Database connection error'}, 500
-            
-        cursor = conn.cursor(dictionary=True)
-        
         # Generate a unique ID for the engagement letter
         engagement_id = str(uuid.uuid4())
         
         # Convert data to JSON string
         engagement_json = json.dumps(data)
         
-        # Insert record into engagement_letters table
-        insert_query = """
-        INSERT INTO engagement_letters 
-        (id, user_id, engagement_data, created_at, updated_at)
-        VALUES (%s, %s, %s, NOW(), NOW())
-        """
-        
-        cursor.execute(
-            insert_query,
-            (engagement_id, user_id, engagement_json)
-        )
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        # Store engagement letter data
+        with db_session() as cursor:
+            # Insert record into engagement_letters table
+            insert_query = """
+            INSERT INTO engagement_letters 
+            (id, user_id, engagement_data, created_at, updated_at)
+            VALUES (%s, %s, %s, NOW(), NOW())
+            """
+            
+            cursor.execute(
+                insert_query,
+                (engagement_id, user_id, engagement_json)
+            )
         
         return {
             'success': True,
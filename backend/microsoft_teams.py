@@ -1,241 +1,205 @@
-# import os
-# import requests
-# import json
-# import datetime
-# from flask import current_app
-
-# class MicrosoftTeamsIntegration:
-#     def __init__(self):
-#         # self.client_id = os.environ.get('MS_CLIENT_ID')
-#         # self.client_secret = os.environ.get('MS_CLIENT_SECRET')
-#         # self.tenant_id = os.environ.get('MS_TENANT_ID')
-#         self.client_id = "demo-client-id"
-#         self.client_secret = "demo-client-secret"
-#         self.tenant_id = "demo-tenant-id"
-#         self.access_token = None
-#         self.token_expires = None
-
-#     def _get_token(self):
-#         """Get an access token for Microsoft Graph API"""
-#         if self.access_token and self.token_expires and datetime.datetime.now() < self.token_expires:
-#             return self.access_token
-
-#         url = f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token"
-        
-#         payload = {
-#             'client_id': self.client_id,
-#             'scope': 'https://graph.microsoft.com/.default',
-#             'client_secret': self.client_secret,
-#             'grant_type': 'client_credentials'
-#         }
-        
-#         headers = {
-#             'Content-Type': 'application/x-www-form-urlencoded'
-#         }
-        
-#         try:
-#             response = requests.post(url, data=payload, headers=headers)
-#             response.raise_for_status()
-            
-#             token_data = response.json()
-#             self.access_token = token_data['access_token']
-#             # Set token expiry time (subtract 5 minutes for safety)
-#             self.token_expires = datetime.datetime.now() + datetime.timedelta(seconds=token_data['expires_in'] - 300)
-            
-#             return self.access_token
-#         except Exception as e:
-#             current_app.logger.error(f"Error getting Microsoft token: {str(e)}")
-#             return None
-
-#     def create_meeting(self, subject, start_time, end_time, attendees=None, content=None):
-#         """
-#         Create a Microsoft Teams meeting
-        
-#         Args:
-#             subject (str): Meeting subject
-#             start_time (str): ISO format start time
-#             end_time (str): ISO format end time
-#             attendees (list): List of attendee email addresses
-#             content (str): Meeting content/description
-            
-#         Returns:
-#             dict: Meeting details including join URL
-#         """
-#         token = self._get_token()
-#         if not token:
-#             return None
-            
-#         # Use the application's default user for creating meetings
-#         # In a production app, you'd use delegated permissions with the actual user
-#         url = "https://graph.microsoft.com/v1.0/users/scheduler@yourdomain.com/onlineMeetings"
-        
-#         # Format the meeting request
-#         meeting_request = {
-#             "startDateTime": start_time,
-#             "endDateTime": end_time,
-#             "subject": subject,
-#             "isEntryExitAnnounced": True,
-#             "allowedPresenters": "everyone",
-#             "allowMeetingChat": "enabled",
-#             "joinMeetingIdSettings": {
-#                 "isPasscodeRequired": False
-#             }
-#         }
-        
-#         # Add meeting content if provided
-#         if content:
-#             meeting_request["content"] = content
-            
-#         headers = {
-#             'Authorization': f'Bearer {token}',
-#             'Content-Type': 'application/json'
-#         }
-        
-#         try:
-#             response = requests.post(url, headers=headers, data=json.dumps(meeting_request))
-#             response.raise_for_status()
-            
-#             meeting_data = response.json()
-            
-#             # Return relevant meeting details
-#             return {
-#                 'meeting_id': meeting_data.get('id'),
-#                 'join_url': meeting_data.get('joinUrl'),
-#                 'join_web_url': meeting_data.get('joinWebUrl'),
-#                 'subject': meeting_data.get('subject'),
-#                 'start_time': meeting_data.get('startDateTime'),
-#                 'end_time': meeting_data.get('endDateTime')
-#             }
-#         except Exception as e:
-#             current_app.logger.error(f"Error creating Teams meeting: {str(e)}")
-#             return None
-
-#     def get_meeting(self, meeting_id):
-#         """
-#         Get details of a Microsoft Teams meeting
-        
-#         Args:
-#             meeting_id (str): The ID of the meeting to retrieve
-            
-#         Returns:
-#             dict: Meeting details
-#         """
-#         token = self._get_token()
-#         if not token:
-#             return None
-            
-#         url = f"https://graph.microsoft.com/v1.0/users/scheduler@yourdomain.com/onlineMeetings/{meeting_id}"
-        
-#         headers = {
-#             'Authorization': f'Bearer {token}',
-#             'Content-Type': 'application/json'
-#         }
-        
-#         try:
-#             response = requests.get(url, headers=headers)
-#             response.raise_for_status()
-            
-#             meeting_data = response.json()
-            
-#             return {
-#                 'meeting_id': meeting_data.get('id'),
-#                 'join_url': meeting_data.get('joinUrl'),
-#                 'join_web_url': meeting_data.get('joinWebUrl'),
-#                 'subject': meeting_data.get('subject'),
-#                 'start_time': meeting_data.get('startDateTime'),
-#                 'end_time': meeting_data.get('endDateTime')
-#             }
-#         except Exception as e:
-#             current_app.logger.error(f"Error getting Teams meeting: {str(e)}")
-#             return None
-
-import os
-import requests
-import json
 import datetime
-from flask import current_app
+import email.utils
+import random
+import threading
+import time
+import logging
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+from config import teams_config
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+BATCH_LIMIT = 20  # Graph accepts at most 20 requests per $batch
+
+
+class TeamsRequestError(Exception):
+    """Raised when a Graph call fails after all retries"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
 
 class MicrosoftTeamsIntegration:
-    def __init__(self):
-        # Comment out the real Microsoft credentials - will be used later
-        """
-        self.client_id = os.environ.get('MS_CLIENT_ID')
-        self.client_secret = os.environ.get('MS_CLIENT_SECRET')
-        self.tenant_id = os.environ.get('MS_TENANT_ID')
-        """
-        # Use mock values for demo
-        self.client_id = "demo-client-id"
-        self.client_secret = "demo-client-secret"
-        self.tenant_id = "demo-tenant-id"
+    """
+    Microsoft Graph client for Teams online meetings, shared by the whole process
+
+    One keep-alive session is reused for the token endpoint and Graph calls.
+    The app-only access token is cached until shortly before it expires; when
+    it needs refreshing, one thread fetches it while concurrent callers wait
+    for that result instead of each hitting the token endpoint. Throttled
+    (429) and 5xx responses are retried with jittered exponential backoff,
+    honoring Retry-After when Graph sends one. The bulk variants pack up to
+    20 operations into each $batch request and report failures per item.
+
+    Without enabled and credentials configured the client returns mock
+    meetings, so bookings work in development without a tenant.
+    """
+
+    TOKEN_EXPIRY_MARGIN = 300  # seconds before expiry a token is refreshed
+
+    def __init__(self, client_id, client_secret, tenant_id, organizer, enabled=False,
+                 login_url='https://login.microsoftonline.com',
+                 graph_url='https://graph.microsoft.com/v1.0',
+                 timeout=10, pool_size=10, max_retries=3, backoff=0.5, backoff_max=30,
+                 mock_latency=0):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.tenant_id = tenant_id
+        self.organizer = organizer
+        self.token_url = f"{login_url.rstrip('/')}/{tenant_id}/oauth2/v2.0/token"
+        self.graph_url = graph_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.mock_latency = mock_latency
+        self.mock = not (enabled and client_id and client_secret and tenant_id)
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+        self._token_lock = threading.Lock()
         self.access_token = None
-        self.token_expires = None
+        self.token_expires = 0
 
-    def _get_token(self):
-        """Get an access token for Microsoft Graph API"""
-        # For demo purposes, return a mock token
-        # Comment out the actual implementation - will be used later
+        self._stats_lock = threading.Lock()
+        self._latencies = {}  # operation -> deque of seconds
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttled = 0
+        self.token_fetches = 0
+        self.batched_requests = 0
+
+    def _record(self, operation, elapsed, ok):
+        with self._stats_lock:
+            self.calls += 1
+            if not ok:
+                self.errors += 1
+            self._latencies.setdefault(operation, deque(maxlen=256)).append(elapsed)
+
+    def _token_usable(self, rejected):
+        return (self.access_token is not None and self.access_token != rejected
+                and time.time() < self.token_expires)
+
+    def _get_token(self, rejected=None):
+        """
+        Get an access token for Microsoft Graph API
+
+        Parameters:
+        - rejected: A token Graph just refused with 401; it won't be returned again
         """
-        if self.access_token and self.token_expires and datetime.datetime.now() < self.token_expires:
+        if self._token_usable(rejected):
             return self.access_token
 
-        url = f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token"
-        
-        payload = {
-            'client_id': self.client_id,
-            'scope': 'https://graph.microsoft.com/.default',
-            'client_secret': self.client_secret,
-            'grant_type': 'client_credentials'
-        }
-        
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded'
-        }
-        
-        try:
-            response = requests.post(url, data=payload, headers=headers)
-            response.raise_for_status()
-            
+        with self._token_lock:
+            # Another thread may have refreshed it while we waited for the lock
+            if self._token_usable(rejected):
+                return self.access_token
+
+            payload = {
+                'client_id': self.client_id,
+                'scope': 'https://graph.microsoft.com/.default',
+                'client_secret': self.client_secret,
+                'grant_type': 'client_credentials'
+            }
+            response = self._send('token', 'POST', self.token_url, data=payload)
             token_data = response.json()
             self.access_token = token_data['access_token']
-            # Set token expiry time (subtract 5 minutes for safety)
-            self.token_expires = datetime.datetime.now() + datetime.timedelta(seconds=token_data['expires_in'] - 300)
-            
+            self.token_expires = time.time() + max(0, int(token_data['expires_in']) - self.TOKEN_EXPIRY_MARGIN)
+            with self._stats_lock:
+                self.token_fetches += 1
             return self.access_token
-        except Exception as e:
-            current_app.logger.error(f"Error getting Microsoft token: {str(e)}")
-            return None
-        """
-        
-        # Mock token for demo purposes
-        self.access_token = "mock-access-token"
-        self.token_expires = datetime.datetime.now() + datetime.timedelta(hours=1)
-        return self.access_token
 
-    def create_meeting(self, subject, start_time, end_time, attendees=None, content=None):
-        """
-        Create a Microsoft Teams meeting - demo implementation
-        
-        Args:
-            subject (str): Meeting subject
-            start_time (str): ISO format start time
-            end_time (str): ISO format end time
-            attendees (list): List of attendee email addresses
-            content (str): Meeting content/description
-            
-        Returns:
-            dict: Meeting details including join URL
-        """
-        # Comment out the actual implementation - will be used later
-        """
+    def _retry_delay(self, attempt, headers=None):
+        retry_after = (headers or {}).get('Retry-After')
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    retry_at = email.utils.parsedate_to_datetime(retry_after)
+                    delay = (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return min(max(delay, 0), self.backoff_max)
+        # Full jitter keeps workers that failed together from retrying together
+        return random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+
+    def _send(self, operation, method, url, **kwargs):
+        """Send a request, retrying throttled, 5xx and connection failures"""
+        for attempt in range(self.max_retries + 1):
+            response = None
+            start = time.perf_counter()
+            try:
+                response = self._session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                self._record(operation, time.perf_counter() - start, False)
+                error = str(e)
+            else:
+                ok = response.status_code < 400
+                self._record(operation, time.perf_counter() - start, ok)
+                if ok:
+                    return response
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if response.status_code not in RETRYABLE_STATUS:
+                    raise TeamsRequestError(f"{operation} failed: {error}", response.status_code)
+                if response.status_code == 429:
+                    with self._stats_lock:
+                        self.throttled += 1
+
+            if attempt == self.max_retries:
+                break
+            delay = self._retry_delay(attempt, response.headers if response is not None else None)
+            with self._stats_lock:
+                self.retries += 1
+            logger.warning(f"Teams {operation} failed ({error}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+        raise TeamsRequestError(f"{operation} failed after {self.max_retries + 1} attempts: {error}",
+                                response.status_code if response is not None else None)
+
+    def _graph(self, operation, method, path, **kwargs):
+        """Call Microsoft Graph, refreshing the token once if it was rejected"""
+        url = f"{self.graph_url}{path}"
         token = self._get_token()
-        if not token:
-            return None
-            
-        # Use the application's default user for creating meetings
-        # In a production app, you'd use delegated permissions with the actual user
-        url = "https://graph.microsoft.com/v1.0/users/scheduler@yourdomain.com/onlineMeetings"
-        
-        # Format the meeting request
+        try:
+            return self._send(operation, method, url, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+        except TeamsRequestError as e:
+            if e.status_code != 401:
+                raise
+        headers = {'Authorization': f'Bearer {self._get_token(rejected=token)}'}
+        return self._send(operation, method, url, headers=headers, **kwargs)
+
+    @staticmethod
+    def _meeting_details(meeting_data):
+        return {
+            'meeting_id': meeting_data.get('id'),
+            'join_url': meeting_data.get('joinUrl'),
+            'join_web_url': meeting_data.get('joinWebUrl'),
+            'subject': meeting_data.get('subject'),
+            'start_time': meeting_data.get('startDateTime'),
+            'end_time': meeting_data.get('endDateTime')
+        }
+
+    def _mock_meeting(self, meeting_id, subject, start_time, end_time):
+        return {
+            'meeting_id': meeting_id,
+            'join_url': f"https://teams.microsoft.com/l/meetup-join/{meeting_id}",
+            'join_web_url': f"https://teams.microsoft.com/l/meetup-join/{meeting_id}/web",
+            'subject': subject,
+            'start_time': start_time,
+            'end_time': end_time
+        }
+
+    @staticmethod
+    def _meeting_request(subject, start_time, end_time, content=None):
         meeting_request = {
             "startDateTime": start_time,
             "endDateTime": end_time,
@@ -247,100 +211,231 @@ class MicrosoftTeamsIntegration:
                 "isPasscodeRequired": False
             }
         }
-        
-        # Add meeting content if provided
         if content:
             meeting_request["content"] = content
-            
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
-        
+        return meeting_request
+
+    def create_meeting(self, subject, start_time, end_time, attendees=None, content=None):
+        """
+        Create a Microsoft Teams meeting
+
+        Args:
+            subject (str): Meeting subject
+            start_time (str): ISO format start time
+            end_time (str): ISO format end time
+            attendees (list): List of attendee email addresses
+            content (str): Meeting content/description
+
+        Returns:
+            dict: Meeting details including join URL
+        """
+        if self.mock:
+            # Runs on worker threads, outside any app context
+            logger.info(f"Creating mock Teams meeting: {subject}")
+            start = time.perf_counter()
+            if self.mock_latency:
+                time.sleep(self.mock_latency)
+            self._record('create_meeting', time.perf_counter() - start, True)
+            meeting_id = f"mock-meeting-{datetime.datetime.now().timestamp()}"
+            return self._mock_meeting(meeting_id, subject, start_time, end_time)
+
+        meeting_request = self._meeting_request(subject, start_time, end_time, content)
         try:
-            response = requests.post(url, headers=headers, data=json.dumps(meeting_request))
-            response.raise_for_status()
-            
-            meeting_data = response.json()
-            
-            # Return relevant meeting details
-            return {
-                'meeting_id': meeting_data.get('id'),
-                'join_url': meeting_data.get('joinUrl'),
-                'join_web_url': meeting_data.get('joinWebUrl'),
-                'subject': meeting_data.get('subject'),
-                'start_time': meeting_data.get('startDateTime'),
-                'end_time': meeting_data.get('endDateTime')
-            }
-        except Exception as e:
-            current_app.logger.error(f"Error creating Teams meeting: {str(e)}")
+            # Uses the application's organizer account (app-only permissions)
+            response = self._graph(
+                'create_meeting', 'POST', f"/users/{self.organizer}/onlineMeetings", json=meeting_request
+            )
+            return self._meeting_details(response.json())
+        except (TeamsRequestError, ValueError, KeyError) as e:
+            logger.error(f"Error creating Teams meeting: {str(e)}")
             return None
-        """
-        
-        # Mock implementation for demo purposes
-        current_app.logger.info(f"Creating mock Teams meeting: {subject}")
-        
-        # Generate unique meeting ID
-        meeting_id = f"mock-meeting-{datetime.datetime.now().timestamp()}"
-        
-        # Return mock meeting details
-        return {
-            'meeting_id': meeting_id,
-            'join_url': f"https://teams.microsoft.com/l/meetup-join/{meeting_id}",
-            'join_web_url': f"https://teams.microsoft.com/l/meetup-join/{meeting_id}/web",
-            'subject': subject,
-            'start_time': start_time,
-            'end_time': end_time
-        }
 
     def get_meeting(self, meeting_id):
         """
-        Get details of a Microsoft Teams meeting - demo implementation
-        
+        Get details of a Microsoft Teams meeting
+
         Args:
             meeting_id (str): The ID of the meeting to retrieve
-            
+
         Returns:
             dict: Meeting details
         """
-        # Comment out actual implementation - will be used later
-        """
-        token = self._get_token()
-        if not token:
-            return None
-            
-        url = f"https://graph.microsoft.com/v1.0/users/scheduler@yourdomain.com/onlineMeetings/{meeting_id}"
-        
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
-        
+        if self.mock:
+            now = datetime.datetime.now()
+            return self._mock_meeting(
+                meeting_id, "Mock Meeting", now.isoformat(), (now + datetime.timedelta(hours=1)).isoformat()
+            )
+
         try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            meeting_data = response.json()
-            
-            return {
-                'meeting_id': meeting_data.get('id'),
-                'join_url': meeting_data.get('joinUrl'),
-                'join_web_url': meeting_data.get('joinWebUrl'),
-                'subject': meeting_data.get('subject'),
-                'start_time': meeting_data.get('startDateTime'),
-                'end_time': meeting_data.get('endDateTime')
-            }
-        except Exception as e:
-            current_app.logger.error(f"Error getting Teams meeting: {str(e)}")
+            response = self._graph('get_meeting', 'GET', f"/users/{self.organizer}/onlineMeetings/{meeting_id}")
+            return self._meeting_details(response.json())
+        except (TeamsRequestError, ValueError, KeyError) as e:
+            logger.error(f"Error getting Teams meeting: {str(e)}")
             return None
+
+    def _batch(self, operation, requests_):
         """
-        
-        # Return mock meeting details
+        Send Graph requests through $batch, BATCH_LIMIT at a time
+
+        Items that come back throttled or 5xx are resent in a later round,
+        after the longest Retry-After among them. Items missing from a
+        response count as failed and are not resent.
+
+        Returns:
+        - One (status, body, error) tuple per request, in order
+        """
+        results = [None] * len(requests_)
+        pending = list(range(len(requests_)))
+        for attempt in range(self.max_retries + 1):
+            retry_headers = []
+            for offset in range(0, len(pending), BATCH_LIMIT):
+                chunk = pending[offset:offset + BATCH_LIMIT]
+                for i in chunk:
+                    results[i] = None  # drop the previous round's result so a missing item isn't retried on it
+                payload = {'requests': [dict(requests_[i], id=str(i)) for i in chunk]}
+                try:
+                    responses = self._graph(operation, 'POST', '/$batch', json=payload).json()['responses']
+                except (TeamsRequestError, ValueError, KeyError) as e:
+                    for i in chunk:
+                        results[i] = (None, None, str(e))
+                    continue
+                with self._stats_lock:
+                    self.batched_requests += len(chunk)
+                for item in responses:
+                    i = int(item['id'])
+                    status, body = item.get('status'), item.get('body') or {}
+                    error = None
+                    if status is None or status >= 400:
+                        error = f"HTTP {status}: {body.get('error', {}).get('message', '')}"
+                    results[i] = (status, body, error)
+                    if status in RETRYABLE_STATUS:
+                        retry_headers.append(item.get('headers') or {})
+                for i in chunk:
+                    if results[i] is None:
+                        results[i] = (None, None, "missing from $batch response")
+
+            pending = [i for i in pending if results[i][0] in RETRYABLE_STATUS]
+            if not pending or attempt == self.max_retries:
+                break
+            delay = max((self._retry_delay(attempt, headers) for headers in retry_headers),
+                        default=self._retry_delay(attempt, {}))
+            with self._stats_lock:
+                self.retries += 1
+                self.throttled += sum(1 for i in pending if results[i][0] == 429)
+            logger.warning(f"Teams {operation}: {len(pending)} batched request(s) failed, retrying in {delay:.2f}s")
+            time.sleep(delay)
+        return results
+
+    def _batch_results(self, operation, results):
+        outcome = []
+        for status, body, error in results:
+            if error:
+                outcome.append({'meeting': None, 'error': error})
+            else:
+                outcome.append({'meeting': self._meeting_details(body), 'error': None})
+        failed = sum(1 for result in outcome if result['error'])
+        if failed:
+            logger.error(f"Teams {operation}: {failed} of {len(outcome)} request(s) failed")
+        return outcome
+
+    def create_meetings(self, meetings):
+        """
+        Create many Microsoft Teams meetings with Graph $batch requests
+
+        Args:
+            meetings (list): Dicts with the create_meeting arguments
+                (subject, start_time, end_time and optionally attendees, content)
+
+        Returns:
+            list: One {'meeting': dict or None, 'error': str or None} per input, in order
+        """
+        if not meetings:
+            return []
+        if self.mock:
+            logger.info(f"Creating {len(meetings)} mock Teams meetings")
+            start = time.perf_counter()
+            if self.mock_latency:
+                time.sleep(self.mock_latency * ((len(meetings) - 1) // BATCH_LIMIT + 1))
+            self._record('create_meetings', time.perf_counter() - start, True)
+            stamp = datetime.datetime.now().timestamp()
+            return [
+                {'meeting': self._mock_meeting(f"mock-meeting-{stamp}-{i}", m['subject'], m['start_time'], m['end_time']),
+                 'error': None}
+                for i, m in enumerate(meetings)
+            ]
+
+        requests_ = [
+            {
+                'method': 'POST',
+                'url': f"/users/{self.organizer}/onlineMeetings",
+                'headers': {'Content-Type': 'application/json'},
+                'body': self._meeting_request(m['subject'], m['start_time'], m['end_time'], m.get('content'))
+            }
+            for m in meetings
+        ]
+        return self._batch_results('create_meetings', self._batch('create_meetings', requests_))
+
+    def get_meetings(self, meeting_ids):
+        """
+        Get details of many Microsoft Teams meetings with Graph $batch requests
+
+        Args:
+            meeting_ids (list): IDs of the meetings to retrieve
+
+        Returns:
+            list: One {'meeting': dict or None, 'error': str or None} per ID, in order
+        """
+        if not meeting_ids:
+            return []
+        if self.mock:
+            return [{'meeting': self.get_meeting(meeting_id), 'error': None} for meeting_id in meeting_ids]
+
+        requests_ = [
+            {'method': 'GET', 'url': f"/users/{self.organizer}/onlineMeetings/{meeting_id}"}
+            for meeting_id in meeting_ids
+        ]
+        return self._batch_results('get_meetings', self._batch('get_meetings', requests_))
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = {operation: sorted(values) for operation, values in self._latencies.items()}
+            counters = {
+                "calls": self.calls,
+                "errors": self.errors,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "token_fetches": self.token_fetches,
+                "batched_requests": self.batched_requests
+            }
+
+        def percentile(values, p):
+            return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2)
+
         return {
-            'meeting_id': meeting_id,
-            'join_url': f"https://teams.microsoft.com/l/meetup-join/{meeting_id}",
-            'join_web_url': f"https://teams.microsoft.com/l/meetup-join/{meeting_id}/web",
-            'subject': "Mock Meeting",
-            'start_time': datetime.datetime.now().isoformat(),
-            'end_time': (datetime.datetime.now() + datetime.timedelta(hours=1)).isoformat()
+            "mock": self.mock,
+            **counters,
+            "token_valid_for": max(0, int(self.token_expires - time.time())) if self.access_token else 0,
+            "latency_ms": {
+                operation: {"p50": percentile(values, 0.5), "p95": percentile(values, 0.95),
+                            "max": percentile(values, 1.0)}
+                for operation, values in latencies.items() if values
+            }
         }
+
+
+# One client per process so the token and connections are shared by every caller
+teams_client = MicrosoftTeamsIntegration(
+    client_id=teams_config.MS_CLIENT_ID,
+    client_secret=teams_config.MS_CLIENT_SECRET,
+    tenant_id=teams_config.MS_TENANT_ID,
+    organizer=teams_config.TEAMS_ORGANIZER,
+    enabled=teams_config.TEAMS_ENABLED,
+    login_url=teams_config.MS_LOGIN_URL,
+    graph_url=teams_config.MS_GRAPH_URL,
+    timeout=teams_config.TEAMS_HTTP_TIMEOUT,
+    pool_size=teams_config.TEAMS_HTTP_POOL_SIZE,
+    max_retries=teams_config.TEAMS_HTTP_MAX_RETRIES,
+    backoff=teams_config.TEAMS_HTTP_RETRY_BACKOFF,
+    backoff_max=teams_config.TEAMS_HTTP_RETRY_BACKOFF_MAX,
+    mock_latency=teams_config.TEAMS_MOCK_LATENCY
+)
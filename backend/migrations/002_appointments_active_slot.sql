@@ -0,0 +1,8 @@
+-- One active booking per date/time, enforced by the database.
+-- The unique key also serves as the (appointment_date, appointment_time) index.
+-- Existing double bookings must be resolved first. Find them with:
+--   SELECT appointment_date, appointment_time, COUNT(*) FROM appointments
+--   WHERE status != 'cancelled' GROUP BY appointment_date, appointment_time HAVING COUNT(*) > 1
+ALTER TABLE appointments
+    ADD COLUMN active_slot TINYINT GENERATED ALWAYS AS (IF(status = 'cancelled', NULL, 1)) STORED,
+    ADD UNIQUE KEY uniq_appointments_active_slot (appointment_date, appointment_time, active_slot);
@@ -0,0 +1,9 @@
+-- Teams meeting details and background provisioning state for appointments
+ALTER TABLE appointments
+    ADD COLUMN meeting_status ENUM('none', 'meeting_pending', 'meeting_ready', 'meeting_failed') NOT NULL DEFAULT 'none',
+    ADD COLUMN teams_meeting_id VARCHAR(255),
+    ADD COLUMN teams_join_url TEXT,
+    ADD COLUMN teams_join_web_url TEXT,
+    ADD COLUMN meeting_attempts INT NOT NULL DEFAULT 0,
+    ADD COLUMN meeting_available_at DATETIME NULL,
+    ADD INDEX idx_appointments_meeting_queue (meeting_status, meeting_available_at);
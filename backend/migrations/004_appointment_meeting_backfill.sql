@@ -0,0 +1,12 @@
+-- Index Teams meetings by user and meeting id
+ALTER TABLE appointments
+    ADD INDEX idx_appointments_user_meetings (user_id, meeting_status, appointment_date, appointment_time),
+    ADD INDEX idx_appointments_teams_meeting (teams_meeting_id);
+
+-- One-off backfill: recover join URLs that older bookings appended to notes
+-- as "Microsoft Teams Meeting: <url>". Meeting ids cannot be recovered from the URL.
+UPDATE appointments
+SET teams_join_url = TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(notes, 'Microsoft Teams Meeting:', -1), '\n', 1)),
+    meeting_status = 'meeting_ready'
+WHERE teams_join_url IS NULL
+  AND notes LIKE '%Microsoft Teams Meeting:%';
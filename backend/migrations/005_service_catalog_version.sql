@@ -0,0 +1,22 @@
+-- Cache version counters: app processes reload cached data when a counter moves
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+INSERT IGNORE INTO cache_versions (name, version) VALUES ('service_catalog', 0);
+
+-- Any edit to the service catalog bumps its version
+CREATE TRIGGER service_categories_catalog_insert AFTER INSERT ON service_categories FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'service_catalog';
+CREATE TRIGGER service_categories_catalog_update AFTER UPDATE ON service_categories FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'service_catalog';
+CREATE TRIGGER service_categories_catalog_delete AFTER DELETE ON service_categories FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'service_catalog';
+CREATE TRIGGER services_catalog_insert AFTER INSERT ON services FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'service_catalog';
+CREATE TRIGGER services_catalog_update AFTER UPDATE ON services FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'service_catalog';
+CREATE TRIGGER services_catalog_delete AFTER DELETE ON services FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'service_catalog';
@@ -0,0 +1,12 @@
+INSERT IGNORE INTO cache_versions (name, version) VALUES ('knowledge_base', 0);
+
+-- Incremental index syncs read articles by updated_at
+ALTER TABLE knowledge_articles ADD INDEX idx_knowledge_articles_updated (updated_at);
+
+-- Any edit to a knowledge base article bumps its version, and search indexes resync from updated_at
+CREATE TRIGGER knowledge_articles_index_insert AFTER INSERT ON knowledge_articles FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'knowledge_base';
+CREATE TRIGGER knowledge_articles_index_update AFTER UPDATE ON knowledge_articles FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'knowledge_base';
+CREATE TRIGGER knowledge_articles_index_delete AFTER DELETE ON knowledge_articles FOR EACH ROW
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'knowledge_base';
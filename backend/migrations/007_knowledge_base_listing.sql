@@ -0,0 +1,4 @@
+-- Listing preview, kept in-row so listings never read the full content
+ALTER TABLE knowledge_articles
+    ADD COLUMN summary VARCHAR(280) GENERATED ALWAYS AS (LEFT(content, 280)) STORED,
+    ADD INDEX idx_knowledge_articles_listing (is_published, created_at, id);
@@ -0,0 +1,26 @@
+-- Resumable upload sessions for large tax documents
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id VARCHAR(36) PRIMARY KEY,
+    tax_form_id VARCHAR(36) NOT NULL,
+    user_id INT,
+    file_name VARCHAR(255) NOT NULL,
+    file_type VARCHAR(255),
+    field_name VARCHAR(100) NOT NULL,
+    file_size BIGINT NOT NULL,
+    chunk_size INT NOT NULL,
+    sha256 CHAR(64),
+    status ENUM('uploading', 'finalizing', 'completed', 'failed') NOT NULL DEFAULT 'uploading',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    expires_at DATETIME NOT NULL,
+    INDEX idx_upload_sessions_expiry (expires_at, status),
+    FOREIGN KEY (tax_form_id) REFERENCES tax_forms(id) ON DELETE CASCADE
+);
+
+-- Chunks received per upload session
+CREATE TABLE IF NOT EXISTS upload_session_chunks (
+    upload_id VARCHAR(36) NOT NULL,
+    chunk_index INT NOT NULL,
+    received_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (upload_id, chunk_index),
+    FOREIGN KEY (upload_id) REFERENCES upload_sessions(id) ON DELETE CASCADE
+);
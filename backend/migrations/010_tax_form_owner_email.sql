@@ -0,0 +1,12 @@
+-- Anonymous tax form owners, extracted from the JSON so progress saves can match
+-- them exactly instead of with LIKE patterns over form_data.
+-- Adding a STORED column rebuilds the table, which computes owner_email for every
+-- existing row: this statement is also the backfill. It blocks writes to tax_forms
+-- while it runs, so apply it off-peak on large tables.
+ALTER TABLE tax_forms
+    ADD COLUMN owner_email VARCHAR(255) GENERATED ALWAYS AS (
+        IF(JSON_TYPE(JSON_EXTRACT(form_data, '$.email')) = 'STRING',
+           NULLIF(LEFT(LOWER(TRIM(JSON_UNQUOTE(JSON_EXTRACT(form_data, '$.email')))), 255), ''),
+           NULL)
+    ) STORED AFTER notes,
+    ADD INDEX idx_tax_forms_owner_email (owner_email, status);
@@ -0,0 +1,15 @@
+-- Autosave patches: form_data holds the form as of snapshot_version, and
+-- tax_form_patches the RFC 6902 / 7386 patches saved since, one per version.
+-- Appended without AFTER so MySQL 8 can add the column instantly.
+ALTER TABLE tax_forms
+    ADD COLUMN snapshot_version INT UNSIGNED NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS tax_form_patches (
+    tax_form_id VARCHAR(36) NOT NULL,
+    version INT UNSIGNED NOT NULL,
+    patch_format ENUM('json-patch', 'merge-patch') NOT NULL,
+    patch JSON NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (tax_form_id, version),
+    FOREIGN KEY (tax_form_id) REFERENCES tax_forms(id) ON DELETE CASCADE
+);
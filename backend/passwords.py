@@ -0,0 +1,152 @@
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from config import password_config
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full; callers should retry later"""
+
+    def __init__(self, retry_after):
+        super().__init__("Password hashing is temporarily overloaded")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small dedicated thread pool
+
+    The pool bounds how many hashes run at once (bcrypt releases the GIL, so
+    up to workers of them run in parallel). It does not free request threads:
+    the caller still blocks until its hash is done. A semaphore bounds the
+    number of submitted-but-unfinished jobs; once it is exhausted new work is
+    rejected immediately with PasswordHasherBusy (a 503 with Retry-After)
+    instead of queueing behind a login storm.
+    """
+
+    def __init__(self, rounds, workers, max_pending, retry_after):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            logger.warning("Password hashing queue full, rejecting request")
+            raise PasswordHasherBusy(self.retry_after)
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._finish(None)
+            raise
+        future.add_done_callback(self._finish)
+        return future.result()
+
+    def _finish(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def hash(self, password):
+        """
+        Hash a password at the configured cost
+
+        Parameters:
+        - password: Plain text password
+
+        Returns:
+        - bcrypt hash as a string
+        """
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def check(self, password, hashed):
+        """
+        Check a password against a stored bcrypt hash
+
+        Parameters:
+        - password: Plain text password
+        - hashed: Stored bcrypt hash
+
+        Returns:
+        - True if the password matches, False otherwise
+        """
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        """True when the stored hash was made with a different cost factor"""
+        # Hashes look like $2b$12$<salt+digest>
+        parts = hashed.split('$')
+        if len(parts) < 4 or not parts[2].isdigit():
+            return True
+        return int(parts[2]) != self.rounds
+
+    def rehash_if_needed(self, password, hashed):
+        """
+        Produce a new hash when the stored one uses an outdated cost
+
+        Parameters:
+        - password: Plain text password that has already been verified
+        - hashed: Stored bcrypt hash
+
+        Returns:
+        - New hash string, or None if the stored hash is current
+        """
+        if not self.needs_rehash(hashed):
+            return None
+        new_hash = self.hash(password)
+        with self._lock:
+            self.rehashed += 1
+        return new_hash
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "in_flight": self._in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed
+            }
+
+
+password_hasher = PasswordHasher(
+    rounds=password_config.BCRYPT_ROUNDS,
+    workers=password_config.PASSWORD_HASH_WORKERS,
+    max_pending=password_config.PASSWORD_HASH_MAX_PENDING,
+    retry_after=password_config.PASSWORD_HASH_RETRY_AFTER
+)
+
+
+def hash_password(password):
+    return password_hasher.hash(password)
+
+
+def check_password(password, hashed):
+    return password_hasher.check(password, hashed)
+
+
+def needs_rehash(hashed):
+    return password_hasher.needs_rehash(hashed)
+
+
+def rehash_if_needed(password, hashed):
+    return password_hasher.rehash_if_needed(password, hashed)
@@ -0,0 +1,275 @@
+import copy
+import json
+import logging
+from config import tax_form_config
+from utils import owner_email_key
+
+logger = logging.getLogger(__name__)
+
+JSON_PATCH = 'json-patch'
+MERGE_PATCH = 'merge-patch'
+
+
+class PatchError(Exception):
+    """Raised when a progress patch can't be applied"""
+
+    def __init__(self, message, status_code=422):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class VersionConflict(PatchError):
+    """Raised when a save was based on an older version of the form"""
+
+    def __init__(self, version):
+        super().__init__("Form was changed by another save", 409)
+        self.version = version
+
+
+# RFC 6902 JSON Patch
+
+def _parse_pointer(pointer):
+    """RFC 6901 JSON pointer to a list of reference tokens"""
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith('/')):
+        raise PatchError(f"Invalid JSON pointer: {pointer!r}")
+    if not pointer:
+        return []
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def _array_index(container, token, allow_end=False):
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == '0'):
+        raise PatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"Array index out of range: {token}")
+    return index
+
+
+def _resolve(document, tokens):
+    for token in tokens:
+        if isinstance(document, dict):
+            if token not in document:
+                raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+            document = document[token]
+        elif isinstance(document, list):
+            document = document[_array_index(document, token)]
+        else:
+            raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+    return document
+
+
+def _add(document, tokens, value):
+    if not tokens:
+        return value
+    parent = _resolve(document, tokens[:-1])
+    if isinstance(parent, dict):
+        parent[tokens[-1]] = value
+    elif isinstance(parent, list):
+        parent.insert(_array_index(parent, tokens[-1], allow_end=True), value)
+    else:
+        raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+    return document
+
+
+def _remove(document, tokens):
+    if not tokens:
+        raise PatchError("Cannot remove the whole form")
+    parent = _resolve(document, tokens[:-1])
+    if isinstance(parent, dict):
+        if tokens[-1] not in parent:
+            raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+        return parent.pop(tokens[-1])
+    if isinstance(parent, list):
+        return parent.pop(_array_index(parent, tokens[-1]))
+    raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+
+
+def _json_equal(a, b):
+    """Equality by JSON type, so 1 != true and 1 == 1.0"""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return isinstance(a, bool) and isinstance(b, bool) and a == b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_json_equal(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_json_equal(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def apply_json_patch(document, operations):
+    """
+    Apply an RFC 6902 JSON Patch
+
+    Operations run in order on a copy of document, so a patch that fails
+    part-way leaves document untouched.
+
+    Returns:
+    - The patched document
+    """
+    if not isinstance(operations, list):
+        raise PatchError("A JSON Patch must be a list of operations")
+    document = copy.deepcopy(document)
+    for operation in operations:
+        if not isinstance(operation, dict) or 'op' not in operation or 'path' not in operation:
+            raise PatchError("Each operation needs 'op' and 'path'")
+        op = operation['op']
+        path = _parse_pointer(operation['path'])
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise PatchError(f"'{op}' needs a 'value'")
+        if op == 'add':
+            document = _add(document, path, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(document, path)
+        elif op == 'replace':
+            if path:
+                _remove(document, path)
+            document = _add(document, path, copy.deepcopy(operation['value']))
+        elif op in ('move', 'copy'):
+            source = _parse_pointer(operation.get('from'))
+            if op == 'move':
+                if path[:len(source)] == source and len(path) > len(source):
+                    raise PatchError("Cannot move a value into itself")
+                value = _remove(document, source) if source else document
+            else:
+                value = copy.deepcopy(_resolve(document, source))
+            document = _add(document, path, value)
+        elif op == 'test':
+            if not _json_equal(_resolve(document, path), operation['value']):
+                raise PatchError(f"Test failed at {operation['path']}", 409)
+        else:
+            raise PatchError(f"Unknown patch operation: {op!r}")
+    return document
+
+
+# RFC 7386 JSON Merge Patch
+
+def apply_merge_patch(target, patch):
+    """Apply an RFC 7386 merge patch; null values delete keys. Returns a new document"""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
+
+
+def apply_patch(document, patch_format, patch):
+    if patch_format == JSON_PATCH:
+        return apply_json_patch(document, patch)
+    return apply_merge_patch(document, patch)
+
+
+class ProgressLog:
+    """
+    Saved tax form progress as a snapshot plus a log of patches
+
+    tax_forms.form_data holds the form as of snapshot_version; autosaves
+    that send a patch append it to tax_form_patches as the next version
+    instead of rewriting the whole JSON document. Every snapshot_interval
+    versions, or once pending patches reach max_pending_bytes, the patched
+    form is written back as a new snapshot and the log is cleared.
+
+    Callers hold the tax_forms row lock (SELECT ... FOR UPDATE) while
+    reading and saving, which serializes saves to one form; the version
+    check then rejects saves based on a version that's no longer current.
+    """
+
+    def __init__(self, snapshot_interval, max_pending_bytes):
+        self.snapshot_interval = snapshot_interval
+        self.max_pending_bytes = max_pending_bytes
+        self.patches = 0
+        self.snapshots = 0
+        self.conflicts = 0
+
+    def read(self, cursor, form):
+        """
+        Current state of a form
+
+        Parameters:
+        - form: tax_forms row with id, form_data, snapshot_version and updated_at
+
+        Returns:
+        - Dict with document, version, updated_at and pending_bytes (size of unsnapshotted patches)
+        """
+        document = json.loads(form['form_data'])
+        cursor.execute(
+            """
+            SELECT version, patch_format, patch, created_at FROM tax_form_patches
+            WHERE tax_form_id = %s AND version > %s
+            ORDER BY version
+            """,
+            (form['id'], form['snapshot_version'])
+        )
+        version, updated_at, pending_bytes = form['snapshot_version'], form['updated_at'], 0
+        for row in cursor.fetchall():
+            document = apply_patch(document, row['patch_format'], json.loads(row['patch']))
+            version, pending_bytes = row['version'], pending_bytes + len(row['patch'])
+            updated_at = max(updated_at, row['created_at']) if updated_at else row['created_at']
+        return {'document': document, 'version': version, 'updated_at': updated_at, 'pending_bytes': pending_bytes}
+
+    def save(self, cursor, form, base_version=None, patch_format=None, patch=None, document=None):
+        """
+        Save a patch (or a whole document) as the form's next version
+
+        Parameters:
+        - form: Locked tax_forms row with id, form_data, snapshot_version, owner_email and updated_at
+        - base_version: Version the client edited; None skips the check (full saves from older clients)
+        - patch_format, patch: JSON_PATCH or MERGE_PATCH and the patch, or
+        - document: The whole form, written as a snapshot
+
+        Returns:
+        - The new version
+        """
+        current = self.read(cursor, form)
+        if base_version is not None and base_version != current['version']:
+            self.conflicts += 1
+            raise VersionConflict(current['version'])
+
+        version = current['version'] + 1
+        if document is None:
+            document = apply_patch(current['document'], patch_format, patch)
+            if not isinstance(document, dict):
+                raise PatchError("Form data must be a JSON object")
+            patch_json = json.dumps(patch)
+            snapshot = (
+                version - form['snapshot_version'] >= self.snapshot_interval
+                or current['pending_bytes'] + len(patch_json) >= self.max_pending_bytes
+                # owner_email is generated from the snapshot, so email changes are written through
+                or owner_email_key(document.get('email')) != form['owner_email']
+            )
+        else:
+            snapshot = True
+
+        if not snapshot:
+            cursor.execute(
+                "INSERT INTO tax_form_patches (tax_form_id, version, patch_format, patch) VALUES (%s, %s, %s, %s)",
+                (form['id'], version, patch_format, patch_json)
+            )
+            self.patches += 1
+            return version
+
+        cursor.execute(
+            "UPDATE tax_forms SET form_data = %s, snapshot_version = %s, updated_at = NOW() WHERE id = %s",
+            (json.dumps(document), version, form['id'])
+        )
+        cursor.execute("DELETE FROM tax_form_patches WHERE tax_form_id = %s", (form['id'],))
+        self.snapshots += 1
+        return version
+
+    def stats(self):
+        return {"patches": self.patches, "snapshots": self.snapshots, "conflicts": self.conflicts}
+
+
+progress_log = ProgressLog(
+    snapshot_interval=tax_form_config.PROGRESS_SNAPSHOT_INTERVAL,
+    max_pending_bytes=tax_form_config.PROGRESS_MAX_PENDING_BYTES
+)
@@ -0,0 +1,376 @@
+import hashlib
+import json
+import os
+import uuid
+import logging
+from werkzeug.utils import secure_filename
+from config import upload_config
+from db import db_session
+from background import BackgroundWorker
+from uploads import UploadError
+from blob_store import blob_store
+
+logger = logging.getLogger(__name__)
+
+
+def merge_ranges(chunks, chunk_size, file_size):
+    """Collapse received chunk indexes into [start, end) byte ranges"""
+    ranges = []
+    for index in sorted(chunks):
+        start = index * chunk_size
+        end = min(start + chunk_size, file_size)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+class ResumableUploads:
+    """
+    Resumable, chunked uploads of large tax documents
+
+    A client opens a session for one file, PUTs fixed-size chunks at
+    chunk-aligned offsets in any order (retrying any that fail), can ask
+    which byte ranges have arrived, and finally completes the session. Each
+    chunk is its own short request, so a dropped connection costs one chunk
+    and no worker is tied up for the whole transfer.
+
+    Chunks are written in place into a pre-sized part file under
+    UPLOAD_FOLDER/incoming, so processes sharing that folder can take
+    chunks for the same session. Received chunks are recorded in
+    upload_session_chunks. Completing hashes the file, stores it in the
+    blob store and records it in tax_form_files.
+    """
+
+    def __init__(self, root, chunk_size, max_size, ttl, copy_buffer=1024 * 1024):
+        self.root = root
+        self.incoming = os.path.join(root, 'incoming')
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.ttl = ttl
+        self.copy_buffer = copy_buffer
+
+    def part_path(self, upload_id):
+        return os.path.join(self.incoming, f"{upload_id}.part")
+
+    def chunk_count(self, file_size):
+        return max(1, -(-file_size // self.chunk_size))
+
+    def _load(self, cursor, upload_id, for_update=False):
+        cursor.execute(
+            "SELECT * FROM upload_sessions WHERE id = %s AND expires_at > NOW()" + (" FOR UPDATE" if for_update else ""),
+            (upload_id,)
+        )
+        session = cursor.fetchone()
+        if not session:
+            raise UploadError("Upload session not found or expired", 404)
+        return session
+
+    @staticmethod
+    def _check_owner(session, user_id):
+        if session['user_id'] and session['user_id'] != user_id:
+            raise UploadError("Unauthorized access to upload", 403)
+
+    @staticmethod
+    def _owner_has_blob(cursor, user_id, digest):
+        # Only skip the upload for content this user has uploaded before;
+        # knowing a digest must not be enough to attach someone else's document
+        cursor.execute(
+            """
+            SELECT 1 FROM tax_form_files f
+            JOIN tax_forms t ON t.id = f.tax_form_id
+            WHERE t.user_id = %s AND JSON_CONTAINS(f.files, JSON_OBJECT('sha256', %s))
+            LIMIT 1
+            """,
+            (user_id, digest)
+        )
+        return cursor.fetchone() is not None
+
+    def create(self, tax_form_id, user_id, file_name, file_size, file_type=None, field_name=None, sha256=None):
+        """
+        Open an upload session for one file of a tax form
+
+        When sha256 is given and the same user already stored that content,
+        the file is attached right away and no bytes need to be sent.
+
+        Returns:
+        - Session description with upload_id, chunk_size and expires_at, or
+          status 'completed' and the attached file when the upload was skipped
+        """
+        if not isinstance(file_size, int) or file_size <= 0:
+            raise UploadError("file_size must be a positive integer")
+        if file_size > self.max_size:
+            raise UploadError(f"File exceeds the {self.max_size} byte upload limit", 413)
+        file_name = secure_filename(file_name or '')
+        if not file_name:
+            raise UploadError("A file name is required")
+
+        with db_session() as cursor:
+            cursor.execute("SELECT user_id FROM tax_forms WHERE id = %s", (tax_form_id,))
+            form = cursor.fetchone()
+            if not form:
+                raise UploadError("Form not found", 404)
+            self._check_owner(form, user_id)
+
+            if sha256 and form['user_id'] and self._owner_has_blob(cursor, form['user_id'], sha256.lower()):
+                file_path = blob_store.reference_existing(cursor, sha256.lower(), file_size)
+                if file_path:
+                    file_data = {
+                        'file_name': file_name,
+                        'file_path': file_path,
+                        'file_type': file_type,
+                        'file_size': file_size,
+                        'field_name': field_name or 'file',
+                        'sha256': sha256.lower()
+                    }
+                    self._record_file(cursor, tax_form_id, file_data)
+                    logger.info(f"Attached already stored {sha256.lower()} to tax form {tax_form_id} without upload")
+                    return {'upload_id': None, 'status': 'completed', 'file': file_data}
+
+            upload_id = str(uuid.uuid4())
+            cursor.execute(
+                """
+                INSERT INTO upload_sessions
+                (id, tax_form_id, user_id, file_name, file_type, field_name, file_size, chunk_size,
+                 sha256, status, expires_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 'uploading', NOW() + INTERVAL %s SECOND)
+                """,
+                (upload_id, tax_form_id, form['user_id'], file_name, file_type, field_name or 'file',
+                 file_size, self.chunk_size, sha256, self.ttl)
+            )
+            cursor.execute("SELECT expires_at FROM upload_sessions WHERE id = %s", (upload_id,))
+            expires_at = cursor.fetchone()['expires_at']
+
+            # Sparse file of the final size; chunks are written at their offsets
+            os.makedirs(self.incoming, exist_ok=True)
+            with open(self.part_path(upload_id), 'wb') as part:
+                part.truncate(file_size)
+
+        return {
+            'upload_id': upload_id,
+            'status': 'uploading',
+            'chunk_size': self.chunk_size,
+            'chunk_count': self.chunk_count(file_size),
+            'file_size': file_size,
+            'expires_at': expires_at.isoformat()
+        }
+
+    def put_chunk(self, upload_id, user_id, offset, stream, length):
+        """
+        Store one chunk read from stream at a chunk-aligned offset
+
+        Re-sending a chunk overwrites it, so retries are safe.
+
+        Returns:
+        - Upload status after the chunk (see status())
+        """
+        with db_session() as cursor:
+            session = self._load(cursor, upload_id)
+        self._check_owner(session, user_id)
+        if session['status'] != 'uploading':
+            raise UploadError(f"Upload is {session['status']}", 409)
+
+        chunk_size, file_size = session['chunk_size'], session['file_size']
+        if offset is None or offset < 0 or offset >= file_size or offset % chunk_size:
+            raise UploadError(f"Offset must be a multiple of {chunk_size} below {file_size}")
+        expected = min(chunk_size, file_size - offset)
+        if length != expected:
+            raise UploadError(f"Chunk at offset {offset} must be {expected} bytes")
+
+        received = 0
+        with open(self.part_path(upload_id), 'r+b') as part:
+            part.seek(offset)
+            while received < expected:
+                data = stream.read(min(self.copy_buffer, expected - received))
+                if not data:
+                    break
+                part.write(data)
+                received += len(data)
+            if received != expected:
+                raise UploadError(f"Chunk at offset {offset} was cut short ({received} of {expected} bytes)")
+            part.flush()
+            os.fsync(part.fileno())
+
+        with db_session(dictionary=False) as cursor:
+            cursor.execute(
+                """
+                INSERT INTO upload_session_chunks (upload_id, chunk_index, received_at)
+                VALUES (%s, %s, NOW())
+                ON DUPLICATE KEY UPDATE received_at = NOW()
+                """,
+                (upload_id, offset // chunk_size)
+            )
+        return self.status(upload_id, user_id)
+
+    def status(self, upload_id, user_id):
+        """
+        Which byte ranges of the file have arrived
+
+        Returns:
+        - Dict with status, file_size, bytes_received and received ranges ([start, end) pairs)
+        """
+        with db_session() as cursor:
+            session = self._load(cursor, upload_id)
+            cursor.execute("SELECT chunk_index FROM upload_session_chunks WHERE upload_id = %s", (upload_id,))
+            chunks = [row['chunk_index'] for row in cursor.fetchall()]
+        self._check_owner(session, user_id)
+
+        ranges = merge_ranges(chunks, session['chunk_size'], session['file_size'])
+        return {
+            'upload_id': upload_id,
+            'status': session['status'],
+            'file_size': session['file_size'],
+            'chunk_size': session['chunk_size'],
+            'bytes_received': sum(end - start for start, end in ranges),
+            'received': ranges
+        }
+
+    @staticmethod
+    def _record_file(cursor, tax_form_id, file_data):
+        cursor.execute(
+            """
+            INSERT INTO tax_form_files (tax_form_id, files, form_type)
+            SELECT id, %s, form_type FROM tax_forms WHERE id = %s
+            """,
+            (json.dumps([file_data]), tax_form_id)
+        )
+
+    def _digest(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as part:
+            for block in iter(lambda: part.read(self.copy_buffer), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _set_status(self, upload_id, status):
+        with db_session(dictionary=False) as cursor:
+            cursor.execute("UPDATE upload_sessions SET status = %s WHERE id = %s", (status, upload_id))
+
+    def complete(self, upload_id, user_id):
+        """
+        Verify a fully received upload and attach it to its tax form
+
+        Returns:
+        - File record as stored in tax_form_files
+        """
+        # Claim the session so concurrent completes don't both move the file
+        with db_session() as cursor:
+            session = self._load(cursor, upload_id, for_update=True)
+            self._check_owner(session, user_id)
+            if session['status'] != 'uploading':
+                raise UploadError(f"Upload is {session['status']}", 409)
+            cursor.execute("SELECT COUNT(*) AS received FROM upload_session_chunks WHERE upload_id = %s", (upload_id,))
+            missing = self.chunk_count(session['file_size']) - cursor.fetchone()['received']
+            if missing:
+                raise UploadError(f"{missing} chunk(s) still missing", 409)
+            # Push the expiry out so the sweeper leaves the session alone while it's hashed
+            cursor.execute(
+                """
+                UPDATE upload_sessions
+                SET status = 'finalizing', expires_at = GREATEST(expires_at, NOW() + INTERVAL %s SECOND)
+                WHERE id = %s
+                """,
+                (self.ttl, upload_id)
+            )
+
+        part_path = self.part_path(upload_id)
+        try:
+            # Hashing happens outside any transaction; a large file takes a while
+            sha256 = self._digest(part_path)
+            if session['sha256'] and session['sha256'].lower() != sha256:
+                self._set_status(upload_id, 'failed')
+                self._remove_part(part_path)
+                raise UploadError("Uploaded file does not match the declared SHA-256", 422)
+
+            file_data = {
+                'file_name': session['file_name'],
+                'file_type': session['file_type'],
+                'file_size': session['file_size'],
+                'field_name': session['field_name'],
+                'sha256': sha256
+            }
+            with db_session() as cursor:
+                # Still ours? A session that was swept or reset meanwhile can't be attached
+                if self._load(cursor, upload_id, for_update=True)['status'] != 'finalizing':
+                    raise UploadError("Upload is no longer being completed", 409)
+                file_data['file_path'] = blob_store.attach(cursor, part_path, sha256, session['file_size'])
+                self._record_file(cursor, session['tax_form_id'], file_data)
+                cursor.execute("UPDATE upload_sessions SET status = 'completed' WHERE id = %s", (upload_id,))
+                cursor.execute("DELETE FROM upload_session_chunks WHERE upload_id = %s", (upload_id,))
+        except UploadError:
+            raise
+        except Exception:
+            # The part file is still there; leave the session completable so the client can retry
+            self._set_status(upload_id, 'uploading')
+            raise
+
+        # The blob is committed; a part file that's already gone doesn't change that
+        self._remove_part(part_path)
+        logger.info(f"Upload {upload_id} attached to tax form {session['tax_form_id']} as {file_data['file_name']}")
+        return file_data
+
+    @staticmethod
+    def _remove_part(part_path):
+        try:
+            os.remove(part_path)
+        except FileNotFoundError:
+            pass
+
+    def sweep_expired(self, limit=100):
+        """Delete expired, unfinished sessions and their part files; returns how many were removed"""
+        with db_session() as cursor:
+            cursor.execute(
+                """
+                SELECT id FROM upload_sessions
+                WHERE expires_at <= NOW() AND status != 'completed'
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                (limit,)
+            )
+            expired = [row['id'] for row in cursor.fetchall()]
+            if expired:
+                placeholders = ', '.join(['%s'] * len(expired))
+                cursor.execute(f"DELETE FROM upload_session_chunks WHERE upload_id IN ({placeholders})", expired)
+                cursor.execute(f"DELETE FROM upload_sessions WHERE id IN ({placeholders})", expired)
+        for upload_id in expired:
+            try:
+                os.remove(self.part_path(upload_id))
+            except OSError:
+                pass
+        return len(expired)
+
+
+class UploadSweeper(BackgroundWorker):
+    """Periodically removes abandoned resumable uploads and unreferenced blobs"""
+
+    name = 'upload-sweeper'
+
+    def __init__(self, uploads, poll_interval):
+        super().__init__(poll_interval)
+        self.uploads = uploads
+        self.removed = 0
+
+    def run_once(self):
+        removed = self.uploads.sweep_expired()
+        self.removed += removed
+        if removed:
+            logger.info(f"Removed {removed} expired upload session(s)")
+        collected = blob_store.collect()
+        if collected:
+            logger.info(f"Removed {collected} unreferenced blob(s)")
+        return removed > 0 or collected > 0
+
+    def stats(self):
+        return {"running": self.running, "removed": self.removed, "blobs": blob_store.stats()}
+
+
+resumable_uploads = ResumableUploads(
+    root=upload_config.UPLOAD_FOLDER,
+    chunk_size=upload_config.RESUMABLE_CHUNK_SIZE,
+    max_size=upload_config.MAX_RESUMABLE_UPLOAD_SIZE,
+    ttl=upload_config.RESUMABLE_UPLOAD_TTL
+)
+
+upload_sweeper = UploadSweeper(resumable_uploads, poll_interval=upload_config.RESUMABLE_SWEEP_INTERVAL)
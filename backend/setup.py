@@ -1,5 +1,6 @@
 import mysql.connector
 import os
+import sys
 import bcrypt
 from dotenv import load_dotenv
 
@@ -40,6 +41,10 @@ def setup_database():
             
             conn.commit()
         
+        # database.sql already contains every migration, so record them as applied
+        record_migrations(cursor, pending_migrations(cursor))
+        conn.commit()
+        
         print("Database schema and sample data created successfully.")
         
     except mysql.connector.Error as err:
@@ -50,6 +55,63 @@ def setup_database():
         if 'conn' in locals():
             conn.close()
 
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+def pending_migrations(cursor):
+    """Return migration file names that have not been applied yet, in order"""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name VARCHAR(255) PRIMARY KEY,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    cursor.execute("SELECT name FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+    return [name for name in sorted(os.listdir(MIGRATIONS_DIR))
+            if name.endswith('.sql') and name not in applied]
+
+def record_migrations(cursor, names):
+    for name in names:
+        cursor.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+
+def apply_migrations():
+    print("Applying migrations...")
+    
+    db_config = {
+        'host': os.environ.get('DB_HOST'),
+        'user': os.environ.get('DB_USER'),
+        'password': os.environ.get('DB_PASSWORD'),
+        'database': os.environ.get('DB_NAME')
+    }
+    
+    try:
+        conn = mysql.connector.connect(**db_config)
+        cursor = conn.cursor()
+        
+        for name in pending_migrations(cursor):
+            with open(os.path.join(MIGRATIONS_DIR, name), 'r') as file:
+                statements = file.read().split(';')
+            
+            for statement in statements:
+                if statement.strip():
+                    cursor.execute(statement)
+            
+            record_migrations(cursor, [name])
+            conn.commit()
+            print(f"Applied {name}")
+        
+        print("Migrations complete.")
+        
+    except mysql.connector.Error as err:
+        print(f"Error: {err}")
+    finally:
+        if 'cursor' in locals():
+            cursor.close()
+        if 'conn' in locals():
+            conn.close()
+
 def create_admin_user():
     print("Creating admin user...")
     
@@ -92,6 +154,10 @@ def create_admin_user():
             conn.close()
 
 if __name__ == "__main__":
-    setup_database()
-    create_admin_user()
+    # `python setup.py migrate` upgrades an existing database
+    if len(sys.argv) > 1 and sys.argv[1] == 'migrate':
+        apply_migrations()
+    else:
+        setup_database()
+        create_admin_user()
     print("Setup complete!")
@@ -0,0 +1,168 @@
+import hashlib
+import os
+import shutil
+import uuid
+import logging
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+from config import upload_config
+
+logger = logging.getLogger(__name__)
+
+
+class UploadError(Exception):
+    """Raised when a multipart upload is malformed or exceeds a limit"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def fsync_directory(path):
+    """Persist renames in a directory (no-op where directories can't be opened)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def remove_upload_dir(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+class _FileSink:
+    """
+    Writes one file part to a hidden temp name, hashing and counting as it goes
+
+    The finished part is staged under its own unique name rather than the
+    client's filename, so two parts with the same filename in one body don't
+    overwrite each other. The filename is kept only as metadata.
+    """
+
+    def __init__(self, directory, field_name, filename, content_type):
+        self.field_name = field_name
+        self.file_name = secure_filename(filename)
+        self.file_type = content_type
+        stem = uuid.uuid4().hex
+        self.final_path = os.path.join(directory, stem)
+        self.temp_path = os.path.join(directory, f".{stem}.part")
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self._fh = open(self.temp_path, 'wb')
+
+    def write(self, data):
+        self._fh.write(data)
+        self.digest.update(data)
+        self.size += len(data)
+
+    def finish(self):
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._fh.close()
+        if not self.file_name or not self.size:
+            # Same rule as before: parts without a name or content are not recorded
+            os.remove(self.temp_path)
+            return None
+        os.replace(self.temp_path, self.final_path)
+        return {
+            'file_name': self.file_name,
+            'file_path': self.final_path,
+            'file_type': self.file_type,
+            'file_size': self.size,
+            'field_name': self.field_name,
+            'sha256': self.digest.hexdigest()
+        }
+
+    def abort(self):
+        if not self._fh.closed:
+            self._fh.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+def stream_multipart(request, directory, chunk_size=None, max_file_size=None, max_form_memory=None):
+    """
+    Parse a multipart/form-data request straight off the socket
+
+    File parts are written to directory in chunk_size pieces as they
+    arrive, with size and SHA-256 computed on the way, then fsynced and
+    renamed to a unique staged name. Only ordinary form fields are held in
+    memory.
+
+    Parameters:
+    - request: Flask request whose stream has not been read yet
+    - directory: Where file parts are stored (created if missing)
+
+    Returns:
+    - (form fields dict, list of stored file dicts); on error nothing is left on disk
+    """
+    chunk_size = chunk_size or upload_config.UPLOAD_CHUNK_SIZE
+    max_file_size = max_file_size or upload_config.MAX_UPLOAD_FILE_SIZE
+    max_form_memory = max_form_memory or upload_config.MAX_FORM_MEMORY_SIZE
+
+    mimetype, options = parse_options_header(request.headers.get('Content-Type', ''))
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        raise UploadError("Expected a multipart/form-data body")
+
+    os.makedirs(directory, exist_ok=True)
+    decoder = MultipartDecoder(boundary.encode('ascii'), max_form_memory_size=max_form_memory)
+    form, files = {}, []
+    field, sink, buffer = None, None, []
+    stream = request.stream
+
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    sink = _FileSink(directory, event.name, event.filename, event.headers.get('Content-Type'))
+                elif isinstance(event, Field):
+                    field, buffer = event, []
+                elif isinstance(event, Data):
+                    if sink is not None:
+                        sink.write(event.data)
+                        if sink.size > max_file_size:
+                            raise UploadError(f"File {sink.file_name} exceeds the upload size limit", 413)
+                        if not event.more_data:
+                            stored = sink.finish()
+                            sink = None
+                            if stored:
+                                files.append(stored)
+                    else:
+                        buffer.append(event.data)
+                        if not event.more_data:
+                            form[field.name] = b''.join(buffer).decode('utf-8', 'replace')
+                            field, buffer = None, []
+                event = decoder.next_event()
+            if isinstance(event, Epilogue):
+                break
+            if not chunk:
+                raise UploadError("Upload ended before the multipart body was complete")
+        fsync_directory(directory)
+        return form, files
+    except Exception as e:
+        if sink is not None:
+            sink.abort()
+        for stored in files:
+            try:
+                os.remove(stored['file_path'])
+            except OSError:
+                pass
+        if isinstance(e, (UploadError, OSError)):
+            raise
+        # Oversized fields and truncated bodies surface as werkzeug errors
+        if getattr(e, 'code', None) == 413:
+            raise UploadError("Upload exceeds the size limit", 413)
+        raise UploadError(f"Malformed upload: {str(e)}")
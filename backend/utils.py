@@ -1,13 +1,16 @@
 
 import jwt
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import uuid
+from flask import current_app, request
 from config import email_config, jwt_config
+from email_outbox import enqueue_email
 import json
 import logging
 import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 
 # Configure logging
 logging.basicConfig(
@@ -22,28 +25,28 @@ logger = logging.getLogger(__name__)
 
 # Email utility function
 def send_email(to_email, subject, body):
+    """
+    Queue an email for delivery by the outbox worker
+
+    The message is written to email_outbox and sent in the background, so
+    SMTP latency never lands on the request.
+
+    Parameters:
+    - to_email: Recipient address
+    - subject: Subject line
+    - body: Plain text body
+    """
     try:
         if email_config.EMAIL_ENABLED:
-            msg = MIMEMultipart()
-            msg['From'] = email_config.EMAIL_FROM
-            msg['To'] = to_email
-            msg['Subject'] = subject
-
-            msg.attach(MIMEText(body, 'plain'))
-
-            server = smtplib.SMTP(email_config.SMTP_SERVER, email_config.SMTP_PORT)
-            server.starttls()
-            server.login(email_config.SMTP_USERNAME, email_config.SMTP_PASSWORD)
-            server.send_message(msg)
-            server.quit()
-            logger.info(f"Email sent to {to_email} with subject: {subject}")
+            outbox_id = enqueue_email(to_email, subject, body)
+            logger.info(f"Email to {to_email} queued as outbox #{outbox_id} with subject: {subject}")
         else:
             # Log email in development mode
             logger.info(f"DEVELOPMENT MODE: Email to {to_email}")
             logger.info(f"Subject: {subject}")
             logger.info(f"Body: {body}")
     except Exception as e:
-        logger.error(f"Failed to send email: {str(e)}")
+        logger.error(f"Failed to queue email: {str(e)}")
 
 # JWT token generation with all parameters
 def generate_token(user_id, email=None, role=None , expiry_hours=24):
@@ -128,16 +131,103 @@ def generate_refresh_token(user_id, email=None):
     """
     return generate_token(user_id, email=email, expiry_hours=jwt_config.JWT_REFRESH_TOKEN_EXPIRES // 3600)
 
-# JWT token validation with improved error handling and logging
-def validate_token(token):
+class TokenCache:
     """
-    Validate a JWT token and return the user_id if valid
+    Bounded LRU cache of verified JWT claims
+
+    Entries are keyed by a SHA-256 of the raw token and live until the
+    earlier of the token's exp claim and the cache TTL, so a cached token
+    is never accepted after it expires.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (claims, expires_at)
+        self._by_user = {}  # user_id -> set of keys
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def _remove(self, key):
+        claims, _ = self._entries.pop(key)
+        keys = self._by_user.get(claims.get('user_id'))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[claims.get('user_id')]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            claims, expires_at = entry
+            if time.time() >= expires_at:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    def put(self, key, claims):
+        if self.max_size <= 0:
+            return
+        expires_at = min(float(claims['exp']), time.time() + self.ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (claims, expires_at)
+            self._by_user.setdefault(claims.get('user_id'), set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+token_cache = TokenCache(jwt_config.JWT_CACHE_SIZE, jwt_config.JWT_CACHE_TTL)
+
+def invalidate_user_tokens(user_id):
+    """
+    Drop cached claims for a user so their tokens are re-verified
+
+    Parameters:
+    - user_id: The user's ID
+    """
+    token_cache.invalidate_user(user_id)
+
+def get_verified_claims(token):
+    """
+    Verify a JWT token and return its claims, using the in-process cache
     
     Parameters:
     - token: JWT token string (with or without 'Bearer ' prefix)
     
     Returns:
-    - user_id if token is valid, None otherwise
+    - Dictionary of claims if token is valid, None otherwise
     """
     if not token:
         logger.warning("No token provided")
@@ -147,6 +237,11 @@ def validate_token(token):
     if token.startswith('Bearer '):
         token = token.replace('Bearer ', '')
     
+    cache_key = TokenCache.key_for(token)
+    payload = token_cache.get(cache_key)
+    if payload is not None:
+        return payload
+    
     logger.info("Validating token")
     
     try:
@@ -155,14 +250,15 @@ def validate_token(token):
         
         # Check if token is about to expire (within 5 minutes)
         exp_time = payload['exp']
-        current_time = datetime.datetime.utcnow().timestamp()
+        current_time = time.time()
         
         if exp_time - current_time < 300:  # Less than 5 minutes until expiry
             logger.warning(f"Token is about to expire. Exp: {exp_time}, Current: {current_time}")
         else:
             logger.info(f"Token valid. Expires in {exp_time - current_time} seconds")
-            
-        return payload['user_id']
+        
+        token_cache.put(cache_key, payload)
+        return payload
     except jwt.ExpiredSignatureError:
         logger.warning("Token expired")
         return None
@@ -173,6 +269,22 @@ def validate_token(token):
         logger.error(f"Unexpected error validating token: {str(e)}")
         return None
 
+# JWT token validation with improved error handling and logging
+def validate_token(token):
+    """
+    Validate a JWT token and return the user_id if valid
+    
+    Parameters:
+    - token: JWT token string (with or without 'Bearer ' prefix)
+    
+    Returns:
+    - user_id if token is valid, None otherwise
+    """
+    payload = get_verified_claims(token)
+    if not payload:
+        return None
+    return payload.get('user_id')
+
 def get_user_id_from_token(token):
     """
     Extract user_id from a JWT token
@@ -250,6 +362,21 @@ def load_json_data(file_path):
         logger.error(f"Failed to load JSON data from {file_path}: {str(e)}")
         return {}
 
+# Serialize a payload exactly as jsonify would, with a strong ETag over the bytes
+def json_body(payload):
+    body = current_app.json.dumps(payload).encode('utf-8') + b'\n'
+    return body, hashlib.sha256(body).hexdigest()[:32]
+
+# JSON response that answers If-None-Match / If-Modified-Since with 304
+def conditional_response(body, etag, last_modified=None):
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Clients may keep the body but must revalidate, so edits show up on the next view
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 # Format currency
 def format_currency(amount):
     return f"${amount:.2f}"
@@ -277,6 +404,18 @@ def validate_email(email):
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email) is not None
 
+def owner_email_key(email):
+    """
+    Normalize an email the way tax_forms.owner_email is generated
+
+    owner_email is LEFT(LOWER(TRIM(form_data->>'$.email')), 255) when the
+    email is a JSON string, and NULL when it is missing, null, not a string
+    or empty.
+    """
+    if not isinstance(email, str):
+        return None
+    return email.strip(' ').lower()[:255] or None
+
 def validate_phone(phone):
     import re
     pattern = r'^\+?[0-9\s-]{8,15}$'
@@ -413,6 +413,16 @@ export const getAvailableSlots = async (date: string, serviceId?: number) => {
   return response.data
 }
 
+// Availability for every day from start to end (inclusive), e.g. a month view
+export const getAvailableSlotsRange = async (start: string, end: string, serviceId?: number) => {
+  let url = `/appointments/available/range?start=${start}&end=${end}`
+  if (serviceId) {
+    url += `&service_id=${serviceId}`
+  }
+  const response = await apiClient.get(url)
+  return response.data
+}
+
 // Microsoft Teams API calls
 export const createTeamsMeeting = async (meetingData: {
   subject: string
@@ -489,6 +499,18 @@ export const taxSolutionsService = {
     return response.data
   },
 
+  // Autosave only the changes (RFC 6902 operations) made since baseVersion;
+  // a 409 response carries the current version to reload from
+  saveProgressPatch: async (formId: string, baseVersion: number, patch: any[], email?: string) => {
+    const response = await apiClient.post("/tax-solutions/save-progress", {
+      id: formId,
+      baseVersion,
+      patch,
+      ...(email ? { email } : {}),
+    })
+    return response.data
+  },
+
   loadProgress: async (formId: string) => {
     const response = await apiClient.get(`/tax-solutions/load-progress/${formId}`)
     return response.data
@@ -535,6 +557,7 @@ export const appointmentService = {
     const response = await apiClient.get(url)
     return response.data
   },
+  getAvailableSlotsRange,
 }
 
 // Payment API calls
@@ -596,11 +619,18 @@ export const updateNotificationPreferences = async (preferences: {
 }
 
 // Knowledge base API calls
+// Returns { articles } with every published article in full
 export const getKnowledgeBase = async () => {
   const response = await apiClient.get("/content/knowledge-base")
   return response.data
 }
 
+// Summaries without article bodies, one page at a time; pass next_cursor to continue
+export const getKnowledgeBaseSummaries = async (cursor?: string, limit?: number) => {
+  const response = await apiClient.get("/content/knowledge-base", { params: { view: "summary", cursor, limit } })
+  return response.data
+}
+
 export const getKnowledgeArticle = async (id: number) => {
   const response = await apiClient.get(`/content/knowledge-base/${id}`)
   return response.data